@@ -1,10 +1,38 @@
-from flask import Flask, jsonify, request, Response, stream_template
+from flask import Flask, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.exceptions import NotFound
+from datetime import datetime, timedelta, timezone
 import os
+import io
 import json
+import base64
+import functools
+import hashlib
+import sqlite3
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
+import click
+
+import search_tokenizer
+import storage
+import migrations
+import vector_index
+import context_budget
+import json_provider
+import revisions
+import compression
+from retrieval import reciprocal_rank_fusion
 
 import time
 
@@ -13,6 +41,7 @@ load_dotenv()
 
 # 创建Flask应用
 app = Flask(__name__)
+app.json = json_provider.FastJSONProvider(app)  # 安装了 orjson 时用它序列化响应
 
 # 配置CORS，允许前端跨域访问
 # 生产环境需要配置实际的前端域名
@@ -32,13 +61,36 @@ CORS(app, origins=allowed_origins, supports_credentials=True)
 
 # 配置SQLite数据库
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "notes.db")}'
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(basedir, 'notes.db'))  # 部署时可指向持久化卷
+SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', storage.DEFAULT_PROFILE)  # default / wal，见 storage.py
+SQLITE_PRAGMAS = storage.sqlite_pragmas(SQLITE_PROFILE)
+# 超过该字节数的笔记正文压缩保存（0 表示不压缩），修改后运行 `flask compress-notes` 重新编码已有笔记
+NOTE_COMPRESS_THRESHOLD = int(os.getenv('NOTE_COMPRESS_THRESHOLD', compression.DEFAULT_THRESHOLD))
+
+# 连接池按每个worker进程的并发配置：gunicorn线程数 + 后台索引线程 + 余量
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', int(os.getenv('GUNICORN_THREADS', 4)) + 2))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+
+app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{SQLITE_PATH}'
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = storage.engine_options(DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 
 # 初始化数据库
 db = SQLAlchemy(app)
 
+@event.listens_for(Engine, 'connect')
+def on_sqlite_connect(dbapi_connection, connection_record):
+    """为每个SQLite连接设置存储配置的PRAGMA，并注册自定义函数
+    
+    bigram全文索引的触发器依赖 cjk_bigrams，笔记全文索引的触发器和列表摘要依赖 note_text / note_prefix
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        storage.apply_sqlite_pragmas(dbapi_connection, SQLITE_PRAGMAS)
+        search_tokenizer.register_functions(dbapi_connection)
+        compression.register_functions(dbapi_connection)
+
 
 
 # 笔记数据模型
@@ -47,21 +99,23 @@ class Note(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False, default='无标题')
-    content = db.Column(db.Text, nullable=False, default='')
+    content = db.Column(compression.CompressedText(NOTE_COMPRESS_THRESHOLD), nullable=False, default='')  # 大正文压缩保存
     tags = db.Column(db.Text, default='[]')  # JSON字符串存储标签
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
-        """转换为字典格式"""
-        return {
+    def to_dict(self, include_content=True):
+        """转换为字典格式，include_content=False 时不访问（也不加载）正文"""
+        result = {
             'id': self.id,
             'title': self.title,
-            'content': self.content,
             'tags': self.tags,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_content:
+            result['content'] = self.content
+        return result
 
 # 待办事项数据模型
 class Todo(db.Model):
@@ -110,13 +164,14 @@ class Project(db.Model):
     # 关联任务
     tasks = db.relationship('Task', backref='project', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
-        """转换为字典格式"""
-        # 计算统计信息
-        total_tasks = len(self.tasks)
-        completed_tasks = len([task for task in self.tasks if task.status == 'done'])
-        in_progress_tasks = len([task for task in self.tasks if task.status == 'in_progress'])
-        todo_tasks = len([task for task in self.tasks if task.status == 'todo'])
+    def to_dict(self, stats=None):
+        """转换为字典格式
+        
+        stats 为预先批量聚合好的任务统计（见 project_task_stats），
+        未提供时单独执行一次聚合查询，不加载任务对象
+        """
+        if stats is None:
+            stats = project_task_stats([self.id])[self.id]
         
         return {
             'id': self.id,
@@ -128,12 +183,7 @@ class Project(db.Model):
             'end_date': self.end_date.isoformat() if self.end_date else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'stats': {
-                'total_tasks': total_tasks,
-                'completed_tasks': completed_tasks,
-                'in_progress_tasks': in_progress_tasks,
-                'todo_tasks': todo_tasks
-            }
+            'stats': stats
         }
 
 # 任务数据模型
@@ -168,6 +218,507 @@ class Task(db.Model):
             'project_id': self.project_id
         }
 
+# 任务状态 -> 项目统计字段
+TASK_STATUS_STATS_KEYS = {
+    'done': 'completed_tasks',
+    'in_progress': 'in_progress_tasks',
+    'todo': 'todo_tasks'
+}
+
+# 单条 IN 查询的最大参数个数（SQLite旧版本限制为999）
+MAX_IN_PARAMS = 900
+
+def project_task_stats(project_ids):
+    """批量统计项目的任务数，返回 {project_id: stats}
+    
+    每 MAX_IN_PARAMS 个项目只执行一次 GROUP BY project_id, status 聚合查询，
+    由 idx_tasks_project_status 索引覆盖，不加载任何任务对象
+    """
+    stats = {
+        project_id: {
+            'total_tasks': 0,
+            'completed_tasks': 0,
+            'in_progress_tasks': 0,
+            'todo_tasks': 0
+        }
+        for project_id in project_ids
+    }
+    
+    ids = list(stats)
+    for start in range(0, len(ids), MAX_IN_PARAMS):
+        rows = db.session.query(
+            Task.project_id, Task.status, db.func.count(Task.id)
+        ).filter(
+            Task.project_id.in_(ids[start:start + MAX_IN_PARAMS])
+        ).group_by(Task.project_id, Task.status).all()
+        
+        for project_id, status, count in rows:
+            project_stats = stats[project_id]
+            project_stats['total_tasks'] += count
+            if status in TASK_STATUS_STATS_KEYS:
+                project_stats[TASK_STATUS_STATS_KEYS[status]] += count
+    
+    return stats
+
+def add_project_stats(rows):
+    """给项目列表的每行加上任务统计，用一次聚合查询得到"""
+    stats = project_task_stats([row['id'] for row in rows])
+    for row in rows:
+        row['stats'] = stats[row['id']]
+
+# 列表接口的字段投影配置：fields= 参数可选的字段及其对应的列表达式
+# snippet 只截取正文前若干字符，侧边栏列表无需加载完整的 content 列；压缩保存的正文只解压开头部分
+SNIPPET_LENGTH = 200
+
+def note_text_expression():
+    """SQL中笔记正文的原文（压缩保存的行经 note_text() 解压）"""
+    return db.case(
+        (db.func.typeof(Note.content) == 'blob', db.func.note_text(Note.content, type_=db.Text)),
+        else_=db.type_coerce(Note.content, db.Text)
+    )
+
+NOTE_LIST_FIELDS = {
+    'id': Note.id,
+    'title': Note.title,
+    'content': Note.content,
+    'tags': Note.tags,
+    'snippet': db.case(
+        (db.func.typeof(Note.content) == 'blob', db.func.note_prefix(Note.content, SNIPPET_LENGTH)),
+        else_=db.func.substr(Note.content, 1, SNIPPET_LENGTH)
+    ),
+    'created_at': Note.created_at,
+    'updated_at': Note.updated_at
+}
+# 未指定 fields 时返回的字段（与 Note.to_dict() 相同）
+NOTE_DEFAULT_FIELDS = [field for field in NOTE_LIST_FIELDS if field != 'snippet']
+
+# 标签倒排索引（migrations.py 创建，触发器与 notes.tags 同步），按标签查询和计数不需要读取笔记
+tags_table = db.table(migrations.TAGS_TABLE, db.column('id'), db.column('name'))
+note_tags_table = db.table(migrations.NOTE_TAGS_TABLE, db.column('tag_id'), db.column('note_id'))
+
+def tagged_note_ids(names, match_all=True):
+    """带有指定标签的笔记id子查询：match_all 时需同时带有全部标签（AND），否则带有任一标签（OR）"""
+    names = list(dict.fromkeys(names))
+    query = db.select(note_tags_table.c.note_id).select_from(
+        note_tags_table.join(tags_table, tags_table.c.id == note_tags_table.c.tag_id)
+    ).where(tags_table.c.name.in_(names))
+    if match_all and len(names) > 1:
+        query = query.group_by(note_tags_table.c.note_id).having(db.func.count() == len(names))
+    return query
+
+def parse_tag_filter():
+    """解析 tag= 参数（可重复或逗号分隔）和 tag_match=all/any，返回 (标签列表, 是否需要全部匹配)"""
+    names = [name.strip() for raw in request.args.getlist('tag') for name in raw.split(',') if name.strip()]
+    tag_match = request.args.get('tag_match', 'all').strip().lower()
+    if tag_match not in ('all', 'any'):
+        raise ValueError('tag_match 必须是 all 或 any')
+    return names, tag_match == 'all'
+
+TODO_LIST_FIELDS = {
+    'id': Todo.id,
+    'title': Todo.title,
+    'description': Todo.description,
+    'completed': Todo.completed,
+    'priority': Todo.priority,
+    'due_date': Todo.due_date,
+    'created_at': Todo.created_at,
+    'updated_at': Todo.updated_at
+}
+
+PROJECT_LIST_FIELDS = {
+    'id': Project.id,
+    'title': Project.title,
+    'description': Project.description,
+    'status': Project.status,
+    'priority': Project.priority,
+    'start_date': Project.start_date,
+    'end_date': Project.end_date,
+    'created_at': Project.created_at,
+    'updated_at': Project.updated_at
+}
+
+TASK_LIST_FIELDS = {
+    'id': Task.id,
+    'title': Task.title,
+    'description': Task.description,
+    'status': Task.status,
+    'priority': Task.priority,
+    'assignee': Task.assignee,
+    'due_date': Task.due_date,
+    'created_at': Task.created_at,
+    'updated_at': Task.updated_at,
+    'project_id': Task.project_id
+}
+
+# 列表过滤参数：参数名 -> (列, 过滤方式)
+# in：逗号分隔的多个值；ids：逗号分隔的整数；bool：true/false；after/before：ISO时间范围 [after, before)
+TODO_FILTERS = {
+    'completed': (Todo.completed, 'bool'),
+    'priority': (Todo.priority, 'in'),
+    'due_after': (Todo.due_date, 'after'),
+    'due_before': (Todo.due_date, 'before'),
+    'created_after': (Todo.created_at, 'after'),
+    'created_before': (Todo.created_at, 'before')
+}
+
+TASK_FILTERS = {
+    'status': (Task.status, 'in'),
+    'priority': (Task.priority, 'in'),
+    'assignee': (Task.assignee, 'in'),
+    'due_after': (Task.due_date, 'after'),
+    'due_before': (Task.due_date, 'before'),
+    'created_after': (Task.created_at, 'after'),
+    'created_before': (Task.created_at, 'before')
+}
+
+# 全部任务列表（GET /api/tasks）另外可按项目过滤
+ALL_TASK_FILTERS = {
+    'project_id': (Task.project_id, 'ids'),
+    **TASK_FILTERS
+}
+
+# include=project 时随任务一起返回的项目摘要（通过 JOIN 在同一条查询中取得）
+TASK_PROJECT_FIELDS = {
+    'project_title': Project.title,
+    'project_status': Project.status,
+    'project_priority': Project.priority
+}
+
+# sort= 可选的排序列（order=asc/desc，默认降序）
+TODO_SORT_COLUMNS = {
+    'created_at': Todo.created_at,
+    'updated_at': Todo.updated_at,
+    'due_date': Todo.due_date
+}
+
+TASK_SORT_COLUMNS = {
+    'created_at': Task.created_at,
+    'updated_at': Task.updated_at,
+    'due_date': Task.due_date
+}
+
+# count_only=true 时返回的分面计数：分面名 -> 列
+TODO_FACETS = {
+    'completed': Todo.completed,
+    'priority': Todo.priority
+}
+
+TASK_FACETS = {
+    'status': Task.status,
+    'priority': Task.priority
+}
+
+# 分页配置
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(sort_value, row_id):
+    """将最后一行的 (排序值, id) 编码为不透明的分页游标"""
+    payload = json.dumps([sort_value.isoformat() if sort_value else None, row_id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """解析分页游标，返回 (排序值, id)"""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (datetime.fromisoformat(sort_value) if sort_value is not None else None), int(row_id)
+    except Exception:
+        raise ValueError('无效的分页游标')
+
+def parse_bool_param(name, value):
+    value = value.strip().lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'{name} 必须是 true 或 false')
+
+def parse_datetime_param(name, value):
+    """解析ISO格式的时间参数，带时区的转换为UTC（数据库中保存的是UTC时间）"""
+    try:
+        value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{name} 不是有效的ISO时间')
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def unindexed_column(column):
+    """在列前加一元 +（SQLite的惯用写法）：该列上的条件不使用索引，查询计划改为沿排序列的索引有序读取"""
+    return db.literal_column(f'+{column.table.name}.{column.name}')
+
+def in_filter(column, values):
+    """多值的 IN 条件
+    
+    多个值时 (过滤列, 排序列) 索引读出的各段不是整体有序的，SQLite 会取出全部匹配行再临时排序；
+    改为沿排序列的索引读取、逐行检查条件，读够一页即可停止
+    """
+    if len(values) > 1:
+        return unindexed_column(column).in_(values)
+    return column.in_(values)
+
+def apply_filters(query, filters):
+    """按请求参数添加过滤条件（filters 见 TODO_FILTERS），参数错误时抛出 ValueError"""
+    for name, (column, kind) in filters.items():
+        raw = request.args.get(name)
+        if raw is None or not raw.strip():
+            continue
+        if kind == 'bool':
+            query = query.filter(column.is_(parse_bool_param(name, raw)))
+        elif kind == 'in':
+            values = [value.strip() for value in raw.split(',') if value.strip()]
+            query = query.filter(in_filter(column, values))
+        elif kind == 'ids':
+            try:
+                values = [int(value) for value in raw.split(',') if value.strip()]
+            except ValueError:
+                raise ValueError(f'{name} 必须是逗号分隔的整数')
+            query = query.filter(in_filter(column, values))
+        elif kind == 'after':
+            query = query.filter(column >= parse_datetime_param(name, raw))
+        else:
+            query = query.filter(column < parse_datetime_param(name, raw))
+    return query
+
+def parse_sort(sort_columns, default):
+    """解析 sort / order 参数，返回 (排序列, 是否降序)"""
+    sort = request.args.get('sort', default).strip()
+    if sort not in sort_columns:
+        raise ValueError(f'不支持的排序字段: {sort}，可选: {", ".join(sort_columns)}')
+    order = request.args.get('order', 'desc').strip().lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError('order 必须是 asc 或 desc')
+    return sort_columns[sort], order == 'desc'
+
+def count_only_requested():
+    raw = request.args.get('count_only')
+    return raw is not None and parse_bool_param('count_only', raw)
+
+def facet_key(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return 'null' if value is None else str(value)
+
+def facet_counts(query, facets):
+    """过滤后的总数和各分面（如状态、优先级）的计数，只执行一次 GROUP BY 聚合查询"""
+    columns = list(facets.values())
+    rows = query.with_entities(*columns, db.func.count()).group_by(*columns).all()
+    
+    counts = {'total': 0}
+    counts.update({name: {} for name in facets})
+    for row in rows:
+        count = row[-1]
+        counts['total'] += count
+        for name, value in zip(facets, row):
+            key = facet_key(value)
+            counts[name][key] = counts[name].get(key, 0) + count
+    return counts
+
+def cursor_segments(query, sort_column, id_column, cursor, descending):
+    """游标之后的数据，返回依次读取的查询
+    
+    排序列可以为空（如 due_date）：NULL 排在降序的末尾、升序的开头，
+    行值比较不包括 NULL，因此 NULL 的一段单独查询，每段都能在索引上直接定位
+    """
+    if not cursor:
+        return [query]
+    sort_value, last_id = decode_cursor(cursor)
+    if descending:
+        if sort_value is None:
+            return [query.filter(sort_column.is_(None), id_column < last_id)]
+        # 行值比较，SQLite可以直接在 (排序列, rowid) 索引上定位，而不是从头扫描
+        return [
+            query.filter(db.tuple_(sort_column, id_column) < (sort_value, last_id)),
+            query.filter(sort_column.is_(None))
+        ]
+    if sort_value is None:
+        return [
+            query.filter(sort_column.is_(None), id_column > last_id),
+            query.filter(sort_column.isnot(None))
+        ]
+    return [query.filter(db.tuple_(sort_column, id_column) > (sort_value, last_id))]
+
+def parse_fields(field_columns):
+    """解析 fields= 参数，未指定时返回 None（返回完整对象）"""
+    raw = request.args.get('fields', '').strip()
+    if not raw:
+        return None
+    
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in field_columns]
+    if unknown:
+        raise ValueError(f'不支持的字段: {", ".join(unknown)}')
+    return fields
+
+def paginated_response(query, model, sort_column, field_columns, default_fields=None, extend_rows=None,
+                       descending=True):
+    """按 (sort_column, id) 排序返回列表（默认倒序），支持游标分页和字段投影
+    
+    - limit / cursor：键集分页，利用排序列上的索引定位，不使用 OFFSET
+    - fields：只查询指定的列；未指定时查询 default_fields（默认为全部字段，与 to_dict() 的内容相同）
+    列表只读，始终按列查询，不构造ORM对象；datetime 由JSON序列化（json_provider.py）转换为ISO格式。
+    extend_rows 用于在未指定 fields 时给每行补充字段（如项目的任务统计），参数为行字典列表。
+    未传 limit 和 cursor 时返回全部数据，兼容旧客户端。
+    参数错误时抛出 ValueError。
+    """
+    fields = parse_fields(field_columns)
+    if fields is None:
+        fields = list(default_fields or field_columns)
+    else:
+        extend_rows = None
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    paging = limit is not None or bool(cursor)
+    if paging:
+        limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    
+    # 额外带上排序列和id，用于生成下一页游标
+    query = query.with_entities(
+        *[field_columns[field].label(field) for field in fields],
+        sort_column.label('_sort_value'),
+        model.id.label('_row_id')
+    )
+    ordering = (sort_column.desc(), model.id.desc()) if descending else (sort_column.asc(), model.id.asc())
+    
+    rows = []
+    for segment in cursor_segments(query, sort_column, model.id, cursor, descending):
+        segment = segment.order_by(*ordering)
+        if paging:
+            rows.extend(segment.limit(limit + 1 - len(rows)).all())
+            if len(rows) > limit:
+                break
+        else:
+            rows.extend(segment.all())
+    
+    has_more = paging and len(rows) > limit
+    if has_more:
+        rows = rows[:limit]
+    
+    width = len(fields)
+    data = [dict(zip(fields, row[:width])) for row in rows]
+    last_key = (rows[-1][width], rows[-1][width + 1]) if rows else None
+    if extend_rows:
+        extend_rows(data)
+    
+    result = {
+        'success': True,
+        'data': data
+    }
+    if paging:
+        result['pagination'] = {
+            'limit': limit,
+            'has_more': has_more,
+            'next_cursor': encode_cursor(*last_key) if has_more else None
+        }
+    return jsonify(result)
+
+# 条件请求：读接口返回 ETag / Last-Modified，客户端带 If-None-Match / If-Modified-Since 时
+# 只查询数据版本（data_versions 表，由 migrations.py 中的触发器维护），未变化则直接返回304
+def data_versions(entities):
+    """返回 {实体类型: (版本号, 最后修改时间)}"""
+    if not entities:
+        return {}
+    rows = db.session.execute(
+        db.text(f"SELECT entity, version, updated_at FROM {migrations.DATA_VERSIONS_TABLE} WHERE entity IN :entities")
+        .bindparams(db.bindparam('entities', expanding=True)),
+        {'entities': list(entities)}
+    )
+    return {entity: (version, datetime.fromisoformat(updated_at)) for entity, version, updated_at in rows}
+
+def cache_validators(entities, model=None, item_id=None):
+    """计算当前请求的 (ETag, Last-Modified)
+    
+    列表：由 entities 的数据版本和查询参数决定；
+    单条数据（model 和 item_id）：由该行的 updated_at 和 entities（依赖的其他实体）决定，不存在时返回 (None, None)
+    """
+    versions = data_versions(entities)
+    parts = [f'{entity}.{versions[entity][0]}' for entity in entities if entity in versions]
+    modified = [updated_at for _, updated_at in versions.values()]
+    
+    if model is not None:
+        updated_at = db.session.scalar(db.select(model.updated_at).where(model.id == item_id))
+        if updated_at is None:
+            return None, None
+        parts.append(f'{model.__tablename__}/{item_id}.{updated_at.isoformat()}')
+        modified.append(updated_at)
+    
+    parts.append(request.query_string.decode('utf-8', 'replace'))
+    etag = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:20]
+    return etag, max(modified) if modified else None
+
+def set_cache_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    # 浏览器每次都带上验证器重新验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def safe_last_modified(last_modified):
+    """Last-Modified 只精确到秒：最后修改所在的这一秒还没过去时，同一秒内之后的写入按 If-Modified-Since 比较不出来，
+    此时不返回 Last-Modified（客户端用 ETag 验证）
+    """
+    if last_modified and datetime.utcnow() >= last_modified.replace(microsecond=0) + timedelta(seconds=1):
+        return last_modified
+    return None
+
+def is_not_modified(etag, last_modified):
+    """If-None-Match 优先；只有 If-Modified-Since 时按秒比较最后修改时间（last_modified 来自 safe_last_modified）"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+def conditional_get(*entities, model=None):
+    """读接口的条件请求装饰器
+    
+    entities：响应内容依赖的实体类型；model：单条数据接口的模型，或子列表所属对象的模型（id 取自路由参数），
+    该对象不存在时不返回304，由接口返回404
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            item_id = next(iter(kwargs.values()), None) if model is not None else None
+            etag, last_modified = cache_validators(entities, model, item_id)
+            if etag is None:
+                return view(*args, **kwargs)
+            last_modified = safe_last_modified(last_modified)
+            
+            if is_not_modified(etag, last_modified):
+                return set_cache_validators(Response(status=304), etag, last_modified)
+            
+            # 版本在查询数据之前读取：期间有写入时 ETag 偏旧，下次请求只会多返回一次完整响应
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                set_cache_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+# 聊天响应缓存数据模型
+class ChatCacheEntry(db.Model):
+    __tablename__ = 'chat_cache'
+    
+    cache_key = db.Column(db.String(64), primary_key=True)  # 请求内容的SHA-256
+    model = db.Column(db.String(100), nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    latency_ms = db.Column(db.Integer, default=0)  # 原始上游请求耗时，用于统计节省的延迟
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# 缓存条目引用的知识库对象，对象更新或删除时据此失效缓存
+class ChatCacheRef(db.Model):
+    __tablename__ = 'chat_cache_refs'
+    __table_args__ = (
+        db.Index('idx_chat_cache_refs_entity', 'entity', 'entity_id'),
+    )
+    
+    cache_key = db.Column(db.String(64), db.ForeignKey('chat_cache.cache_key', ondelete='CASCADE'), primary_key=True)
+    entity = db.Column(db.String(20), primary_key=True)  # notes, projects, tasks, todos
+    entity_id = db.Column(db.Integer, primary_key=True)
+
 # API路由
 
 @app.route('/', methods=['GET'])
@@ -185,23 +736,44 @@ def index():
             'projects': '/api/projects',
             'tasks': '/api/tasks',
             'search': '/api/search',
+            'semantic_search': '/api/semantic-search',
+            'index_status': '/api/index/status',
+            'export': '/api/export',
+            'import': '/api/import',
+            'tags': '/api/tags',
+            'sync': '/api/sync',
+            'events': '/api/events（ASGI模式，见 asgi.py）',
             'chat': '/api/chat',
+            'chat_stats': '/api/chat/stats',
             'models': '/api/models'
         },
         'documentation': {
             'notes': {
-                'GET /api/notes': '获取所有笔记',
+                'GET /api/notes': '获取笔记列表（?limit=&cursor=&fields=id,title,updated_at,snippet&tag=&tag_match=all|any）',
+                'GET /api/tags': '获取所有标签及笔记数（?sort=count|name）',
                 'POST /api/notes': '创建笔记',
-                'GET /api/notes/<id>': '获取单个笔记',
+                'GET /api/notes/<id>': '获取单个笔记（?at=<ISO时间> 读取该时间点的版本）',
+                'GET /api/notes/<id>/revisions': '获取笔记的修订历史（?limit=&before=）',
+                'GET /api/notes/<id>/revisions/<rev>': '获取笔记某个版本的完整内容',
                 'PUT /api/notes/<id>': '更新笔记',
-                'DELETE /api/notes/<id>': '删除笔记'
+                'DELETE /api/notes/<id>': '删除笔记',
+                'POST|PATCH|DELETE /api/notes/batch': '批量创建/更新/删除笔记（{"items": [...]} 或 {"ids": [...]}）'
+            },
+            'tasks': {
+                'GET /api/tasks': '获取所有项目的任务（?assignee=&status=&priority=&project_id=&due_after=&due_before='
+                                  '&sort=&order=&limit=&cursor=&include=project&count_only=true）',
+                'GET /api/projects/<id>/tasks': '获取项目的任务（参数同上）',
+                'POST /api/tasks': '创建任务',
+                'POST|PATCH|DELETE /api/tasks/batch': '批量创建/更新/删除任务'
             },
             'todos': {
-                'GET /api/todos': '获取所有待办事项',
+                'GET /api/todos': '获取待办事项列表（?limit=&cursor=&fields=&completed=&priority=high,low'
+                                  '&due_after=&due_before=&sort=due_date&order=asc&count_only=true）',
                 'POST /api/todos': '创建待办事项',
                 'GET /api/todos/<id>': '获取单个待办事项',
                 'PUT /api/todos/<id>': '更新待办事项',
-                'DELETE /api/todos/<id>': '删除待办事项'
+                'DELETE /api/todos/<id>': '删除待办事项',
+                'POST|PATCH|DELETE /api/todos/batch': '批量创建/更新/删除待办事项'
             },
             'ai': {
                 'POST /api/chat': 'AI聊天对话',
@@ -221,14 +793,63 @@ def health_check():
     })
 
 @app.route('/api/notes', methods=['GET'])
+@conditional_get('notes')
 def get_notes():
-    """获取所有笔记"""
+    """获取笔记列表（支持 limit/cursor 分页、fields 字段投影和 tag 标签过滤）
+    
+    ?tag=工作&tag=重要（或 tag=工作,重要）返回同时带有这些标签的笔记，tag_match=any 时返回带有任一标签的笔记
+    """
+    try:
+        query = Note.query
+        tag_names, match_all = parse_tag_filter()
+        if tag_names:
+            # 沿 updated_at 索引读取笔记、逐行检查是否在标签子查询中：读够一页即停止，
+            # 不会为常用标签取出全部带该标签的笔记（含正文）再临时排序
+            query = query.filter(unindexed_column(Note.id).in_(tagged_note_ids(tag_names, match_all)))
+        return paginated_response(query, Note, Note.updated_at, NOTE_LIST_FIELDS, NOTE_DEFAULT_FIELDS)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/tags', methods=['GET'])
+@conditional_get('notes')
+def get_tags():
+    """获取所有标签及其笔记数（一次聚合查询）
+    
+    默认按笔记数从多到少排列，?sort=name 时按名称排列；没有笔记使用的标签不返回
+    """
     try:
-        notes = Note.query.order_by(Note.updated_at.desc()).all()
+        sort = request.args.get('sort', 'count').strip()
+        if sort not in ('count', 'name'):
+            raise ValueError('sort 必须是 count 或 name')
+        
+        rows = db.session.execute(
+            db.select(tags_table.c.name, db.func.count().label('count')).select_from(
+                tags_table.join(note_tags_table, note_tags_table.c.tag_id == tags_table.c.id)
+            ).group_by(tags_table.c.name)
+        ).all()
+        # 按名称分组，结果已按名称排列
+        tags = [{'name': row.name, 'count': row.count} for row in rows]
+        if sort == 'count':
+            tags.sort(key=lambda tag: -tag['count'])
+        
         return jsonify({
             'success': True,
-            'data': [note.to_dict() for note in notes]
+            'data': tags,
+            'total': len(tags)
         })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -263,14 +884,31 @@ def create_note():
         }), 500
 
 @app.route('/api/notes/<int:note_id>', methods=['GET'])
+@conditional_get(model=Note)
 def get_note(note_id):
-    """获取单个笔记"""
+    """获取单个笔记；?at=<ISO时间> 时返回该时间点的版本（来自修订历史，笔记已删除时也可读取）"""
     try:
+        if request.args.get('at'):
+            revision = revision_at(note_id, parse_datetime_param('at', request.args['at']))
+            if revision is None:
+                return jsonify({
+                    'success': False,
+                    'error': '该时间点没有保存的版本'
+                }), 404
+            return revision_response(revision)
+        
         note = Note.query.get_or_404(note_id)
         return jsonify({
             'success': True,
             'data': note.to_dict()
         })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except NotFound:
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
@@ -329,14 +967,27 @@ def delete_note(note_id):
 # 待办事项API路由
 
 @app.route('/api/todos', methods=['GET'])
+@conditional_get('todos')
 def get_todos():
-    """获取所有待办事项"""
+    """获取待办事项列表
+    
+    支持 limit/cursor 分页、fields 字段投影、过滤（见 TODO_FILTERS）和 sort/order 排序；
+    count_only=true 时只返回过滤后的总数和按完成状态、优先级的计数
+    """
     try:
-        todos = Todo.query.order_by(Todo.created_at.desc()).all()
+        query = apply_filters(Todo.query, TODO_FILTERS)
+        if count_only_requested():
+            return jsonify({
+                'success': True,
+                'data': facet_counts(query, TODO_FACETS)
+            })
+        sort_column, descending = parse_sort(TODO_SORT_COLUMNS, 'created_at')
+        return paginated_response(query, Todo, sort_column, TODO_LIST_FIELDS, descending=descending)
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'data': [todo.to_dict() for todo in todos]
-        })
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -380,6 +1031,7 @@ def create_todo():
         }), 500
 
 @app.route('/api/todos/<int:todo_id>', methods=['GET'])
+@conditional_get(model=Todo)
 def get_todo(todo_id):
     """获取单个待办事项"""
     try:
@@ -388,6 +1040,8 @@ def get_todo(todo_id):
             'success': True,
             'data': todo.to_dict()
         })
+    except NotFound:
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
@@ -456,14 +1110,19 @@ def delete_todo(todo_id):
 # 项目管理API路由
 
 @app.route('/api/projects', methods=['GET'])
+@conditional_get('projects', 'tasks')
 def get_projects():
-    """获取所有项目"""
+    """获取项目列表（支持 limit/cursor 分页和 fields 字段投影）"""
     try:
-        projects = Project.query.order_by(Project.updated_at.desc()).all()
+        return paginated_response(
+            Project.query, Project, Project.updated_at, PROJECT_LIST_FIELDS,
+            extend_rows=add_project_stats
+        )
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'data': [project.to_dict() for project in projects]
-        })
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -515,6 +1174,7 @@ def create_project():
         }), 500
 
 @app.route('/api/projects/<int:project_id>', methods=['GET'])
+@conditional_get('tasks', model=Project)
 def get_project(project_id):
     """获取单个项目"""
     try:
@@ -523,6 +1183,8 @@ def get_project(project_id):
             'success': True,
             'data': project.to_dict()
         })
+    except NotFound:
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
@@ -597,15 +1259,79 @@ def delete_project(project_id):
         }), 500
 
 @app.route('/api/projects/<int:project_id>/tasks', methods=['GET'])
+@conditional_get('tasks', model=Project)
 def get_project_tasks(project_id):
-    """获取项目的所有任务"""
+    """获取项目的任务列表
+    
+    支持 limit/cursor 分页、fields 字段投影、过滤（见 TASK_FILTERS）和 sort/order 排序；
+    count_only=true 时只返回过滤后的总数和按状态、优先级的计数
+    """
     try:
         project = Project.query.get_or_404(project_id)
-        tasks = Task.query.filter_by(project_id=project_id).order_by(Task.created_at.desc()).all()
+        query = apply_filters(Task.query.filter_by(project_id=project_id), TASK_FILTERS)
+        if count_only_requested():
+            return jsonify({
+                'success': True,
+                'data': facet_counts(query, TASK_FACETS)
+            })
+        sort_column, descending = parse_sort(TASK_SORT_COLUMNS, 'created_at')
+        return paginated_response(query, Task, sort_column, TASK_LIST_FIELDS, descending=descending)
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'data': [task.to_dict() for task in tasks]
-        })
+            'success': False,
+            'error': str(e)
+        }), 400
+    except NotFound:
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def embed_project_summary(rows):
+    """把 include=project 查询到的项目列移到每行的 project 对象中"""
+    for row in rows:
+        row['project'] = {'id': row['project_id']}
+        for field in TASK_PROJECT_FIELDS:
+            row['project'][field[len('project_'):]] = row.pop(field)
+
+@app.route('/api/tasks', methods=['GET'])
+@conditional_get('tasks', 'projects')
+def get_tasks():
+    """获取所有项目的任务列表
+    
+    支持 limit/cursor 分页、fields 字段投影、过滤（见 ALL_TASK_FILTERS，如 ?assignee=张三&status=todo,in_progress）
+    和 sort/order 排序；count_only=true 时只返回计数。
+    include=project 时每个任务带上所属项目的摘要，与任务在同一条 JOIN 查询中取得
+    （指定 fields 时可选 project_title 等列，不再嵌套）
+    """
+    try:
+        query = apply_filters(Task.query, ALL_TASK_FILTERS)
+        if count_only_requested():
+            return jsonify({
+                'success': True,
+                'data': facet_counts(query, TASK_FACETS)
+            })
+        
+        sort_column, descending = parse_sort(TASK_SORT_COLUMNS, 'created_at')
+        include = {value.strip() for value in request.args.get('include', '').split(',') if value.strip()}
+        if include - {'project'}:
+            raise ValueError(f'不支持的 include: {", ".join(sorted(include - {"project"}))}')
+        if not include:
+            return paginated_response(query, Task, sort_column, TASK_LIST_FIELDS, descending=descending)
+        
+        return paginated_response(
+            query.join(Project, Task.project_id == Project.id), Task, sort_column,
+            {**TASK_LIST_FIELDS, **TASK_PROJECT_FIELDS},
+            extend_rows=embed_project_summary,
+            descending=descending
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -667,6 +1393,7 @@ def create_task():
         }), 500
 
 @app.route('/api/tasks/<int:task_id>', methods=['GET'])
+@conditional_get(model=Task)
 def get_task(task_id):
     """获取单个任务"""
     try:
@@ -675,6 +1402,8 @@ def get_task(task_id):
             'success': True,
             'data': task.to_dict()
         })
+    except NotFound:
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
@@ -742,245 +1471,1670 @@ def delete_task(task_id):
             'error': str(e)
         }), 500
 
-@app.route('/api/search', methods=['POST'])
-def search_notes():
-    """搜索笔记 - 基础全文搜索"""
+# 批量接口：一次请求、一个事务处理多条数据
+# 插入使用带 RETURNING 的 executemany，更新按主键批量执行，删除使用 IN 条件
+BATCH_MAX_ITEMS = 1000
+
+# 字段校验：只接受对应的JSON类型，不做隐式转换（例如 bool("false") 为 True），类型不符时抛出 ValueError
+def text_value(value):
+    if not isinstance(value, str):
+        raise ValueError('必须是字符串')
+    return value
+
+def bool_value(value):
+    if not isinstance(value, bool):
+        raise ValueError('必须是布尔值 true/false')
+    return value
+
+def id_value(value):
+    """整数id，null 表示未指定（由调用方检查）"""
+    if value is not None and (isinstance(value, bool) or not isinstance(value, int)):
+        raise ValueError('必须是整数')
+    return value
+
+def parse_due_date(value):
+    """解析ISO格式的日期，null 或空字符串表示没有截止日期"""
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str):
+        raise ValueError('必须是ISO格式的日期字符串')
     try:
-        data = request.get_json()
-        query = data.get('query', '').strip()
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'无效的日期: {value}') from None
+
+def tags_json(tags):
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise ValueError('必须是字符串数组')
+    return json.dumps(tags, ensure_ascii=False)
+
+# 实体类型 -> 可写字段: (创建时的默认值, 校验/转换函数)；create_only 中的字段只能在创建时设置
+BATCH_CONFIG = {
+    'notes': {
+        'model': Note,
+        'fields': {
+            'title': ('无标题', text_value),
+            'content': ('', text_value),
+            'tags': ([], tags_json)
+        },
+        'create_only': ()
+    },
+    'todos': {
+        'model': Todo,
+        'fields': {
+            'title': ('', text_value),
+            'description': ('', text_value),
+            'completed': (False, bool_value),
+            'priority': ('medium', text_value),
+            'due_date': (None, parse_due_date)
+        },
+        'create_only': ()
+    },
+    'tasks': {
+        'model': Task,
+        'fields': {
+            'title': ('', text_value),
+            'description': ('', text_value),
+            'status': ('todo', text_value),
+            'priority': ('medium', text_value),
+            'assignee': ('', text_value),
+            'due_date': (None, parse_due_date),
+            'project_id': (None, id_value)
+        },
+        'create_only': ('project_id',)
+    }
+}
+
+def batch_values(entity, item, partial=False):
+    """从请求的一项中取出要写入的列值；partial=True 时只取出现的字段（更新）
+    
+    字段类型不符时抛出 ValueError，该项以400失败
+    """
+    config = BATCH_CONFIG[entity]
+    values = {}
+    for field, (default, convert) in config['fields'].items():
+        if field in item:
+            value = item[field]
+        elif partial:
+            continue
+        else:
+            value = default
+        if partial and field in config['create_only']:
+            continue
+        try:
+            values[field] = convert(value)
+        except ValueError as e:
+            raise ValueError(f'{field} {e}') from None
+    return values
+
+def batch_result(index, item_id, status, error=None):
+    result = {'index': index, 'id': item_id, 'success': status < 400, 'status': status}
+    if error:
+        result['error'] = error
+    return result
+
+def existing_ids(model, ids, *columns):
+    """返回 ids 中存在的行：{id: 行}，可附带查询其他列"""
+    rows = {}
+    ids = list(ids)
+    for start in range(0, len(ids), MAX_IN_PARAMS):
+        chunk = ids[start:start + MAX_IN_PARAMS]
+        for row in db.session.execute(db.select(model.id, *columns).where(model.id.in_(chunk))):
+            rows[row.id] = row
+    return rows
+
+def batch_create(entity, items):
+    """批量插入，返回 (每项结果, 写入的行数)"""
+    model = BATCH_CONFIG[entity]['model']
+    results = [None] * len(items)
+    rows = []
+    positions = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = batch_result(index, None, 400, '无效的数据项')
+            continue
+        try:
+            rows.append(batch_values(entity, item))
+        except ValueError as e:
+            results[index] = batch_result(index, None, 400, str(e))
+            continue
+        positions.append(index)
+    
+    if entity == 'tasks':
+        # 任务必须属于已存在的项目
+        projects = existing_ids(Project, {row['project_id'] for row in rows if row['project_id'] is not None})
+        valid = []
+        for index, row in zip(positions, rows):
+            if not row['project_id']:
+                results[index] = batch_result(index, None, 400, '项目ID不能为空')
+            elif row['project_id'] not in projects:
+                results[index] = batch_result(index, None, 404, '项目不存在')
+            else:
+                valid.append((index, row))
+        positions = [index for index, _ in valid]
+        rows = [row for _, row in valid]
+    
+    new_ids = []
+    if rows:
+        new_ids = db.session.scalars(
+            db.insert(model).returning(model.id, sort_by_parameter_order=True), rows
+        ).all()
+    for index, new_id in zip(positions, new_ids):
+        results[index] = batch_result(index, new_id, 201)
+    
+    if entity == 'notes' and new_ids:
+        enqueue_note_index({note_id: 'upsert' for note_id in new_ids})
+        record_note_revisions(new_ids)
+    return results, len(new_ids)
+
+def batch_update(entity, items):
+    """按主键批量更新，返回 (每项结果, 更新的行数)"""
+    model = BATCH_CONFIG[entity]['model']
+    results = [None] * len(items)
+    ids = {item.get('id') for item in items if isinstance(item, dict) and isinstance(item.get('id'), int)}
+    extra_columns = (Task.project_id,) if entity == 'tasks' else ()
+    found = existing_ids(model, ids, *extra_columns)
+    
+    now = datetime.utcnow()
+    rows = []
+    changed = set()
+    reindex = {}
+    revised = []
+    for index, item in enumerate(items):
+        item_id = item.get('id') if isinstance(item, dict) else None
+        if not isinstance(item_id, int):
+            results[index] = batch_result(index, None, 400, '缺少id')
+            continue
+        if item_id not in found:
+            results[index] = batch_result(index, item_id, 404, '数据不存在')
+            continue
+        try:
+            values = batch_values(entity, item, partial=True)
+        except ValueError as e:
+            results[index] = batch_result(index, item_id, 400, str(e))
+            continue
+        values.update(id=item_id, updated_at=now)
+        rows.append(values)
+        results[index] = batch_result(index, item_id, 200)
         
-        if not query:
+        changed.add((entity, item_id))
+        if entity == 'tasks':
+            changed.add(('projects', found[item_id].project_id))
+        if entity == 'notes' and ('title' in values or 'content' in values):
+            reindex[item_id] = 'upsert'
+        if entity == 'notes' and {'title', 'content', 'tags'} & set(values):
+            revised.append(item_id)
+    
+    if revised:
+        ensure_revision_baseline(revised)
+    if rows:
+        # ORM按主键的批量更新：字段相同的行合并为一次 executemany
+        db.session.execute(db.update(model), rows)
+        invalidate_chat_cache_refs(changed)
+    if reindex:
+        enqueue_note_index(reindex)
+    if revised:
+        record_note_revisions(revised)
+    return results, len(rows)
+
+def batch_delete(entity, ids):
+    """按id批量删除，返回 (每项结果, 删除的行数)"""
+    model = BATCH_CONFIG[entity]['model']
+    extra_columns = (Task.project_id,) if entity == 'tasks' else ()
+    found = existing_ids(model, {item_id for item_id in ids if isinstance(item_id, int)}, *extra_columns)
+    
+    results = []
+    for index, item_id in enumerate(ids):
+        if not isinstance(item_id, int):
+            results.append(batch_result(index, None, 400, '无效的id'))
+        elif item_id not in found:
+            results.append(batch_result(index, item_id, 404, '数据不存在'))
+        else:
+            results.append(batch_result(index, item_id, 200))
+    
+    deleted_ids = list(found)
+    for start in range(0, len(deleted_ids), MAX_IN_PARAMS):
+        chunk = deleted_ids[start:start + MAX_IN_PARAMS]
+        db.session.execute(
+            db.delete(model).where(model.id.in_(chunk)).execution_options(synchronize_session=False)
+        )
+    
+    if deleted_ids:
+        changed = {(entity, item_id) for item_id in deleted_ids}
+        if entity == 'tasks':
+            changed.update(('projects', row.project_id) for row in found.values())
+        invalidate_chat_cache_refs(changed)
+    if entity == 'notes' and deleted_ids:
+        enqueue_note_index({note_id: 'delete' for note_id in deleted_ids})
+    return results, len(deleted_ids)
+
+def batch_response(entity):
+    """批量接口的通用处理：POST 创建、PATCH 更新、DELETE 删除
+    
+    请求体为 {"items": [...]}（删除为 {"ids": [...]}），所有有效项在同一个事务中写入；
+    atomic=true 时任一项失败则全部不写入。返回每一项的结果（index 对应请求中的位置）
+    """
+    try:
+        data = request.get_json() or {}
+        key = 'ids' if request.method == 'DELETE' else 'items'
+        items = data.get(key)
+        
+        if not isinstance(items, list) or not items:
             return jsonify({
                 'success': False,
-                'error': '搜索关键词不能为空'
+                'error': f'{key} 必须是非空数组'
             }), 400
         
-        # 使用数据库LIKE搜索
-        notes = Note.query.filter(
-            db.or_(
-                Note.title.contains(query),
-                Note.content.contains(query)
-            )
-        ).order_by(Note.updated_at.desc()).all()
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'error': f'单次最多处理 {BATCH_MAX_ITEMS} 条数据'
+            }), 400
+        
+        if request.method == 'POST':
+            results, affected = batch_create(entity, items)
+        elif request.method == 'PATCH':
+            results, affected = batch_update(entity, items)
+        else:
+            results, affected = batch_delete(entity, items)
+        
+        failed = sum(1 for result in results if not result['success'])
+        if failed and data.get('atomic'):
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': f'{failed} 条数据无效，未写入任何数据',
+                'data': {'results': results, 'succeeded': 0, 'failed': failed}
+            }), 400
+        
+        db.session.commit()
         
         return jsonify({
             'success': True,
-            'data': [note.to_dict() for note in notes],
-            'total': len(notes),
-            'search_type': 'basic'
+            'data': {
+                'results': results,
+                'succeeded': affected,
+                'failed': failed
+            }
         })
         
     except Exception as e:
-        print(f"搜索错误: {e}")
+        db.session.rollback()
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
-@app.route('/api/knowledge-search', methods=['POST'])
-def knowledge_search():
-    """知识库综合搜索 - 搜索所有相关数据"""
+@app.route('/api/notes/batch', methods=['POST', 'PATCH', 'DELETE'])
+def batch_notes():
+    """批量创建、更新、删除笔记"""
+    return batch_response('notes')
+
+@app.route('/api/todos/batch', methods=['POST', 'PATCH', 'DELETE'])
+def batch_todos():
+    """批量创建、更新、删除待办事项"""
+    return batch_response('todos')
+
+@app.route('/api/tasks/batch', methods=['POST', 'PATCH', 'DELETE'])
+def batch_tasks():
+    """批量创建、更新、删除任务"""
+    return batch_response('tasks')
+
+# 数据导出/导入：NDJSON流，每行一条记录 {"type": 实体类型, "data": {列: 值}}
+# 导出按 yield_per 分批读取并逐批写出响应，导入逐行读取请求体并分批写入，内存占用与数据量无关
+EXPORT_FORMAT_VERSION = 1
+# 导入时项目需在任务之前
+EXPORT_MODELS = {
+    'projects': Project,
+    'tasks': Task,
+    'notes': Note,
+    'todos': Todo
+}
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 100))  # 每次从游标读取的行数（笔记正文可能很大）
+EXPORT_BUFFER_SIZE = 1024 * 1024  # 响应每段的大致字符数
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))  # 每个导入事务写入的行数
+# 导入时子表的外键列及其引用的实体：父对象写入之后才写入子表的行，中途出错不会留下孤立的行
+IMPORT_PARENTS = {'tasks': {'project_id': 'projects'}}
+IMPORT_MAX_ERRORS = 100  # 响应中最多列出的错误行
+IMPORT_READ_BUFFER = 1024 * 1024  # 读取请求体的缓冲区大小
+
+def begin_read_snapshot():
+    """在当前会话的连接上开启显式读事务，之后的查询读取同一个快照（WAL模式下不阻塞写入）
+    
+    pysqlite 不为 SELECT 开启事务，否则每条语句各自读取最新提交的数据；
+    由调用方在读取结束后 db.session.rollback() 结束事务
+    """
+    connection = db.session.connection()
+    if not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN')
+
+def export_lines():
+    """逐批生成导出的NDJSON文本
+    
+    所有表在同一个显式读事务中读取，是一致的快照（导出期间写入的数据不会只导出一部分），
+    每次从游标取 EXPORT_CHUNK_SIZE 行，约 EXPORT_BUFFER_SIZE 输出一段，只有当前一批在内存中
+    """
+    yield json_provider.dumps({
+        'type': 'meta',
+        'version': EXPORT_FORMAT_VERSION,
+        'exported_at': datetime.utcnow().isoformat()
+    }) + '\n'
+    
+    begin_read_snapshot()
     try:
-        data = request.get_json()
-        query = data.get('query', '').strip()
-        search_types = data.get('types', ['notes', 'projects', 'tasks', 'todos'])  # 默认搜索所有类型
-        limit = data.get('limit', 20)  # 每种类型的最大结果数
+        for entity, model in EXPORT_MODELS.items():
+            table = model.__table__
+            result = db.session.execute(
+                db.select(table).order_by(table.c.id).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+            )
+            buffer = []
+            buffered = 0
+            for row in result:
+                line = json_provider.dumps({'type': entity, 'data': dict(row._mapping)}) + '\n'
+                buffer.append(line)
+                buffered += len(line)
+                if buffered >= EXPORT_BUFFER_SIZE:
+                    yield ''.join(buffer)
+                    buffer = []
+                    buffered = 0
+            if buffer:
+                yield ''.join(buffer)
+    finally:
+        db.session.rollback()
+
+def import_row(table, data):
+    """把导出的一条记录转换为表的列值；缺少的列使用列的默认值"""
+    if not isinstance(data, dict):
+        raise ValueError('data 必须是对象')
+    if not isinstance(data.get('id'), int):
+        raise ValueError('缺少id')
+    
+    row = {}
+    for column in table.columns:
+        if column.name in data:
+            value = data[column.name]
+            if isinstance(column.type, db.DateTime) and value is not None:
+                value = datetime.fromisoformat(value)
+        elif column.default is not None and column.default.is_scalar:
+            value = column.default.arg
+        else:
+            value = None
+        if value is None and not column.nullable:
+            raise ValueError(f'缺少字段: {column.name}')
+        row[column.name] = value
+    return row
+
+def import_batch(entity, rows):
+    """在一个事务中写入一批记录：id已存在时更新（触发器同步更新全文索引），否则插入"""
+    table = EXPORT_MODELS[entity].__table__
+    ids = [row['id'] for row in rows]
+    if entity == 'notes':
+        ensure_revision_baseline(ids)
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={column.name: statement.excluded[column.name] for column in table.columns if column.name != 'id'}
+    )
+    db.session.execute(statement, rows)
+    
+    changed = {(entity, item_id) for item_id in ids}
+    if entity == 'tasks':
+        changed.update(('projects', row['project_id']) for row in rows)
+    invalidate_chat_cache_refs(changed)
+    if entity == 'notes':
+        # 绕过了ORM的flush钩子，需要显式加入索引队列和记录修订
+        enqueue_note_index({note_id: 'upsert' for note_id in ids})
+        record_note_revisions(ids)
+    db.session.commit()
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    """导出全部笔记、待办、项目和任务（NDJSON流式下载）"""
+    filename = f"ai-notebook-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.ndjson"
+    return Response(
+        stream_with_context(export_lines()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+def split_by_parents(entity, pending):
+    """把 [(行号, 行)] 分为引用的父对象都已存在的和还不存在的两部分"""
+    parents = IMPORT_PARENTS.get(entity)
+    if not parents:
+        return pending, []
+    found = {
+        column: existing_ids(EXPORT_MODELS[parent], {row[column] for _, row in pending})
+        for column, parent in parents.items()
+    }
+    ready, missing = [], []
+    for item in pending:
+        row = item[1]
+        (ready if all(row[column] in found[column] for column in parents) else missing).append(item)
+    return ready, missing
+
+@app.route('/api/import', methods=['POST'])
+def import_data():
+    """导入 /api/export 导出的NDJSON数据
+    
+    逐行读取请求体，每种实体每 IMPORT_BATCH_SIZE 行写入并提交一次，按id覆盖已有数据。
+    写入子表（任务）的一批之前先写入父表（项目）已读到的行；父对象还没有出现的行留到最后再写入，
+    仍不存在时作为无效行。中途出错时已提交的批次会保留且没有孤立的行，重新导入同一文件即可继续；
+    无效的行跳过并在响应中列出
+    """
+    try:
+        batches = {entity: [] for entity in EXPORT_MODELS}  # [(行号, 行)]
+        waiting = {entity: [] for entity in EXPORT_MODELS}  # 父对象尚未写入的行
+        imported = {entity: 0 for entity in EXPORT_MODELS}
+        errors = []
+        failed = 0
         
-        if not query:
-            return jsonify({
-                'success': False,
-                'error': '搜索关键词不能为空'
-            }), 400
+        def write(entity, pending):
+            for start in range(0, len(pending), IMPORT_BATCH_SIZE):
+                chunk = pending[start:start + IMPORT_BATCH_SIZE]
+                import_batch(entity, [row for _, row in chunk])
+                imported[entity] += len(chunk)
         
-        results = {}
-        total_count = 0
+        def flush(entity):
+            for parent in IMPORT_PARENTS.get(entity, {}).values():
+                flush(parent)
+            ready, missing = split_by_parents(entity, batches[entity])
+            batches[entity] = []
+            waiting[entity].extend(missing)
+            write(entity, ready)
         
-        # 搜索笔记
-        if 'notes' in search_types:
-            notes = Note.query.filter(
-                db.or_(
-                    Note.title.contains(query),
-                    Note.content.contains(query),
-                    Note.tags.contains(query)
-                )
-            ).order_by(Note.updated_at.desc()).limit(limit).all()
-            
-            results['notes'] = {
-                'data': [note.to_dict() for note in notes],
-                'count': len(notes),
-                'type': 'notes'
-            }
-            total_count += len(notes)
-        
-        # 搜索项目
-        if 'projects' in search_types:
-            projects = Project.query.filter(
-                db.or_(
-                    Project.title.contains(query),
-                    Project.description.contains(query)
-                )
-            ).order_by(Project.updated_at.desc()).limit(limit).all()
-            
-            results['projects'] = {
-                'data': [project.to_dict() for project in projects],
-                'count': len(projects),
-                'type': 'projects'
-            }
-            total_count += len(projects)
-        
-        # 搜索任务
-        if 'tasks' in search_types:
-            tasks = Task.query.filter(
-                db.or_(
-                    Task.title.contains(query),
-                    Task.description.contains(query),
-                    Task.assignee.contains(query)
-                )
-            ).order_by(Task.updated_at.desc()).limit(limit).all()
-            
-            results['tasks'] = {
-                'data': [task.to_dict() for task in tasks],
-                'count': len(tasks),
-                'type': 'tasks'
-            }
-            total_count += len(tasks)
-        
-        # 搜索待办事项
-        if 'todos' in search_types:
-            todos = Todo.query.filter(
-                db.or_(
-                    Todo.title.contains(query),
-                    Todo.description.contains(query)
-                )
-            ).order_by(Todo.updated_at.desc()).limit(limit).all()
+        # request.stream 是无缓冲的原始流，直接按行迭代会逐字节读取
+        body = io.BufferedReader(request.stream, IMPORT_READ_BUFFER)
+        for line_number, line in enumerate(body, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                entity = record.get('type')
+                if entity == 'meta':
+                    if record.get('version') != EXPORT_FORMAT_VERSION:
+                        db.session.rollback()
+                        return jsonify({
+                            'success': False,
+                            'error': f"不支持的导出格式版本: {record.get('version')}"
+                        }), 400
+                    continue
+                if entity not in EXPORT_MODELS:
+                    raise ValueError(f'未知的数据类型: {entity}')
+                batches[entity].append((line_number, import_row(EXPORT_MODELS[entity].__table__, record.get('data'))))
+            except (ValueError, TypeError, AttributeError) as e:
+                failed += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({'line': line_number, 'error': str(e)})
+                continue
             
-            results['todos'] = {
-                'data': [todo.to_dict() for todo in todos],
-                'count': len(todos),
-                'type': 'todos'
-            }
-            total_count += len(todos)
+            if len(batches[entity]) >= IMPORT_BATCH_SIZE:
+                flush(entity)
+        
+        for entity in EXPORT_MODELS:
+            flush(entity)
+        for entity, pending in waiting.items():
+            ready, missing = split_by_parents(entity, pending)
+            write(entity, ready)
+            failed += len(missing)
+            for line_number, _ in missing[:max(0, IMPORT_MAX_ERRORS - len(errors))]:
+                errors.append({'line': line_number, 'error': '引用的数据不存在'})
         
         return jsonify({
             'success': True,
-            'query': query,
-            'results': results,
-            'total_count': total_count,
-            'search_types': search_types,
-            'timestamp': datetime.utcnow().isoformat()
+            'data': {
+                'imported': imported,
+                'failed': failed,
+                'errors': errors
+            }
         })
         
     except Exception as e:
-        print(f"知识库搜索错误: {e}")
+        db.session.rollback()
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
-@app.route('/api/knowledge-context', methods=['POST'])
-def get_knowledge_context():
-    """获取知识库上下文 - 为AI提供相关背景信息"""
+# 增量同步：客户端记录上次同步到的 seq，之后只取变更日志中更新的部分
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 5000
+
+def sync_objects(entity, ids):
+    """批量加载变更对象的当前数据 {id: dict}"""
+    model = EXPORT_MODELS[entity]
+    objects = {}
+    for start in range(0, len(ids), MAX_IN_PARAMS):
+        rows = model.query.filter(model.id.in_(ids[start:start + MAX_IN_PARAMS])).all()
+        if entity == 'projects':
+            stats = project_task_stats([row.id for row in rows])
+            objects.update((row.id, row.to_dict(stats=stats[row.id])) for row in rows)
+        else:
+            objects.update((row.id, row.to_dict()) for row in rows)
+    return objects
+
+def read_changes(since, types, limit):
+    """读取 since 之后的变更，返回 (变更列表, 是否还有更多)（/api/sync 和 /api/events 共用）
+    
+    变更日志和对象数据在同一个显式读事务中读取，状态一致；
+    +entity 禁止使用 (entity, entity_id) 索引，按 seq 主键范围扫描，避免对结果排序
+    """
+    begin_read_snapshot()
     try:
-        data = request.get_json()
-        query = data.get('query', '').strip()
-        context_limit = data.get('limit', 10)  # 每种类型的上下文数量
-        
-        if not query:
-            return jsonify({
-                'success': False,
-                'error': '查询内容不能为空'
-            }), 400
+        rows = db.session.execute(
+            db.text(
+                f"SELECT seq, entity, entity_id, op, changed_at FROM {migrations.CHANGE_LOG_TABLE} "
+                f"WHERE seq > :since AND +entity IN :types ORDER BY seq LIMIT :limit"
+            ).bindparams(db.bindparam('types', expanding=True)),
+            {'since': since, 'types': list(types), 'limit': limit + 1}
+        ).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
-        context = {
-            'query': query,
-            'timestamp': datetime.utcnow().isoformat(),
-            'data': {}
+        objects = {}
+        for entity in types:
+            ids = [row.entity_id for row in rows if row.entity == entity and row.op == 'upsert']
+            if ids:
+                objects[entity] = sync_objects(entity, ids)
+    finally:
+        db.session.rollback()
+    
+    changes = []
+    for row in rows:
+        change = {
+            'seq': row.seq,
+            'entity': row.entity,
+            'id': row.entity_id,
+            'op': row.op,
+            'changed_at': datetime.fromisoformat(row.changed_at).isoformat()
         }
+        if row.op == 'upsert':
+            change['data'] = objects[row.entity].get(row.entity_id)
+        changes.append(change)
+    return changes, has_more
+
+def latest_change_seq():
+    return db.session.scalar(db.text(f"SELECT COALESCE(MAX(seq), 0) FROM {migrations.CHANGE_LOG_TABLE}"))
+
+def parse_entity_types(raw):
+    """解析 types= 参数（逗号分隔的实体类型，默认全部），有未知类型时抛出 ValueError"""
+    types = [t.strip() for t in (raw or ','.join(EXPORT_MODELS)).split(',') if t.strip()]
+    unknown = [t for t in types if t not in EXPORT_MODELS]
+    if unknown:
+        raise ValueError(f'不支持的数据类型: {", ".join(unknown)}')
+    return types
+
+@app.route('/api/sync', methods=['GET'])
+def sync_changes():
+    """返回 since 之后的变更（?since=&limit=&types=notes,todos,projects,tasks）
+    
+    每个对象只返回一次最新状态，删除的对象返回 op=delete 的墓碑；
+    has_more 为 true 时用 next_since 继续请求，since=0 取得全部数据
+    """
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = max(1, min(request.args.get('limit', SYNC_DEFAULT_LIMIT, type=int), SYNC_MAX_LIMIT))
+        types = parse_entity_types(request.args.get('types'))
         
-        # 获取相关笔记
-        relevant_notes = Note.query.filter(
-            db.or_(
-                Note.title.contains(query),
-                Note.content.contains(query),
-                Note.tags.contains(query)
-            )
-        ).order_by(Note.updated_at.desc()).limit(context_limit).all()
+        changes, has_more = read_changes(since, types, limit)
         
-        context['data']['notes'] = [
-            {
-                'id': note.id,
-                'title': note.title,
-                'content': note.content[:500] + '...' if len(note.content) > 500 else note.content,
-                'tags': note.tags,
-                'updated_at': note.updated_at.isoformat() if note.updated_at else None
+        return jsonify({
+            'success': True,
+            'data': {
+                'changes': changes,
+                'next_since': changes[-1]['seq'] if changes else since,
+                'has_more': has_more
             }
-            for note in relevant_notes
-        ]
+        })
         
-        # 获取相关项目
-        relevant_projects = Project.query.filter(
-            db.or_(
-                Project.title.contains(query),
-                Project.description.contains(query)
-            )
-        ).order_by(Project.updated_at.desc()).limit(context_limit).all()
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# 全文搜索配置：实体类型 -> FTS5表（由 create_indexes.py 创建）及各列的bm25权重
+# 标题命中的权重最高；FTS表不存在时回退到 LIKE 扫描 like_columns（笔记标签按完整标签名匹配，见 like_condition）
+SEARCH_CONFIG = {
+    'notes': {
+        'model': Note,
+        'fts_table': 'notes_fts',
+        'bm25_weights': (10.0, 1.0, 5.0),  # title, content, tags
+        'like_columns': [Note.title, note_text_expression()],
+        'snippet_attr': 'content'
+    },
+    'projects': {
+        'model': Project,
+        'fts_table': 'projects_fts',
+        'bm25_weights': (10.0, 1.0),  # title, description
+        'like_columns': [Project.title, Project.description],
+        'snippet_attr': 'description'
+    },
+    'tasks': {
+        'model': Task,
+        'fts_table': 'tasks_fts',
+        'bm25_weights': (10.0, 1.0, 2.0),  # title, description, assignee
+        'like_columns': [Task.title, Task.description, Task.assignee],
+        'snippet_attr': 'description'
+    },
+    'todos': {
+        'model': Todo,
+        'fts_table': 'todos_fts',
+        'bm25_weights': (10.0, 1.0),  # title, description
+        'like_columns': [Todo.title, Todo.description],
+        'snippet_attr': 'description'
+    }
+}
+
+def like_condition(entity, query):
+    """LIKE回退的匹配条件
+    
+    笔记的标签通过 note_tags 按完整标签名匹配，不对JSON字符串做子串匹配（否则"作"会匹配到"工作"标签）
+    """
+    conditions = [column.contains(query) for column in SEARCH_CONFIG[entity]['like_columns']]
+    if entity == 'notes':
+        conditions.append(Note.id.in_(tagged_note_ids([query.strip()])))
+    return db.or_(*conditions)
+
+DEFAULT_HIGHLIGHT_TAGS = ('<mark>', '</mark>')
+SNIPPET_TOKENS = 32
+
+def fts_tokenizer(table):
+    """返回FTS5表建索引时使用的分词模式，表不存在时返回 None"""
+    tables = {
+        row.name for row in db.session.execute(
+            db.text("SELECT name FROM sqlite_master WHERE type='table' AND name IN (:name, :settings)"),
+            {'name': table, 'settings': search_tokenizer.FTS_SETTINGS_TABLE}
+        )
+    }
+    if table not in tables:
+        return None
+    if search_tokenizer.FTS_SETTINGS_TABLE not in tables:
+        # 旧版本 create_indexes.py 建的表，没有记录分词模式
+        return search_tokenizer.LEGACY_TOKENIZER
+    
+    tokenizer = db.session.execute(
+        db.text(f"SELECT tokenizer FROM {search_tokenizer.FTS_SETTINGS_TABLE} WHERE table_name = :name"),
+        {'name': table}
+    ).scalar()
+    return tokenizer or search_tokenizer.LEGACY_TOKENIZER
+
+def fts_search(entity, query, limit, highlight_tags=DEFAULT_HIGHLIGHT_TAGS, excerpts=True):
+    """使用FTS5索引搜索，按bm25相关度排序
+    
+    返回命中列表 [{'id', 'score', 'title_highlight', 'snippet'}]；
+    bigram模式的索引不保存原文，title_highlight/snippet 为 None，由调用方根据原文生成。
+    excerpts=False 时不计算高亮和摘要（只需要排序的场景）。
+    FTS5不可用（表不存在、SQLite未编译FTS5、查询词无法走该分词模式的索引）时返回 None
+    """
+    config = SEARCH_CONFIG[entity]
+    table = config['fts_table']
+    tokenizer = fts_tokenizer(table)
+    if tokenizer is None:
+        return None
+    
+    match_query = search_tokenizer.build_match_query(query, tokenizer)
+    if match_query is None:
+        return None
+    
+    # rank MATCH 设置排序函数后，ORDER BY rank LIMIT 由FTS5内部完成，
+    # highlight()/snippet() 只对返回的行计算
+    weights = ', '.join(str(weight) for weight in config['bm25_weights'])
+    if not excerpts or search_tokenizer.uses_python_tokenizer(tokenizer):
+        excerpt_columns = "NULL AS title_highlight, NULL AS snippet"
+    else:
+        excerpt_columns = (
+            f"highlight({table}, 0, :hl_start, :hl_end) AS title_highlight, "
+            f"snippet({table}, 1, :hl_start, :hl_end, '...', :snippet_tokens) AS snippet"
+        )
+    sql = db.text(f"""
+        SELECT rowid AS id, rank AS rank, {excerpt_columns}
+        FROM {table}
+        WHERE {table} MATCH :query AND rank MATCH 'bm25({weights})'
+        ORDER BY rank
+        LIMIT :limit
+    """)
+    try:
+        rows = db.session.execute(sql, {
+            'query': match_query,
+            'hl_start': highlight_tags[0],
+            'hl_end': highlight_tags[1],
+            'snippet_tokens': SNIPPET_TOKENS,
+            'limit': limit
+        }).all()
+    except OperationalError as e:
+        print(f"FTS搜索失败，回退到LIKE搜索: {e}")
+        return None
+    
+    return [
+        {
+            'id': row.id,
+            # bm25分数越小越相关，取反后越大越相关
+            'score': round(-row.rank, 6),
+            'title_highlight': row.title_highlight,
+            'snippet': row.snippet
+        }
+        for row in rows
+    ]
+
+def make_snippet(text, query, highlight_tags=DEFAULT_HIGHLIGHT_TAGS, radius=60):
+    """截取关键词附近的文本片段并高亮（LIKE回退路径和bigram索引使用）"""
+    text = text or ''
+    position = text.lower().find(query.lower())
+    if position < 0:
+        return text[:radius * 2] + ('...' if len(text) > radius * 2 else '')
+    
+    start = max(0, position - radius)
+    end = min(len(text), position + len(query) + radius)
+    return (
+        ('...' if start > 0 else '')
+        + text[start:position]
+        + highlight_tags[0] + text[position:position + len(query)] + highlight_tags[1]
+        + text[position + len(query):end]
+        + ('...' if end < len(text) else '')
+    )
+
+def search_entities(entity, query, limit, highlight_tags=DEFAULT_HIGHLIGHT_TAGS, include_content=False):
+    """搜索一类实体，优先使用FTS5索引，不可用时回退到LIKE扫描
+    
+    返回 (结果列表, 搜索方式)，每个结果附带 score / title_highlight / snippet；
+    笔记默认不返回完整正文
+    """
+    config = SEARCH_CONFIG[entity]
+    model = config['model']
+    
+    hits = fts_search(entity, query, limit, highlight_tags)
+    if hits is not None:
+        search_type = 'fts'
+        python_excerpts = any(hit['snippet'] is None for hit in hits)
+        objects_query = model.query.filter(model.id.in_([hit['id'] for hit in hits]))
+        if entity == 'notes' and not include_content and not python_excerpts:
+            objects_query = objects_query.options(defer(Note.content))
+        objects = {obj.id: obj for obj in objects_query.all()}
         
-        context['data']['projects'] = [
+        if python_excerpts:
+            first_term = query.split()[0]
+            for hit in hits:
+                obj = objects.get(hit['id'])
+                if obj is not None:
+                    hit['title_highlight'] = make_snippet(obj.title, first_term, highlight_tags, radius=len(obj.title or ''))
+                    hit['snippet'] = make_snippet(getattr(obj, config['snippet_attr']), first_term, highlight_tags)
+    else:
+        search_type = 'basic'
+        matched = model.query.filter(
+            like_condition(entity, query)
+        ).order_by(model.updated_at.desc()).limit(limit).all()
+        objects = {obj.id: obj for obj in matched}
+        hits = [
             {
-                'id': project.id,
-                'title': project.title,
-                'description': project.description[:300] + '...' if len(project.description) > 300 else project.description,
-                'status': project.status,
-                'priority': project.priority,
-                'stats': project.to_dict()['stats']
+                'id': obj.id,
+                'score': None,
+                'title_highlight': make_snippet(obj.title, query, highlight_tags, radius=len(obj.title or '')),
+                'snippet': make_snippet(getattr(obj, config['snippet_attr']), query, highlight_tags)
             }
-            for project in relevant_projects
+            for obj in matched
         ]
+    
+    if entity == 'projects':
+        project_stats = project_task_stats(list(objects))
+    
+    results = []
+    for hit in hits:
+        obj = objects.get(hit['id'])
+        if obj is None:
+            continue
+        if entity == 'notes':
+            item = obj.to_dict(include_content=include_content)
+        elif entity == 'projects':
+            item = obj.to_dict(stats=project_stats[obj.id])
+        else:
+            item = obj.to_dict()
+        item.update(score=hit['score'], title_highlight=hit['title_highlight'], snippet=hit['snippet'])
+        results.append(item)
+    return results, search_type
+
+def parse_highlight_tags(data):
+    """解析请求中的 highlight_tags: [开始标记, 结束标记]"""
+    tags = data.get('highlight_tags')
+    if isinstance(tags, (list, tuple)) and len(tags) == 2 and all(isinstance(tag, str) for tag in tags):
+        return tuple(tags)
+    return DEFAULT_HIGHLIGHT_TAGS
+
+# 语义向量检索配置
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'sentence-transformers')  # sentence-transformers / hashing
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', vector_index.DEFAULT_EMBEDDING_MODEL)
+VECTOR_INDEX_DIR = os.getenv('VECTOR_INDEX_DIR', os.path.join(basedir, 'vector_index'))
+EMBEDDING_MAX_CHARS = 2000  # 参与嵌入的正文长度上限
+RETRIEVAL_MODES = ('keyword', 'semantic', 'hybrid')
+SEMANTIC_MIN_SCORE = float(os.getenv('SEMANTIC_MIN_SCORE', 0.3))  # 知识库检索中语义召回的最低余弦相似度
+
+_embedder = None
+_note_vectors = None
+_note_vectors_lock = threading.Lock()
+
+def get_note_vectors():
+    """返回 (嵌入模型, 笔记向量索引)，首次使用时加载模型并映射索引文件"""
+    global _embedder, _note_vectors
+    if _note_vectors is None:
+        with _note_vectors_lock:
+            if _note_vectors is None:
+                embedder = vector_index.create_embedder(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+                _note_vectors = vector_index.VectorIndex(VECTOR_INDEX_DIR, embedder.dim, embedder.name)
+                _embedder = embedder
+    return _embedder, _note_vectors
+
+def note_embedding_text(title, content):
+    """参与嵌入计算的笔记文本"""
+    return f"{title or ''}\n{(content or '')[:EMBEDDING_MAX_CHARS]}"
+
+# 笔记修订历史：每次保存记录一个版本（标题、标签和正文的内容地址），
+# 正文按内容寻址去重并以delta链存储（见 revisions.py），自动保存频繁的笔记不会为每次保存存一份完整副本
+REVISION_SNAPSHOT_INTERVAL = int(os.getenv('REVISION_SNAPSHOT_INTERVAL', 20))  # delta链的最大长度
+
+class RevisionBlob(db.Model):
+    __tablename__ = 'note_revision_blobs'
+    
+    hash = db.Column(db.String(64), primary_key=True)  # 正文的SHA-256
+    kind = db.Column(db.String(10), nullable=False)  # full / delta
+    base_hash = db.Column(db.String(64), nullable=True)  # delta 的基础版本
+    depth = db.Column(db.Integer, nullable=False, default=0)  # 距最近完整快照的delta数
+    size = db.Column(db.Integer, nullable=False)  # 正文字符数
+    data = db.Column(db.LargeBinary, nullable=False)
+
+class NoteRevision(db.Model):
+    __tablename__ = 'note_revisions'
+    __table_args__ = (
+        db.Index('idx_note_revisions_note_rev', 'note_id', 'rev', unique=True),
+        db.Index('idx_note_revisions_note_created', 'note_id', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, nullable=False)  # 笔记删除后保留历史，可按时间点读取恢复
+    rev = db.Column(db.Integer, nullable=False)  # 每篇笔记从1开始的版本号
+    title = db.Column(db.String(200), nullable=False)
+    tags = db.Column(db.Text, default='[]')
+    content_hash = db.Column(db.String(64), db.ForeignKey('note_revision_blobs.hash'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # 该版本保存的时间（笔记的 updated_at）
+    
+    def to_dict(self, size=None, content=None):
+        result = {
+            'note_id': self.note_id,
+            'rev': self.rev,
+            'title': self.title,
+            'tags': self.tags,
+            'content_hash': self.content_hash,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+        if size is not None:
+            result['size'] = size
+        if content is not None:
+            result['content'] = content
+        return result
+
+def read_revision_content(content_hash, session=None):
+    """还原内容地址对应的正文：一次递归查询取出到最近完整快照为止的delta链"""
+    session = session or db.session
+    rows = session.execute(
+        db.text(
+            "WITH RECURSIVE chain(hash, kind, base_hash, data, position) AS ("
+            " SELECT hash, kind, base_hash, data, 0 FROM note_revision_blobs WHERE hash = :hash"
+            " UNION ALL"
+            " SELECT blob.hash, blob.kind, blob.base_hash, blob.data, chain.position + 1"
+            " FROM note_revision_blobs AS blob JOIN chain ON blob.hash = chain.base_hash WHERE chain.kind = 'delta'"
+            ") SELECT kind, data FROM chain ORDER BY position DESC"
+        ),
+        {'hash': content_hash}
+    ).all()
+    if not rows:
+        raise LookupError(f'修订内容不存在: {content_hash}')
+    return revisions.decode_chain([(row.kind, row.data) for row in rows])
+
+def store_revision_blob(session, text, text_hash, base_hash=None, base_text=None):
+    """保存正文blob，相同内容已存在时直接复用；有上一版本时优先存为相对它的delta
+    
+    base_text 为调用方已知的上一版本正文（ORM保存时来自属性历史），不一致或未提供时从存储中还原
+    """
+    if session.execute(db.select(RevisionBlob.hash).where(RevisionBlob.hash == text_hash)).first():
+        return
+    
+    base_depth = None
+    if base_hash:
+        base_depth = session.scalar(db.select(RevisionBlob.depth).where(RevisionBlob.hash == base_hash))
+    if base_depth is None or base_depth + 1 >= REVISION_SNAPSHOT_INTERVAL:
+        base_text = None
+    elif base_text is None or revisions.content_hash(base_text) != base_hash:
+        base_text = read_revision_content(base_hash, session)
+    
+    kind, depth, data = revisions.encode_blob(text, base_text, base_depth or 0, REVISION_SNAPSHOT_INTERVAL)
+    session.execute(db.insert(RevisionBlob).values(
+        hash=text_hash, kind=kind, base_hash=base_hash if kind == 'delta' else None,
+        depth=depth, size=len(text), data=data
+    ))
+
+def latest_revisions(note_ids, session):
+    """{笔记id: 最新修订}"""
+    latest = db.select(
+        NoteRevision.note_id, db.func.max(NoteRevision.rev).label('rev')
+    ).where(NoteRevision.note_id.in_(note_ids)).group_by(NoteRevision.note_id).subquery()
+    rows = session.execute(
+        db.select(NoteRevision.note_id, NoteRevision.rev, NoteRevision.title, NoteRevision.tags, NoteRevision.content_hash)
+        .join(latest, db.and_(NoteRevision.note_id == latest.c.note_id, NoteRevision.rev == latest.c.rev))
+    )
+    return {row.note_id: row for row in rows}
+
+def record_note_revisions(note_ids, session=None, previous_contents=None):
+    """把笔记的当前状态记为新版本；与最新版本相同（标题、标签和正文都未变）时跳过
+    
+    在写入笔记的同一事务中调用；previous_contents 为 {笔记id: 修改前的正文}，可省去还原上一版本
+    """
+    session = session or db.session
+    previous_contents = previous_contents or {}
+    note_ids = list(note_ids)
+    for start in range(0, len(note_ids), MAX_IN_PARAMS):
+        chunk = note_ids[start:start + MAX_IN_PARAMS]
+        notes = session.execute(
+            db.select(Note.id, Note.title, Note.content, Note.tags, Note.updated_at).where(Note.id.in_(chunk))
+        ).all()
+        latest = latest_revisions(chunk, session)
         
-        # 获取相关任务
-        relevant_tasks = Task.query.filter(
-            db.or_(
-                Task.title.contains(query),
-                Task.description.contains(query),
-                Task.assignee.contains(query)
+        new_rows = []
+        for note in notes:
+            content = note.content or ''
+            text_hash = revisions.content_hash(content)
+            last = latest.get(note.id)
+            if last is not None and (last.title, last.tags, last.content_hash) == (note.title, note.tags, text_hash):
+                continue
+            store_revision_blob(
+                session, content, text_hash,
+                base_hash=last.content_hash if last else None,
+                base_text=previous_contents.get(note.id)
             )
-        ).order_by(Task.updated_at.desc()).limit(context_limit).all()
+            new_rows.append({
+                'note_id': note.id,
+                'rev': last.rev + 1 if last else 1,
+                'title': note.title,
+                'tags': note.tags,
+                'content_hash': text_hash,
+                'created_at': note.updated_at or datetime.utcnow()
+            })
+        if new_rows:
+            session.execute(db.insert(NoteRevision), new_rows)
+
+def ensure_revision_baseline(note_ids, session=None):
+    """修改笔记之前调用：还没有修订历史的笔记（功能上线前创建的）先把修改前的状态记为第一个版本"""
+    session = session or db.session
+    note_ids = list(note_ids)
+    missing = []
+    for start in range(0, len(note_ids), MAX_IN_PARAMS):
+        chunk = note_ids[start:start + MAX_IN_PARAMS]
+        recorded = set(session.scalars(
+            db.select(NoteRevision.note_id).where(NoteRevision.note_id.in_(chunk)).distinct()
+        ))
+        missing.extend(note_id for note_id in chunk if note_id not in recorded)
+    if missing:
+        record_note_revisions(missing, session)
+
+def note_history_changed(note):
+    attrs = db.inspect(note).attrs
+    return any(getattr(attrs, name).history.has_changes() for name in ('title', 'content', 'tags'))
+
+@event.listens_for(Session, 'before_flush')
+def record_revision_baselines(session, flush_context, instances):
+    """修改已有笔记时，数据库中还是修改前的状态，先补上没有历史的笔记的基线版本"""
+    note_ids = [
+        obj.id for obj in session.dirty
+        if isinstance(obj, Note) and obj.id is not None and session.is_modified(obj) and note_history_changed(obj)
+    ]
+    if note_ids:
+        ensure_revision_baseline(note_ids, session)
+
+@event.listens_for(Session, 'after_flush')
+def record_changed_note_revisions(session, flush_context):
+    """新建或修改了标题/正文/标签的笔记，在同一事务中记录新版本"""
+    note_ids = [obj.id for obj in session.new if isinstance(obj, Note)]
+    previous_contents = {}
+    for obj in session.dirty:
+        if isinstance(obj, Note) and session.is_modified(obj) and note_history_changed(obj):
+            note_ids.append(obj.id)
+            deleted = db.inspect(obj).attrs.content.history.deleted
+            if deleted:
+                previous_contents[obj.id] = deleted[0] or ''
+    if note_ids:
+        record_note_revisions(note_ids, session, previous_contents)
+
+def revision_at(note_id, at):
+    """笔记在时间点 at 的版本（at 之前最后保存的版本），不存在时返回 None"""
+    return NoteRevision.query.filter(
+        NoteRevision.note_id == note_id, NoteRevision.created_at <= at
+    ).order_by(NoteRevision.created_at.desc(), NoteRevision.id.desc()).first()
+
+def revision_response(revision):
+    return jsonify({
+        'success': True,
+        'data': revision.to_dict(
+            size=db.session.scalar(db.select(RevisionBlob.size).where(RevisionBlob.hash == revision.content_hash)),
+            content=read_revision_content(revision.content_hash)
+        )
+    })
+
+@app.route('/api/notes/<int:note_id>/revisions', methods=['GET'])
+@conditional_get(model=Note)
+def get_note_revisions(note_id):
+    """获取笔记的修订历史（不含正文），按版本号从新到旧；?limit=&before=<版本号> 分页
+    
+    笔记已删除时仍可查询，用于恢复
+    """
+    try:
+        limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        before = request.args.get('before', type=int)
         
-        context['data']['tasks'] = [
-            {
-                'id': task.id,
-                'title': task.title,
-                'description': task.description[:200] + '...' if len(task.description) > 200 else task.description,
-                'status': task.status,
-                'priority': task.priority,
-                'project_id': task.project_id
+        query = db.session.query(NoteRevision, RevisionBlob.size).join(
+            RevisionBlob, RevisionBlob.hash == NoteRevision.content_hash
+        ).filter(NoteRevision.note_id == note_id)
+        if before is not None:
+            query = query.filter(NoteRevision.rev < before)
+        rows = query.order_by(NoteRevision.rev.desc()).limit(limit + 1).all()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return jsonify({
+            'success': True,
+            'data': [revision.to_dict(size=size) for revision, size in rows],
+            'pagination': {
+                'limit': limit,
+                'has_more': has_more,
+                'next_before': rows[-1][0].rev if has_more else None
             }
-            for task in relevant_tasks
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/notes/<int:note_id>/revisions/<int:rev>', methods=['GET'])
+@conditional_get(model=Note)
+def get_note_revision(note_id, rev):
+    """获取笔记某个版本的完整内容"""
+    try:
+        revision = NoteRevision.query.filter_by(note_id=note_id, rev=rev).first()
+        if revision is None:
+            return jsonify({
+                'success': False,
+                'error': '版本不存在'
+            }), 404
+        return revision_response(revision)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# 后台索引队列配置
+# 笔记写入只在同一事务中把笔记id写入 index_queue 表，向量由后台worker批量计算
+INDEX_WORKER_ENABLED = os.getenv('INDEX_WORKER_ENABLED', 'true').lower() in ('1', 'true', 'yes')  # false 时用 `flask index-worker` 单独运行
+INDEX_BATCH_SIZE = int(os.getenv('INDEX_BATCH_SIZE', 64))  # 每批次的笔记数（一次模型推理）
+INDEX_POLL_INTERVAL = float(os.getenv('INDEX_POLL_INTERVAL', 2))  # 秒；同一进程内的写入会立即唤醒worker
+INDEX_LEASE_SECONDS = 120  # 认领后未完成（如进程崩溃）的条目在租约到期后重新处理
+INDEX_MAX_ATTEMPTS = 5  # 连续失败超过该次数的条目不再重试，在状态接口中报告
+
+# 索引队列数据模型：每篇笔记最多一条，重复编辑合并为一条并递增 version
+class IndexQueueItem(db.Model):
+    __tablename__ = 'index_queue'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, nullable=False, unique=True)
+    op = db.Column(db.String(10), nullable=False)  # upsert / delete
+    version = db.Column(db.Integer, nullable=False, default=1)
+    enqueued_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # 合并时保留最早的时间，用于计算索引延迟
+    attempts = db.Column(db.Integer, default=0)
+    locked_until = db.Column(db.DateTime)
+    claim_token = db.Column(db.String(32))
+    last_error = db.Column(db.Text)
+
+# 当前进程的worker统计
+_index_worker_stats = {'batches': 0, 'items': 0, 'failures': 0, 'last_batch_size': 0, 'last_batch_ms': 0, 'last_run_at': None}
+_index_worker_stats_lock = threading.Lock()
+_index_wakeup = threading.Event()
+_index_worker_thread = None
+_index_worker_lock = threading.Lock()
+
+def enqueue_note_index(ops, session=None):
+    """把 {笔记id: 'upsert'|'delete'} 写入索引队列；已在队列中的笔记合并为一条"""
+    session = session or db.session
+    queue = IndexQueueItem.__table__
+    note_ids = list(ops)
+    for start in range(0, len(note_ids), MAX_IN_PARAMS):
+        chunk = note_ids[start:start + MAX_IN_PARAMS]
+        existing = {
+            note_id for (note_id,) in session.execute(
+                db.select(queue.c.note_id).where(queue.c.note_id.in_(chunk))
+            )
+        }
+        for note_id in existing:
+            # 保留 locked_until：正在处理的条目完成后发现版本变化，会解锁重新处理
+            session.execute(
+                queue.update().where(queue.c.note_id == note_id).values(
+                    op=ops[note_id], version=queue.c.version + 1, attempts=0, last_error=None
+                )
+            )
+        new_rows = [
+            {'note_id': note_id, 'op': ops[note_id], 'version': 1, 'enqueued_at': datetime.utcnow(), 'attempts': 0}
+            for note_id in chunk if note_id not in existing
         ]
-        
-        # 获取相关待办事项
-        relevant_todos = Todo.query.filter(
-            db.or_(
-                Todo.title.contains(query),
-                Todo.description.contains(query)
+        if new_rows:
+            session.execute(queue.insert(), new_rows)
+
+@event.listens_for(Session, 'after_flush')
+def enqueue_changed_notes(session, flush_context):
+    """新建、删除或修改了标题/正文的笔记，在同一事务中加入索引队列"""
+    ops = {}
+    for obj in session.new:
+        if isinstance(obj, Note):
+            ops[obj.id] = 'upsert'
+    for obj in session.dirty:
+        if isinstance(obj, Note) and session.is_modified(obj):
+            attrs = db.inspect(obj).attrs
+            if attrs.title.history.has_changes() or attrs.content.history.has_changes():
+                ops[obj.id] = 'upsert'
+    for obj in session.deleted:
+        if isinstance(obj, Note):
+            ops[obj.id] = 'delete'
+    if ops:
+        enqueue_note_index(ops, session)
+        session.info['index_queue_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def wake_index_worker(session):
+    if session.info.pop('index_queue_changed', False):
+        _index_wakeup.set()
+
+@event.listens_for(Session, 'after_rollback')
+def discard_index_wakeup(session):
+    session.info.pop('index_queue_changed', None)
+
+def claim_index_batch(limit):
+    """认领一批到期的队列条目（加租约），返回认领到的条目"""
+    queue = IndexQueueItem.__table__
+    now = datetime.utcnow()
+    available = db.and_(
+        queue.c.attempts < INDEX_MAX_ATTEMPTS,
+        db.or_(queue.c.locked_until.is_(None), queue.c.locked_until < now)
+    )
+    candidate_ids = [
+        item_id for (item_id,) in db.session.execute(
+            db.select(queue.c.id).where(available).order_by(queue.c.enqueued_at).limit(limit)
+        )
+    ]
+    if not candidate_ids:
+        db.session.rollback()
+        return []
+    
+    # 多个worker可能选中同一批条目，只处理自己成功加锁的部分
+    token = os.urandom(16).hex()
+    db.session.execute(
+        queue.update().where(queue.c.id.in_(candidate_ids), available).values(
+            locked_until=now + timedelta(seconds=INDEX_LEASE_SECONDS), claim_token=token
+        )
+    )
+    db.session.commit()
+    return db.session.execute(
+        db.select(queue.c.id, queue.c.note_id, queue.c.op, queue.c.version, queue.c.attempts)
+        .where(queue.c.claim_token == token)
+    ).all()
+
+def process_index_batch(limit=None):
+    """处理一批索引队列：一次模型推理计算整批向量，返回处理的条目数"""
+    items = claim_index_batch(limit or INDEX_BATCH_SIZE)
+    if not items:
+        return 0
+    
+    queue = IndexQueueItem.__table__
+    start_time = time.perf_counter()
+    upsert_ids = [item.note_id for item in items if item.op == 'upsert']
+    delete_ids = [item.note_id for item in items if item.op == 'delete']
+    try:
+        embedder, index = get_note_vectors()
+        notes = db.session.query(Note.id, Note.title, Note.content).filter(Note.id.in_(upsert_ids)).all() if upsert_ids else []
+        found = {note.id for note in notes}
+        # 入队后又被删除的笔记
+        delete_ids += [note_id for note_id in upsert_ids if note_id not in found]
+        if notes:
+            vectors = embedder.encode([note_embedding_text(note.title, note.content) for note in notes])
+            index.upsert([note.id for note in notes], vectors)
+        if delete_ids:
+            index.remove(delete_ids)
+    except Exception as e:
+        db.session.rollback()
+        print(f"索引队列处理失败（{len(items)} 条）: {e}")
+        for item in items:
+            # 指数退避后重试
+            retry_at = datetime.utcnow() + timedelta(seconds=INDEX_POLL_INTERVAL * 2 ** item.attempts)
+            db.session.execute(
+                queue.update().where(queue.c.id == item.id).values(
+                    attempts=queue.c.attempts + 1, last_error=str(e)[:500], locked_until=retry_at, claim_token=None
+                )
             )
-        ).order_by(Todo.updated_at.desc()).limit(context_limit).all()
+        db.session.commit()
+        with _index_worker_stats_lock:
+            _index_worker_stats['failures'] += 1
+        return 0
+    
+    # 处理期间再次被编辑的笔记（version 已变化）保留在队列中并解锁
+    for item in items:
+        db.session.execute(queue.delete().where(queue.c.id == item.id, queue.c.version == item.version))
+    db.session.execute(
+        queue.update().where(queue.c.id.in_([item.id for item in items])).values(locked_until=None, claim_token=None)
+    )
+    db.session.commit()
+    
+    elapsed_ms = int((time.perf_counter() - start_time) * 1000)
+    with _index_worker_stats_lock:
+        _index_worker_stats['batches'] += 1
+        _index_worker_stats['items'] += len(items)
+        _index_worker_stats['last_batch_size'] = len(items)
+        _index_worker_stats['last_batch_ms'] = elapsed_ms
+        _index_worker_stats['last_run_at'] = datetime.utcnow().isoformat()
+    return len(items)
+
+def drain_index_queue():
+    """处理队列直到没有可认领的条目"""
+    total = 0
+    while True:
+        processed = process_index_batch()
+        if not processed:
+            return total
+        total += processed
+
+def index_worker_loop():
+    """后台线程：被写入唤醒或定时轮询，批量处理索引队列"""
+    while True:
+        _index_wakeup.wait(INDEX_POLL_INTERVAL)
+        _index_wakeup.clear()
+        try:
+            with app.app_context():
+                drain_index_queue()
+        except Exception as e:
+            print(f"索引worker出错: {e}")
+            time.sleep(INDEX_POLL_INTERVAL)
+
+def start_index_worker():
+    """在当前进程中启动后台索引线程（每个进程一个）"""
+    global _index_worker_thread
+    with _index_worker_lock:
+        if _index_worker_thread is None or not _index_worker_thread.is_alive():
+            _index_worker_thread = threading.Thread(target=index_worker_loop, name='index-worker', daemon=True)
+            _index_worker_thread.start()
+
+@app.before_request
+def ensure_index_worker():
+    # 在处理第一个请求时启动（gunicorn fork之后），flask命令行不会启动
+    if INDEX_WORKER_ENABLED and _index_worker_thread is None:
+        start_index_worker()
+
+def index_queue_stats():
+    """索引队列积压和延迟"""
+    queue = IndexQueueItem.__table__
+    now = datetime.utcnow()
+    pending, oldest = db.session.execute(
+        db.select(db.func.count(), db.func.min(queue.c.enqueued_at)).where(queue.c.attempts < INDEX_MAX_ATTEMPTS)
+    ).one()
+    failed = db.session.execute(
+        db.select(db.func.count()).where(queue.c.attempts >= INDEX_MAX_ATTEMPTS)
+    ).scalar()
+    with _index_worker_stats_lock:
+        worker = dict(_index_worker_stats)
+    worker['running'] = _index_worker_thread is not None and _index_worker_thread.is_alive()
+    
+    return {
+        'pending': pending,
+        'failed': failed,
+        'oldest_enqueued_at': oldest.isoformat() if oldest else None,
+        'lag_seconds': round((now - oldest).total_seconds(), 3) if oldest else 0,
+        'indexed_notes': len(_note_vectors) if _note_vectors is not None else None,
+        'worker': worker
+    }
+
+@app.route('/api/index/status', methods=['GET'])
+def index_status():
+    """派生索引状态 - 队列积压、索引延迟和当前进程worker的处理统计"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': index_queue_stats(),
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.cli.command('index-worker')
+@click.option('--once', is_flag=True, help='处理完当前队列后退出')
+def index_worker_command(once):
+    """在前台运行索引worker（INDEX_WORKER_ENABLED=false 时使用）"""
+    if once:
+        print(f"✅ 已处理 {drain_index_queue()} 条索引任务")
+        return
+    print(f"索引worker已启动，轮询间隔 {INDEX_POLL_INTERVAL}s")
+    while True:
+        if not drain_index_queue():
+            time.sleep(INDEX_POLL_INTERVAL)
+
+def semantic_search_notes(query, limit):
+    """语义检索笔记，返回 [(笔记id, 余弦相似度)]"""
+    embedder, index = get_note_vectors()
+    return index.search(embedder.encode([query])[0], limit)
+
+@app.cli.command('rebuild-vector-index')
+def rebuild_vector_index_command():
+    """清空向量索引并按当前嵌入模型重新计算所有笔记的向量（更换嵌入模型后运行）"""
+    embedder = vector_index.create_embedder(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+    index = vector_index.VectorIndex(VECTOR_INDEX_DIR, embedder.dim, embedder.name, rebuild=True)
+    
+    batch = []
+    total = 0
+    query = db.session.query(Note.id, Note.title, Note.content).order_by(Note.id).yield_per(256)
+    for row in query:
+        batch.append(row)
+        if len(batch) >= 256:
+            index.upsert([r.id for r in batch], embedder.encode([note_embedding_text(r.title, r.content) for r in batch]))
+            total += len(batch)
+            batch = []
+            print(f"已索引 {total} 条笔记")
+    if batch:
+        index.upsert([r.id for r in batch], embedder.encode([note_embedding_text(r.title, r.content) for r in batch]))
+        total += len(batch)
+    
+    print(f"✅ 向量索引重建完成，共 {total} 条笔记（模型: {embedder.name}）")
+
+@app.route('/api/semantic-search', methods=['POST'])
+def semantic_search():
+    """语义搜索笔记 - 按向量余弦相似度排序，返回摘要片段"""
+    try:
+        data = request.get_json()
+        query = data.get('query', '').strip()
+        limit = max(1, min(int(data.get('limit', 20)), MAX_PAGE_SIZE))
         
-        context['data']['todos'] = [
-            {
-                'id': todo.id,
-                'title': todo.title,
-                'description': todo.description[:200] + '...' if len(todo.description) > 200 else todo.description,
-                'completed': todo.completed,
-                'priority': todo.priority,
-                'due_date': todo.due_date.isoformat() if todo.due_date else None
+        if not query:
+            return jsonify({
+                'success': False,
+                'error': '搜索关键词不能为空'
+            }), 400
+        
+        hits = semantic_search_notes(query, limit)
+        fields = ['id', 'title', 'tags', 'snippet', 'created_at', 'updated_at']
+        rows = Note.query.with_entities(
+            *[NOTE_LIST_FIELDS[field].label(field) for field in fields]
+        ).filter(Note.id.in_([note_id for note_id, _ in hits])).all()
+        rows_by_id = {row.id: row for row in rows}
+        
+        notes = []
+        for note_id, score in hits:
+            row = rows_by_id.get(note_id)
+            if row is None:
+                continue
+            item = dict(row._mapping)
+            item['score'] = round(score, 6)
+            notes.append(item)
+        
+        return jsonify({
+            'success': True,
+            'data': notes,
+            'total': len(notes),
+            'search_type': 'semantic'
+        })
+        
+    except Exception as e:
+        print(f"语义搜索错误: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/search', methods=['POST'])
+def search_notes():
+    """搜索笔记 - FTS5全文搜索，按相关度排序，返回摘要片段"""
+    try:
+        data = request.get_json()
+        query = data.get('query', '').strip()
+        limit = max(1, min(int(data.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+        
+        if not query:
+            return jsonify({
+                'success': False,
+                'error': '搜索关键词不能为空'
+            }), 400
+        
+        notes, search_type = search_entities(
+            'notes', query, limit,
+            highlight_tags=parse_highlight_tags(data),
+            include_content=bool(data.get('include_content', False))
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': notes,
+            'total': len(notes),
+            'search_type': search_type
+        })
+        
+    except Exception as e:
+        print(f"搜索错误: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/knowledge-search', methods=['POST'])
+def knowledge_search():
+    """知识库综合搜索 - 搜索所有相关数据"""
+    try:
+        data = request.get_json()
+        query = data.get('query', '').strip()
+        search_types = data.get('types', ['notes', 'projects', 'tasks', 'todos'])  # 默认搜索所有类型
+        limit = max(1, min(int(data.get('limit', 20)), MAX_PAGE_SIZE))  # 每种类型的最大结果数
+        
+        if not query:
+            return jsonify({
+                'success': False,
+                'error': '搜索关键词不能为空'
+            }), 400
+        
+        results = {}
+        total_count = 0
+        highlight_tags = parse_highlight_tags(data)
+        
+        for entity in ('notes', 'projects', 'tasks', 'todos'):
+            if entity not in search_types:
+                continue
+            
+            items, search_type = search_entities(entity, query, limit, highlight_tags)
+            results[entity] = {
+                'data': items,
+                'count': len(items),
+                'type': entity,
+                'search_type': search_type
             }
-            for todo in relevant_todos
-        ]
+            total_count += len(items)
         
-        # 计算总的相关项目数
-        total_items = len(context['data']['notes']) + len(context['data']['projects']) + len(context['data']['tasks']) + len(context['data']['todos'])
-        context['total_items'] = total_items
+        return jsonify({
+            'success': True,
+            'query': query,
+            'results': results,
+            'total_count': total_count,
+            'search_types': search_types,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+        
+    except Exception as e:
+        print(f"知识库搜索错误: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# 知识库检索配置
+KNOWLEDGE_TYPES = ('notes', 'projects', 'tasks', 'todos')
+KNOWLEDGE_RETRIEVAL = os.getenv('KNOWLEDGE_RETRIEVAL', 'hybrid')  # 默认检索方式：keyword / semantic / hybrid
+KNOWLEDGE_CANDIDATES = 30  # 每路召回参与融合的候选数
+
+# 知识库上下文中各类实体正文的截断长度
+# 聊天上下文只设加载上限，最终由 pack_chat_context 按token预算在句子边界截断
+KNOWLEDGE_CONTEXT_EXCERPTS = {'notes': 500, 'projects': 300, 'tasks': 200, 'todos': 200}
+CHAT_CONTEXT_EXCERPTS = {'notes': 4000, 'projects': 2000, 'tasks': 1000, 'todos': 1000}
+
+def truncate_text(text, length):
+    """截断过长的文本"""
+    text = text or ''
+    return text[:length] + '...' if len(text) > length else text
+
+def keyword_ranked_ids(entity, query, limit):
+    """关键词召回：FTS5索引按bm25排序；没有可用索引时LIKE匹配，按更新时间排序"""
+    hits = fts_search(entity, query, limit, excerpts=False)
+    if hits is not None:
+        return [hit['id'] for hit in hits]
+    
+    config = SEARCH_CONFIG[entity]
+    model = config['model']
+    return [
+        row_id for (row_id,) in db.session.query(model.id).filter(
+            like_condition(entity, query)
+        ).order_by(model.updated_at.desc()).limit(limit)
+    ]
+
+def rank_knowledge(query, limit, retrieval=KNOWLEDGE_RETRIEVAL, types=KNOWLEDGE_TYPES):
+    """混合检索：每类实体的关键词召回和笔记的语义召回用倒数排名融合为一个列表
+    
+    retrieval 为 keyword 时只用关键词召回，semantic 时笔记只用语义召回，hybrid 时两者融合。
+    返回 [((实体类型, id), 融合分数, {召回方式: 名次})]，按融合分数从高到低排列
+    """
+    candidates = max(limit, KNOWLEDGE_CANDIDATES)
+    ranked_lists = {}
+    for entity in types:
+        if entity == 'notes' and retrieval == 'semantic':
+            continue
+        ranked_lists[f'{entity}:keyword'] = [(entity, item_id) for item_id in keyword_ranked_ids(entity, query, candidates)]
+    
+    if 'notes' in types and retrieval in ('semantic', 'hybrid'):
+        try:
+            ranked_lists['notes:semantic'] = [
+                ('notes', note_id) for note_id, score in semantic_search_notes(query, candidates)
+                if score >= SEMANTIC_MIN_SCORE
+            ]
+        except Exception as e:
+            # 向量索引不可用时只使用关键词召回
+            print(f"语义检索失败，仅使用关键词检索: {e}")
+    
+    return [
+        (key, score, {name.split(':')[1]: rank for name, rank in ranks.items()})
+        for key, score, ranks in reciprocal_rank_fusion(ranked_lists, limit=limit)
+    ]
+
+def knowledge_item(entity, obj, excerpt_length, project_stats=None):
+    """知识库上下文中的一项"""
+    if entity == 'notes':
+        return {
+            'id': obj.id,
+            'title': obj.title,
+            'content': truncate_text(obj.content, excerpt_length),
+            'tags': obj.tags,
+            'updated_at': obj.updated_at.isoformat() if obj.updated_at else None
+        }
+    if entity == 'projects':
+        return {
+            'id': obj.id,
+            'title': obj.title,
+            'description': truncate_text(obj.description, excerpt_length),
+            'status': obj.status,
+            'priority': obj.priority,
+            'stats': project_stats[obj.id]
+        }
+    if entity == 'tasks':
+        return {
+            'id': obj.id,
+            'title': obj.title,
+            'description': truncate_text(obj.description, excerpt_length),
+            'status': obj.status,
+            'priority': obj.priority,
+            'project_id': obj.project_id
+        }
+    return {
+        'id': obj.id,
+        'title': obj.title,
+        'description': truncate_text(obj.description, excerpt_length),
+        'completed': obj.completed,
+        'priority': obj.priority,
+        'due_date': obj.due_date.isoformat() if obj.due_date else None
+    }
+
+def build_knowledge_context(query, limit, retrieval=KNOWLEDGE_RETRIEVAL, excerpt_lengths=KNOWLEDGE_CONTEXT_EXCERPTS,
+                            types=KNOWLEDGE_TYPES):
+    """检索知识库并构建上下文
+    
+    data 中每类实体的结果按相关度排列；ranked 为跨类型融合后的完整排序，
+    每项带融合分数 score 和各路召回的名次 ranks
+    """
+    ranked = rank_knowledge(query, limit, retrieval, types)
+    
+    ids_by_entity = {}
+    for (entity, item_id), _, _ in ranked:
+        ids_by_entity.setdefault(entity, []).append(item_id)
+    objects = {}
+    for entity, ids in ids_by_entity.items():
+        model = SEARCH_CONFIG[entity]['model']
+        objects[entity] = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))}
+    project_stats = project_task_stats(ids_by_entity.get('projects', []))
+    
+    context = {
+        'query': query,
+        'timestamp': datetime.utcnow().isoformat(),
+        'retrieval': retrieval,
+        'data': {entity: [] for entity in types},
+        'ranked': []
+    }
+    for (entity, item_id), score, ranks in ranked:
+        obj = objects[entity].get(item_id)
+        if obj is None:
+            continue
+        item = knowledge_item(entity, obj, excerpt_lengths[entity], project_stats)
+        item['score'] = round(score, 6)
+        item['ranks'] = ranks
+        context['data'][entity].append(item)
+        context['ranked'].append({'type': entity, 'id': item_id, 'score': item['score']})
+    
+    context['total_items'] = len(context['ranked'])
+    return context
+
+@app.route('/api/knowledge-context', methods=['POST'])
+def get_knowledge_context():
+    """获取知识库上下文 - 为AI提供相关背景信息（按相关度融合排序）"""
+    try:
+        data = request.get_json()
+        query = data.get('query', '').strip()
+        context_limit = max(1, min(int(data.get('limit', 20)), MAX_PAGE_SIZE))  # 融合后的总条数
+        retrieval = data.get('retrieval', KNOWLEDGE_RETRIEVAL)
+        types = [entity for entity in KNOWLEDGE_TYPES if entity in data.get('types', KNOWLEDGE_TYPES)]
+        
+        if not query:
+            return jsonify({
+                'success': False,
+                'error': '查询内容不能为空'
+            }), 400
+        
+        if retrieval not in RETRIEVAL_MODES:
+            return jsonify({
+                'success': False,
+                'error': f'不支持的检索方式: {retrieval}'
+            }), 400
+        
+        context = build_knowledge_context(query, context_limit, retrieval, KNOWLEDGE_CONTEXT_EXCERPTS, types)
         
         return jsonify({
             'success': True,
@@ -1053,179 +3207,497 @@ def get_available_models():
         'models': models
     })
 
+# 聊天响应缓存配置（默认关闭，请求中的 cache 参数可覆盖）
+CHAT_CACHE_ENABLED = os.getenv('CHAT_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+CHAT_CACHE_TTL = int(os.getenv('CHAT_CACHE_TTL', 3600))  # 秒
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv('CHAT_CACHE_MAX_ENTRIES', 1000))
+
+# 当前进程的缓存统计
+_chat_cache_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0, 'saved_ms': 0}
+_chat_cache_stats_lock = threading.Lock()
+
+def _count_chat_cache(name, amount=1):
+    with _chat_cache_stats_lock:
+        _chat_cache_stats[name] += amount
+
+def chat_cache_key(payload):
+    """根据上游请求内容计算缓存键
+    
+    请求内容已包含所选模型、带知识库上下文的系统提示、截断后的历史、
+    当前消息和采样参数；是否流式不影响回复内容，不参与计算
+    """
+    key_data = {key: value for key, value in payload.items() if key != 'stream'}
+    encoded = json.dumps(key_data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+def knowledge_context_refs(knowledge_context):
+    """提取知识库上下文引用的对象 [(实体类型, id)]"""
+    if not knowledge_context:
+        return []
+    
+    refs = set()
+    for entity in ('notes', 'projects', 'tasks', 'todos'):
+        for item in knowledge_context['data'].get(entity, []):
+            refs.add((entity, item['id']))
+    return sorted(refs)
+
+def chat_cache_get(cache_key):
+    """读取未过期的缓存回复，命中时更新LRU时间；未命中返回 None"""
+    entry = db.session.get(ChatCacheEntry, cache_key)
+    now = datetime.utcnow()
+    
+    if entry is not None and entry.created_at < now - timedelta(seconds=CHAT_CACHE_TTL):
+        db.session.delete(entry)
+        db.session.commit()
+        entry = None
+    
+    if entry is None:
+        _count_chat_cache('misses')
+        return None
+    
+    entry.hit_count = (entry.hit_count or 0) + 1
+    entry.last_used_at = now
+    response = entry.response
+    latency_ms = entry.latency_ms or 0
+    db.session.commit()
+    
+    _count_chat_cache('hits')
+    _count_chat_cache('saved_ms', latency_ms)
+    return response
+
+def chat_cache_put(cache_key, model, response, latency_ms, refs):
+    """保存回复及其引用的知识库对象，并按TTL和容量淘汰旧条目"""
+    try:
+        now = datetime.utcnow()
+        ChatCacheRef.query.filter_by(cache_key=cache_key).delete()
+        db.session.merge(ChatCacheEntry(
+            cache_key=cache_key,
+            model=model,
+            response=response,
+            latency_ms=int(latency_ms),
+            hit_count=0,
+            created_at=now,
+            last_used_at=now
+        ))
+        for entity, entity_id in refs:
+            db.session.add(ChatCacheRef(cache_key=cache_key, entity=entity, entity_id=entity_id))
+        db.session.flush()
+        
+        # 过期条目
+        expired_keys = db.session.query(ChatCacheEntry.cache_key).filter(
+            ChatCacheEntry.created_at < now - timedelta(seconds=CHAT_CACHE_TTL)
+        )
+        # 超出容量时淘汰最久未使用的条目
+        overflow = ChatCacheEntry.query.count() - CHAT_CACHE_MAX_ENTRIES
+        evict_keys = [key for (key,) in expired_keys.all()]
+        if overflow > 0:
+            evict_keys += [
+                key for (key,) in db.session.query(ChatCacheEntry.cache_key)
+                .order_by(ChatCacheEntry.last_used_at.asc()).limit(overflow).all()
+            ]
+        if evict_keys:
+            delete_chat_cache_entries(set(evict_keys))
+        
+        db.session.commit()
+        _count_chat_cache('stores')
+    except Exception as e:
+        db.session.rollback()
+        print(f"写入聊天缓存失败: {e}")
+
+def delete_chat_cache_entries(cache_keys, session=None):
+    """删除缓存条目及其引用"""
+    session = session or db.session
+    cache_keys = list(cache_keys)
+    for start in range(0, len(cache_keys), MAX_IN_PARAMS):
+        chunk = cache_keys[start:start + MAX_IN_PARAMS]
+        session.execute(ChatCacheRef.__table__.delete().where(ChatCacheRef.cache_key.in_(chunk)))
+        session.execute(ChatCacheEntry.__table__.delete().where(ChatCacheEntry.cache_key.in_(chunk)))
+
+@event.listens_for(Session, 'after_flush')
+def invalidate_chat_cache(session, flush_context):
+    """知识库对象更新或删除后，在同一事务中删除引用了它们的缓存回复"""
+    changed = set()
+    modified = [obj for obj in session.dirty if session.is_modified(obj)]
+    for obj in modified + list(session.deleted):
+        if isinstance(obj, (Note, Project, Task, Todo)):
+            changed.add((obj.__tablename__, obj.id))
+            # 项目上下文中包含任务统计，任务变化时项目相关的回复也失效
+            if isinstance(obj, Task) and obj.project_id:
+                changed.add(('projects', obj.project_id))
+    invalidate_chat_cache_refs(changed, session)
+
+def invalidate_chat_cache_refs(changed, session=None):
+    """删除引用了 changed 中任一对象 (实体类型, id) 的缓存回复（批量接口绕过ORM时直接调用）"""
+    session = session or db.session
+    changed = list(changed)
+    cache_keys = set()
+    # 每个条件占用两个参数
+    for start in range(0, len(changed), MAX_IN_PARAMS // 2):
+        conditions = [
+            db.and_(ChatCacheRef.entity == entity, ChatCacheRef.entity_id == entity_id)
+            for entity, entity_id in changed[start:start + MAX_IN_PARAMS // 2]
+        ]
+        cache_keys.update(
+            key for (key,) in session.execute(db.select(ChatCacheRef.cache_key).where(db.or_(*conditions)))
+        )
+    if cache_keys:
+        delete_chat_cache_entries(cache_keys, session)
+        _count_chat_cache('invalidations', len(cache_keys))
+
+def chat_cache_stats():
+    """缓存命中率和节省的上游延迟"""
+    with _chat_cache_stats_lock:
+        stats = dict(_chat_cache_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+    stats['entries'] = ChatCacheEntry.query.count()
+    stats['enabled_by_default'] = CHAT_CACHE_ENABLED
+    stats['ttl_seconds'] = CHAT_CACHE_TTL
+    stats['max_entries'] = CHAT_CACHE_MAX_ENTRIES
+    return stats
+
+class ChatRequestError(Exception):
+    """聊天请求无效或无法处理，携带返回给客户端的状态码"""
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def prepare_chat(data):
+    """解析聊天请求、搜索知识库、构建上游请求并查询缓存（同步接口和 asgi.py 的异步接口共用）
+    
+    返回包含上游请求和响应元数据的字典，cached_response 不为 None 时直接返回缓存的回复；
+    请求无效时抛出 ChatRequestError
+    """
+    message = data.get('message', '').strip()
+    history = data.get('history', [])
+    model = data.get('model', 'claude-3.5-sonnet')  # 默认使用Claude 3.5 Sonnet
+    use_knowledge_base = data.get('use_knowledge_base', True)  # 默认启用知识库
+    retrieval = data.get('retrieval', KNOWLEDGE_RETRIEVAL)  # 知识库检索方式：keyword / semantic / hybrid
+    token_budget = data.get('context_budget')  # 知识库和历史对话的token预算，默认 CHAT_CONTEXT_TOKEN_BUDGET
+    
+    if not message:
+        raise ChatRequestError('消息不能为空')
+    
+    if retrieval not in RETRIEVAL_MODES:
+        raise ChatRequestError(f'不支持的检索方式: {retrieval}')
+    
+    if token_budget is not None and (not isinstance(token_budget, int) or token_budget < 0):
+        raise ChatRequestError('context_budget 必须是非负整数')
+    
+    # 获取OpenRouter API密钥
+    openrouter_api_key = os.getenv('OPENROUTE_API_KEY')
+    if not openrouter_api_key:
+        raise ChatRequestError('OpenRouter API密钥未配置', 500)
+    
+    # 搜索知识库获取相关上下文
+    knowledge_context = None
+    if use_knowledge_base:
+        try:
+            knowledge_context = search_knowledge_base(message, retrieval=retrieval)
+        except Exception as e:
+            print(f"知识库搜索失败: {e}")
+            # 即使知识库搜索失败，也继续处理聊天请求
+    
+    knowledge_used = knowledge_context is not None and knowledge_context['total_items'] > 0
+    
+    # 按所选模型的token预算装入知识库上下文和历史对话
+    headers, payload, context_usage = build_openrouter_request(
+        message, history, openrouter_api_key, model, knowledge_context, token_budget=token_budget
+    )
+    
+    # 相同请求（模型、系统提示和知识库上下文、历史、消息、采样参数）直接返回缓存的回复
+    cache_key = None
+    cached_response = None
+    if data.get('cache', CHAT_CACHE_ENABLED):
+        cache_key = chat_cache_key(payload)
+        cached_response = chat_cache_get(cache_key)
+    
+    return {
+        'stream': bool(data.get('stream')),
+        'headers': headers,
+        'payload': payload,
+        'knowledge_used': knowledge_used,
+        'context_usage': context_usage,
+        'cache_key': cache_key,
+        'cache_refs': knowledge_context_refs(knowledge_context) if cached_response is None else (),
+        'cached_response': cached_response
+    }
+
+def chat_result(response_text, plan, cached):
+    """非流式聊天接口的响应内容"""
+    return {
+        'response': response_text,
+        'timestamp': datetime.utcnow().isoformat(),
+        'knowledge_used': plan['knowledge_used'],
+        'context_tokens': plan['context_usage'],
+        'cached': cached
+    }
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """AI聊天接口 - 使用OpenRouter API，集成知识库搜索"""
     try:
-        data = request.get_json()
-        message = data.get('message', '').strip()
-        history = data.get('history', [])
-        model = data.get('model', 'claude-3.5-sonnet')  # 默认使用Claude 3.5 Sonnet
-        use_knowledge_base = data.get('use_knowledge_base', True)  # 默认启用知识库
-        
-        if not message:
-            return jsonify({'error': '消息不能为空'}), 400
-        
-        # 获取OpenRouter API密钥
-        openrouter_api_key = os.getenv('OPENROUTE_API_KEY')
-        if not openrouter_api_key:
-            return jsonify({'error': 'OpenRouter API密钥未配置'}), 500
-        
-        # 搜索知识库获取相关上下文
-        knowledge_context = None
-        if use_knowledge_base:
-            try:
-                knowledge_context = search_knowledge_base(message)
-            except Exception as e:
-                print(f"知识库搜索失败: {e}")
-                # 即使知识库搜索失败，也继续处理聊天请求
+        plan = prepare_chat(request.get_json())
+        
+        if plan['cached_response'] is not None:
+            if plan['stream']:
+                return Response(
+                    cached_event_stream(plan['cached_response'], plan['knowledge_used'], plan['context_usage']),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'}
+                )
+            return jsonify(chat_result(plan['cached_response'], plan, cached=True))
+        
+        # 流式模式：以Server-Sent Events转发上游的token流
+        if plan['stream']:
+            return Response(
+                stream_with_context(chat_event_stream(
+                    plan['headers'], plan['payload'], plan['knowledge_used'], plan['context_usage'],
+                    cache_key=plan['cache_key'], cache_refs=plan['cache_refs']
+                )),
+                mimetype='text/event-stream',
+                headers={
+                    'Cache-Control': 'no-cache',
+                    'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲
+                }
+            )
         
         # 调用OpenRouter API
-        response_text = call_openrouter_api(message, history, openrouter_api_key, model, knowledge_context)
+        response_text = call_openrouter_api(
+            plan['headers'], plan['payload'], cache_key=plan['cache_key'], cache_refs=plan['cache_refs']
+        )
         
-        return jsonify({
-            'response': response_text,
-            'timestamp': datetime.utcnow().isoformat(),
-            'knowledge_used': knowledge_context is not None and knowledge_context['total_items'] > 0
-        })
+        return jsonify(chat_result(response_text, plan, cached=False))
         
+    except ChatRequestError as e:
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         print(f'聊天接口出错: {str(e)}')
         return jsonify({'error': '聊天服务暂时不可用'}), 500
 
-def search_knowledge_base(query, limit=5):
-    """搜索知识库获取相关上下文"""
+@app.route('/api/chat/stats', methods=['GET'])
+def chat_stats():
+    """聊天服务统计 - 当前worker进程的上游连接复用情况和响应缓存命中率"""
+    return jsonify({
+        'success': True,
+        'data': {
+            'http': http_pool_stats(),
+            'cache': chat_cache_stats()
+        },
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+def search_knowledge_base(query, limit=10, retrieval=KNOWLEDGE_RETRIEVAL):
+    """搜索知识库获取聊天上下文，返回融合排序后最相关的 limit 条；没有结果时返回 None"""
     try:
-        context = {
-            'query': query,
-            'timestamp': datetime.utcnow().isoformat(),
-            'data': {}
-        }
-        
-        # 获取相关笔记
-        relevant_notes = Note.query.filter(
-            db.or_(
-                Note.title.contains(query),
-                Note.content.contains(query),
-                Note.tags.contains(query)
-            )
-        ).order_by(Note.updated_at.desc()).limit(limit).all()
-        
-        context['data']['notes'] = [
-            {
-                'id': note.id,
-                'title': note.title,
-                'content': note.content[:800] + '...' if len(note.content) > 800 else note.content,
-                'tags': note.tags,
-                'updated_at': note.updated_at.isoformat() if note.updated_at else None
-            }
-            for note in relevant_notes
-        ]
-        
-        # 获取相关项目
-        relevant_projects = Project.query.filter(
-            db.or_(
-                Project.title.contains(query),
-                Project.description.contains(query)
-            )
-        ).order_by(Project.updated_at.desc()).limit(limit).all()
-        
-        context['data']['projects'] = [
-            {
-                'id': project.id,
-                'title': project.title,
-                'description': project.description[:400] + '...' if len(project.description) > 400 else project.description,
-                'status': project.status,
-                'priority': project.priority,
-                'stats': project.to_dict()['stats']
-            }
-            for project in relevant_projects
-        ]
-        
-        # 获取相关任务
-        relevant_tasks = Task.query.filter(
-            db.or_(
-                Task.title.contains(query),
-                Task.description.contains(query),
-                Task.assignee.contains(query)
-            )
-        ).order_by(Task.updated_at.desc()).limit(limit).all()
-        
-        context['data']['tasks'] = [
-            {
-                'id': task.id,
-                'title': task.title,
-                'description': task.description[:300] + '...' if len(task.description) > 300 else task.description,
-                'status': task.status,
-                'priority': task.priority,
-                'project_id': task.project_id
-            }
-            for task in relevant_tasks
-        ]
-        
-        # 获取相关待办事项
-        relevant_todos = Todo.query.filter(
-            db.or_(
-                Todo.title.contains(query),
-                Todo.description.contains(query)
-            )
-        ).order_by(Todo.updated_at.desc()).limit(limit).all()
-        
-        context['data']['todos'] = [
-            {
-                'id': todo.id,
-                'title': todo.title,
-                'description': todo.description[:300] + '...' if len(todo.description) > 300 else todo.description,
-                'completed': todo.completed,
-                'priority': todo.priority,
-                'due_date': todo.due_date.isoformat() if todo.due_date else None
-            }
-            for todo in relevant_todos
-        ]
-        
-        # 计算总的相关项目数
-        total_items = len(context['data']['notes']) + len(context['data']['projects']) + len(context['data']['tasks']) + len(context['data']['todos'])
-        context['total_items'] = total_items
-        
-        return context if total_items > 0 else None
+        context = build_knowledge_context(query, limit, retrieval, CHAT_CONTEXT_EXCERPTS)
+        return context if context['total_items'] > 0 else None
         
     except Exception as e:
         print(f"搜索知识库时出错: {e}")
         return None
 
-def call_openrouter_api(message, history, api_key, model_name=None, knowledge_context=None):
-    """调用OpenRouter API获取AI回复"""
-    import requests
-    
-    # OpenRouter支持的高质量模型列表
-    available_models = {
-        "claude-3.5-sonnet": "anthropic/claude-3.5-sonnet",
-        "claude-3-opus": "anthropic/claude-3-opus",
-        "claude-3-haiku": "anthropic/claude-3-haiku",
-        "gpt-4o": "openai/gpt-4o",
-        "gpt-4-turbo": "openai/gpt-4-turbo",
-        "gemini-pro": "google/gemini-pro",
-        "llama-3.1-405b": "meta-llama/llama-3.1-405b-instruct",
-        "qwen-2.5-72b": "qwen/qwen-2.5-72b-instruct"
-    }
+def sse_event(data, event=None):
+    """格式化一条Server-Sent Events消息"""
+    prefix = f"event: {event}\n" if event else ''
+    return f"{prefix}data: {json_provider.dumps(data)}\n\n"
+
+# 上游失败时返回给用户的提示（同步接口和 async_chat.py 共用）；非流式回复前加“抱歉，”
+CHAT_REPLY_EMPTY = '我现在无法回复。请稍后再试。'
+CHAT_REPLY_UNAVAILABLE = 'AI服务暂时不可用。请稍后再试。'
+CHAT_REPLY_FAILED = '处理回复时出现错误。请稍后再试。'
+
+def fallback_reply(message):
+    """非流式接口出错时代替回复返回的文本"""
+    return f"抱歉，{message}"
+
+def completion_content(result):
+    """取出非流式响应中的回复文本，响应中没有choices时返回 None"""
+    if 'choices' in result and len(result['choices']) > 0:
+        return result['choices'][0]['message']['content']
+    return None
+
+def cache_reply(cache_key, data, content, start_time, cache_refs=()):
+    """把完整回复写入缓存，耗时从 start_time 算起；没有 cache_key 或回复为空时跳过"""
+    if cache_key and content:
+        chat_cache_put(cache_key, data['model'], content, (time.time() - start_time) * 1000, cache_refs)
+
+def delta_event(content):
+    return sse_event({'delta': content})
+
+def error_event(message):
+    return sse_event({'error': message}, event='error')
+
+def done_event(knowledge_used, context_usage, cached):
+    """流式回复结束时发送的done事件"""
+    return sse_event({
+        'done': True,
+        'timestamp': datetime.utcnow().isoformat(),
+        'knowledge_used': knowledge_used,
+        'context_tokens': context_usage,
+        'cached': cached
+    }, event='done')
+
+def cached_event_stream(response_text, knowledge_used, context_usage=None):
+    """以SSE格式一次性返回缓存的回复"""
+    yield delta_event(response_text)
+    yield done_event(knowledge_used, context_usage, cached=True)
+
+def chat_event_stream(headers, data, knowledge_used, context_usage=None, cache_key=None, cache_refs=()):
+    """把上游的回复逐段转换为SSE事件：delta事件携带文本片段，最后发送done或error事件
     
-    # 选择模型（默认使用Claude 3.5 Sonnet）
-    selected_model = available_models.get(model_name, "anthropic/claude-3.5-sonnet")
+    提供 cache_key 时，完整回复在流结束后写入缓存
+    """
+    start_time = time.time()
+    chunks = []
+    try:
+        for delta in stream_openrouter_api(headers, data):
+            chunks.append(delta)
+            yield delta_event(delta)
+    except requests.exceptions.RequestException as e:
+        print(f"流式请求错误: {e}")
+        yield error_event(CHAT_REPLY_UNAVAILABLE)
+        return
+    except Exception as e:
+        print(f"处理OpenRouter流式响应时出错: {e}")
+        yield error_event(CHAT_REPLY_FAILED)
+        return
     
-    # OpenRouter API配置
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost:5173",  # 你的应用URL
-        "X-Title": "AI Notebook"  # 你的应用名称（使用英文避免编码问题）
-    }
+    cache_reply(cache_key, data, ''.join(chunks), start_time, cache_refs)
+    yield done_event(knowledge_used, context_usage, cached=False)
+
+# OpenRouter接口地址（可指向本地的OpenAI兼容服务，如 fake_llm_server.py）
+OPENROUTER_API_URL = os.getenv('OPENROUTER_API_URL', 'https://openrouter.ai/api/v1/chat/completions')
+
+# OpenRouter HTTP客户端配置
+OPENROUTER_POOL_SIZE = int(os.getenv('OPENROUTER_POOL_SIZE', 10))  # 每个进程保持的keep-alive连接数
+OPENROUTER_MAX_RETRIES = int(os.getenv('OPENROUTER_MAX_RETRIES', 3))  # 429/5xx的最大重试次数
+OPENROUTER_RETRY_BACKOFF = float(os.getenv('OPENROUTER_RETRY_BACKOFF', 0.5))  # 指数退避基数（秒）
+OPENROUTER_CONNECT_TIMEOUT = float(os.getenv('OPENROUTER_CONNECT_TIMEOUT', 5))
+OPENROUTER_READ_TIMEOUT = float(os.getenv('OPENROUTER_READ_TIMEOUT', 30))  # 流式模式下为两个数据块之间的最长等待
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+# 上游连接统计：请求数和实际建立的TCP连接数（含断开后的重连）
+_http_stats = {'requests': 0, 'connects': 0}
+_http_stats_lock = threading.Lock()
+
+def _count_http_event(name):
+    with _http_stats_lock:
+        _http_stats[name] += 1
+
+class CountingHTTPConnection(HTTPConnection):
+    """记录每次实际建立TCP连接的HTTP连接"""
+    def connect(self):
+        _count_http_event('connects')
+        super().connect()
+
+class CountingHTTPSConnection(HTTPSConnection):
+    """记录每次实际建立TCP+TLS连接的HTTPS连接"""
+    def connect(self):
+        _count_http_event('connects')
+        super().connect()
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CountingHTTPConnection
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CountingHTTPSConnection
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """使用可统计连接数的连接池，并记录发出的请求数"""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool
+        }
     
-    # 构建消息历史
-    messages = []
+    def send(self, request, **kwargs):
+        _count_http_event('requests')
+        return super().send(request, **kwargs)
+
+def get_http_session():
+    """获取进程级共享的HTTP会话
     
-    # 构建系统提示，根据是否有知识库上下文进行调整
-    base_system_prompt = """你是一个高级AI助手，具备强大的知识库和推理能力。你的任务是：
+    复用keep-alive连接，避免每条消息都重新进行TCP+TLS握手；
+    对429和5xx按指数退避重试，并遵守 Retry-After 响应头。
+    会话在首次使用时创建，gunicorn fork出的每个worker各自持有连接池。
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                retry = Retry(
+                    total=OPENROUTER_MAX_RETRIES,
+                    connect=OPENROUTER_MAX_RETRIES,
+                    read=0,  # 已发出的请求读取超时后不重试，避免重复计费
+                    status=OPENROUTER_MAX_RETRIES,
+                    backoff_factor=OPENROUTER_RETRY_BACKOFF,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(['POST']),
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+                adapter = CountingHTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=OPENROUTER_POOL_SIZE,
+                    max_retries=retry
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+    return _http_session
+
+def http_pool_stats():
+    """统计当前进程发往上游的请求数、新建连接数和连接复用率"""
+    with _http_stats_lock:
+        requests_count = _http_stats['requests']
+        connections_count = _http_stats['connects']
+    
+    return {
+        'requests': requests_count,
+        'new_connections': connections_count,
+        'reused_requests': max(requests_count - connections_count, 0),
+        'reuse_rate': round(1 - connections_count / requests_count, 4) if requests_count else None,
+        'pool_size': OPENROUTER_POOL_SIZE
+    }
+
+def openrouter_post(headers, data, stream=False):
+    """通过共享会话向OpenRouter发送请求"""
+    return get_http_session().post(
+        OPENROUTER_API_URL,
+        headers=headers,
+        json=data,
+        stream=stream,
+        timeout=(OPENROUTER_CONNECT_TIMEOUT, OPENROUTER_READ_TIMEOUT)
+    )
+
+# OpenRouter支持的高质量模型列表
+OPENROUTER_MODELS = {
+    "claude-3.5-sonnet": "anthropic/claude-3.5-sonnet",
+    "claude-3-opus": "anthropic/claude-3-opus",
+    "claude-3-haiku": "anthropic/claude-3-haiku",
+    "gpt-4o": "openai/gpt-4o",
+    "gpt-4-turbo": "openai/gpt-4-turbo",
+    "gemini-pro": "google/gemini-pro",
+    "llama-3.1-405b": "meta-llama/llama-3.1-405b-instruct",
+    "qwen-2.5-72b": "qwen/qwen-2.5-72b-instruct"
+}
+
+def resolve_openrouter_model(model_name):
+    """把前端的模型名转换为OpenRouter模型ID（默认使用Claude 3.5 Sonnet）"""
+    return OPENROUTER_MODELS.get(model_name, "anthropic/claude-3.5-sonnet")
+
+# 聊天上下文token预算（知识库条目 + 历史对话，不含基础系统提示和当前消息）
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv('CHAT_CONTEXT_TOKEN_BUDGET', 6000))
+CHAT_KNOWLEDGE_SHARE = 0.6  # 历史对话不足时，剩余预算留给知识库条目，反之亦然
+CHAT_HISTORY_MAX_TURNS = 20
+CHAT_MAX_TOKENS = 2000  # 回复的最大token数
+
+CHAT_SYSTEM_PROMPT = """你是一个高级AI助手，具备强大的知识库和推理能力。你的任务是：
 
 1. **直接回答问题**：提供准确、详细、有用的答案，而不是仅仅给出建议
 2. **深度分析**：对复杂问题进行深入分析和解释
@@ -1234,90 +3706,216 @@ def call_openrouter_api(message, history, api_key, model_name=None, knowledge_co
 5. **知识整合**：结合相关知识点，提供有价值的补充信息
 
 请用中文回复，保持友善、专业的语气。如果遇到不确定的信息，请明确说明。"""
+
+KNOWLEDGE_SECTION_TITLES = {
+    'notes': '**相关笔记：**\n',
+    'projects': '**相关项目：**\n',
+    'tasks': '**相关任务：**\n',
+    'todos': '**相关待办事项：**\n'
+}
+
+def format_knowledge_item(entity, item):
+    """知识库条目在系统提示中的文本；正文放在最后，超出预算时从正文末尾截断"""
+    if entity == 'notes':
+        tags = f"  标签：{item['tags']}\n" if item['tags'] and item['tags'] != '[]' else ''
+        return f"- 标题：{item['title']}\n{tags}  内容：{item['content']}\n"
+    if entity == 'projects':
+        stats = item.get('stats', {})
+        return (
+            f"- 项目：{item['title']}\n"
+            f"  状态：{item['status']} | 优先级：{item['priority']}\n"
+            f"  任务统计：总计{stats.get('total_tasks', 0)}个，已完成{stats.get('completed_tasks', 0)}个\n"
+            f"  描述：{item['description']}\n"
+        )
+    if entity == 'tasks':
+        return (
+            f"- 任务：{item['title']}\n"
+            f"  状态：{item['status']} | 优先级：{item['priority']}\n"
+            f"  描述：{item['description']}\n"
+        )
+    status = "已完成" if item['completed'] else "未完成"
+    return (
+        f"- 待办：{item['title']}\n"
+        f"  状态：{status} | 优先级：{item['priority']}\n"
+        f"  描述：{item['description']}\n"
+    )
+
+def chat_history_messages(history):
+    """把前端的历史记录转换为消息列表（最近的 CHAT_HISTORY_MAX_TURNS 条）"""
+    messages = []
+    for item in (history or [])[-CHAT_HISTORY_MAX_TURNS:]:
+        if item.get('type') == 'user':
+            messages.append({"role": "user", "content": item.get('content', '')})
+        elif item.get('type') == 'assistant':
+            messages.append({"role": "assistant", "content": item.get('content', '')})
+    return messages
+
+def pack_chat_context(message, history, selected_model, knowledge_context=None, token_budget=None):
+    """在token预算内构建系统提示和历史消息
+    
+    知识库条目按融合排序依次放入（重叠的条目跳过，最后一条在句子边界截断），
+    历史对话从最近的一条往前放入。返回 (系统提示, 历史消息, 用量统计)
+    """
+    counter = context_budget.get_token_counter(selected_model)
+    window = context_budget.context_window(selected_model)
+    base_tokens = counter.count_message(CHAT_SYSTEM_PROMPT) + counter.count_message(message)
+    budget = token_budget if token_budget is not None else CHAT_CONTEXT_TOKEN_BUDGET
+    budget = max(0, min(budget, window - CHAT_MAX_TOKENS - base_tokens))
     
-    # 如果有知识库上下文，添加相关信息
+    # 历史对话先预留不超过 (1 - CHAT_KNOWLEDGE_SHARE) 的预算，用不完的部分留给知识库
+    history_messages = chat_history_messages(history)
+    history_costs = [counter.count_message(item['content']) for item in history_messages]
+    history_reserve = min(sum(history_costs), int(budget * (1 - CHAT_KNOWLEDGE_SHARE)))
+    
+    items = []
     if knowledge_context and knowledge_context.get('total_items', 0) > 0:
-        context_info = "\n\n**重要：我已经为你搜索了用户的个人知识库，以下是相关信息：**\n\n"
-        
-        # 添加笔记信息
-        if knowledge_context['data'].get('notes'):
-            context_info += "**相关笔记：**\n"
-            for note in knowledge_context['data']['notes']:
-                context_info += f"- 标题：{note['title']}\n"
-                context_info += f"  内容：{note['content']}\n"
-                if note['tags'] and note['tags'] != '[]':
-                    context_info += f"  标签：{note['tags']}\n"
-                context_info += "\n"
-        
-        # 添加项目信息
-        if knowledge_context['data'].get('projects'):
-            context_info += "**相关项目：**\n"
-            for project in knowledge_context['data']['projects']:
-                context_info += f"- 项目：{project['title']}\n"
-                context_info += f"  描述：{project['description']}\n"
-                context_info += f"  状态：{project['status']} | 优先级：{project['priority']}\n"
-                stats = project.get('stats', {})
-                context_info += f"  任务统计：总计{stats.get('total_tasks', 0)}个，已完成{stats.get('completed_tasks', 0)}个\n\n"
-        
-        # 添加任务信息
-        if knowledge_context['data'].get('tasks'):
-            context_info += "**相关任务：**\n"
-            for task in knowledge_context['data']['tasks']:
-                context_info += f"- 任务：{task['title']}\n"
-                context_info += f"  描述：{task['description']}\n"
-                context_info += f"  状态：{task['status']} | 优先级：{task['priority']}\n\n"
-        
-        # 添加待办事项信息
-        if knowledge_context['data'].get('todos'):
-            context_info += "**相关待办事项：**\n"
-            for todo in knowledge_context['data']['todos']:
-                status = "已完成" if todo['completed'] else "未完成"
-                context_info += f"- 待办：{todo['title']}\n"
-                context_info += f"  描述：{todo['description']}\n"
-                context_info += f"  状态：{status} | 优先级：{todo['priority']}\n\n"
-        
-        context_info += "**请基于以上用户的个人信息来回答问题，提供个性化和具体的建议。如果问题与这些信息相关，请直接引用和分析这些内容。**"
-        
-        system_prompt = base_system_prompt + context_info
-    else:
-        system_prompt = base_system_prompt
+        data = knowledge_context['data']
+        items_by_key = {(entity, item['id']): item for entity in data for item in data[entity]}
+        ranked = knowledge_context.get('ranked') or [{'type': entity, 'id': item_id} for entity, item_id in items_by_key]
+        for ref in ranked:
+            key = (ref['type'], ref['id'])
+            if key in items_by_key:
+                items.append((key, format_knowledge_item(key[0], items_by_key[key])))
     
-    # 添加系统提示
-    messages.append({
-        "role": "system", 
-        "content": system_prompt
-    })
+    context_parts = []
+    packed = []
+    knowledge_tokens = 0
+    skipped = []
+    if items:
+        header = "\n\n**重要：我已经为你搜索了用户的个人知识库，以下是相关信息：**\n\n"
+        footer = "**请基于以上用户的个人信息来回答问题，提供个性化和具体的建议。如果问题与这些信息相关，请直接引用和分析这些内容。**"
+        frame_tokens = counter.count(header + footer) + sum(counter.count(title) for title in KNOWLEDGE_SECTION_TITLES.values())
+        knowledge_budget = budget - history_reserve - frame_tokens
+        packed, knowledge_tokens, skipped = context_budget.pack_items(items, knowledge_budget, counter)
+        
+        if packed:
+            knowledge_tokens += frame_tokens
+            context_parts.append(header)
+            for entity, title in KNOWLEDGE_SECTION_TITLES.items():
+                entity_texts = [text for (item_entity, _), text in packed if item_entity == entity]
+                if entity_texts:
+                    context_parts.append(title)
+                    context_parts.extend(text.rstrip('\n') + "\n\n" for text in entity_texts)
+            context_parts.append(footer)
     
-    # 添加历史对话（最近10条）
-    if history:
-        for item in history[-10:]:  # 只保留最近10条对话
-            if item.get('type') == 'user':
-                messages.append({"role": "user", "content": item.get('content', '')})
-            elif item.get('type') == 'assistant':
-                messages.append({"role": "assistant", "content": item.get('content', '')})
+    # 剩余预算从最近的一条开始放入历史对话
+    history_budget = budget - knowledge_tokens
+    history_tokens = 0
+    kept = 0
+    for cost in reversed(history_costs):
+        if history_tokens + cost > history_budget:
+            break
+        history_tokens += cost
+        kept += 1
+    history_messages = history_messages[len(history_messages) - kept:]
     
-    # 添加当前用户消息
+    system_prompt = CHAT_SYSTEM_PROMPT + ''.join(context_parts)
+    usage = {
+        'model': selected_model,
+        'budget': budget,
+        'used': knowledge_tokens + history_tokens,
+        'knowledge_tokens': knowledge_tokens,
+        'history_tokens': history_tokens,
+        'prompt_tokens': counter.count_message(system_prompt) + history_tokens + counter.count_message(message),
+        'context_window': window,
+        'knowledge_items': {'included': len(packed), 'skipped': len(skipped), 'total': len(items)},
+        'history_turns': {'included': kept, 'total': len(history or [])},
+        'estimated': counter.encoding is None
+    }
+    return system_prompt, history_messages, usage
+
+def build_openrouter_request(message, history, api_key, model_name=None, knowledge_context=None, stream=False,
+                             token_budget=None):
+    """构建OpenRouter请求，返回 (headers, 请求数据, 上下文token用量)"""
+    selected_model = resolve_openrouter_model(model_name)
+    
+    # OpenRouter API配置
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "http://localhost:5173",  # 你的应用URL
+        "X-Title": "AI Notebook"  # 你的应用名称（使用英文避免编码问题）
+    }
+    
+    # 系统提示（含知识库上下文）和历史对话按token预算装入
+    system_prompt, history_messages, usage = pack_chat_context(
+        message, history, selected_model, knowledge_context, token_budget
+    )
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(history_messages)
     messages.append({"role": "user", "content": message})
     
     # API请求数据 - 使用OpenRouter的高质量模型
     data = {
         "model": selected_model,  # 使用动态选择的模型
         "messages": messages,
-        "max_tokens": 2000,  # 增加最大token数以获得更详细的回答
+        "max_tokens": CHAT_MAX_TOKENS,  # 增加最大token数以获得更详细的回答
         "temperature": 0.7,  # 保持适度的创造性
         "top_p": 0.9,  # 优化采样策略
         "frequency_penalty": 0.1,  # 轻微减少重复
         "presence_penalty": 0.1,  # 鼓励话题多样性
-        "stream": False  # 确保获得完整回复
+        "stream": stream  # 非流式调用时确保获得完整回复
     }
     
+    return headers, data, usage
+
+def stream_request_data(data):
+    """流式请求的请求数据：打开 build_openrouter_request 所构建请求的 stream"""
+    return dict(data, stream=True)
+
+def parse_stream_line(line):
+    """解析上游SSE流的一行，返回其中的回复文本片段（没有时返回 None）"""
+    line = line.strip()
+    # 跳过空行和注释行（OpenRouter会发送 ": OPENROUTER PROCESSING" 保活）
+    if not line.startswith('data:'):
+        return None
+    
+    payload = line[len('data:'):].strip()
+    if payload == '[DONE]':
+        return None
+    
+    choices = json.loads(payload).get('choices') or []
+    if not choices:
+        return None
+    return (choices[0].get('delta') or {}).get('content')
+
+def stream_openrouter_api(headers, data):
+    """流式调用OpenRouter API（data 由 build_openrouter_request 构建），逐段生成回复文本，并记录首个token的延迟"""
+    data = stream_request_data(data)
+    
+    print(f"发送流式请求到OpenRouter API，模型: {data['model']}")
+    start_time = time.time()
+    first_token_time = None
+    total_length = 0
+    
+    with openrouter_post(headers, data, stream=True) as response:
+        response.raise_for_status()
+        
+        for raw_line in response.iter_lines():
+            # 不在 [DONE] 处提前退出：读完响应体后连接才能放回连接池复用
+            content = parse_stream_line(raw_line.decode('utf-8'))
+            if not content:
+                continue
+            
+            if first_token_time is None:
+                first_token_time = time.time()
+                print(f"首个token延迟: {(first_token_time - start_time) * 1000:.0f}ms")
+            total_length += len(content)
+            yield content
+    
+    print(f"流式回复完成，长度: {total_length}，总耗时: {(time.time() - start_time) * 1000:.0f}ms")
+
+def call_openrouter_api(headers, data, cache_key=None, cache_refs=()):
+    """调用OpenRouter API获取AI回复（data 由 build_openrouter_request 构建），提供 cache_key 时成功的回复写入缓存"""
+    start_time = time.time()
+    
     try:
         print(f"发送请求到OpenRouter API...")
-        print(f"请求URL: {url}")
+        print(f"请求URL: {OPENROUTER_API_URL}")
         print(f"请求模型: {data['model']}")
         
         # 确保请求数据中的中文字符正确编码
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        response = openrouter_post(headers, data)
         print(f"响应状态码: {response.status_code}")
         
         response.raise_for_status()
@@ -1325,26 +3923,197 @@ def call_openrouter_api(message, history, api_key, model_name=None, knowledge_co
         result = response.json()
         print(f"API响应结构: {list(result.keys()) if isinstance(result, dict) else 'Not a dict'}")
         
-        if 'choices' in result and len(result['choices']) > 0:
-            content = result['choices'][0]['message']['content']
-            print(f"成功获取回复，长度: {len(content)}")
-            return content
-        else:
+        content = completion_content(result)
+        if content is None:
             print(f"API响应中没有choices或choices为空: {result}")
-            return "抱歉，我现在无法回复。请稍后再试。"
+            return fallback_reply(CHAT_REPLY_EMPTY)
+        
+        print(f"成功获取回复，长度: {len(content)}")
+        cache_reply(cache_key, data, content, start_time, cache_refs)
+        return content
             
     except requests.exceptions.HTTPError as e:
         print(f"HTTP错误: {e}")
         print(f"响应内容: {response.text if 'response' in locals() else 'No response'}")
-        return "抱歉，AI服务暂时不可用。请稍后再试。"
+        return fallback_reply(CHAT_REPLY_UNAVAILABLE)
     except requests.exceptions.RequestException as e:
         print(f"请求错误: {e}")
-        return "抱歉，AI服务暂时不可用。请稍后再试。"
+        return fallback_reply(CHAT_REPLY_UNAVAILABLE)
     except Exception as e:
         print(f"处理OpenRouter响应时出错: {e}")
         import traceback
         traceback.print_exc()
-        return "抱歉，处理回复时出现错误。请稍后再试。"
+        return fallback_reply(CHAT_REPLY_FAILED)
+
+# 数据库迁移与查询计划检查
+AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', 'true').lower() in ('1', 'true', 'yes')  # 启动时执行未执行的迁移
+FTS_TOKENIZER = os.getenv('FTS_TOKENIZER', search_tokenizer.DEFAULT_TOKENIZER)  # 首次创建全文搜索表时的分词模式
+
+def run_migrations():
+    """在应用的数据库上执行未执行的迁移，返回本次执行的 [(版本号, 名称)]"""
+    connection = db.engine.raw_connection()
+    try:
+        return migrations.upgrade(connection.driver_connection, FTS_TOKENIZER)
+    finally:
+        connection.close()
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """创建数据表并执行未执行的迁移（部署时运行一次）"""
+    db.create_all()
+    executed = run_migrations()
+    for version, name in executed:
+        print(f"  [{version:03d}] {name} ✓")
+    print(f"✅ 数据库已是最新版本（本次执行 {len(executed)} 个迁移）")
+
+@app.cli.command('compress-notes')
+@click.option('--threshold', type=int, default=None, help='压缩阈值（字节），默认为 NOTE_COMPRESS_THRESHOLD')
+@click.option('--batch-size', type=int, default=200, show_default=True, help='每个事务改写的笔记数')
+@click.option('--pause', type=float, default=0.0, show_default=True, help='每批之间暂停的秒数')
+def compress_notes_command(threshold, batch_size, pause):
+    """按压缩阈值重新编码已有笔记的正文：压缩超过阈值的原文，还原低于阈值的压缩正文
+
+    按id分批读取，每批在单独的短事务中改写，运行期间应用可以继续读写；
+    改写时比较读取到的旧值，期间被修改的笔记已由新的写入按阈值编码，直接跳过。
+    只改变存储形式，不修改 updated_at、不记录修订（全文索引、数据版本和变更日志的触发器仍会执行）
+    """
+    threshold = NOTE_COMPRESS_THRESHOLD if threshold is None else threshold
+    select_batch = db.text("SELECT id, content FROM notes WHERE id > :last_id ORDER BY id LIMIT :limit")
+    update_note = db.text("UPDATE notes SET content = :content WHERE id = :id AND content = :stored")
+
+    last_id = 0
+    scanned = rewritten = 0
+    bytes_before = bytes_after = 0
+    while True:
+        rows = db.session.execute(select_batch, {'last_id': last_id, 'limit': batch_size}).all()
+        db.session.commit()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        scanned += len(rows)
+
+        updates = []
+        for row in rows:
+            encoded = compression.encode_content(compression.note_text(row.content), threshold)
+            if type(encoded) is not type(row.content):
+                updates.append({'id': row.id, 'content': encoded, 'stored': row.content})
+        if updates:
+            result = db.session.execute(update_note, updates)
+            db.session.commit()
+            rewritten += result.rowcount
+            bytes_before += sum(compression.stored_size(item['stored']) for item in updates)
+            bytes_after += sum(compression.stored_size(item['content']) for item in updates)
+        print(f"已检查 {scanned} 条笔记，改写 {rewritten} 条")
+        if pause:
+            time.sleep(pause)
+
+    print(
+        f"✅ 完成：改写 {rewritten} 条笔记，正文 {bytes_before / 1024 / 1024:.1f} MB -> {bytes_after / 1024 / 1024:.1f} MB"
+        f"（阈值 {threshold} 字节；释放的页会被复用，数据库文件需 VACUUM 才会缩小）"
+    )
+
+def route_queries():
+    """各接口的代表性查询：接口 -> SQLAlchemy查询语句
+    
+    供部署前对实际数据库检查；tests/test_query_plans.py 检查的是测试请求实际执行的SQL
+    """
+    now = datetime.utcnow()
+    queue = IndexQueueItem.__table__
+    change_log = db.table(migrations.CHANGE_LOG_TABLE, db.column('seq'))
+    return {
+        'GET /api/notes': Note.query.order_by(Note.updated_at.desc(), Note.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/notes?cursor=': Note.query.filter(db.tuple_(Note.updated_at, Note.id) < (now, 1))
+            .order_by(Note.updated_at.desc(), Note.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/notes?tag=': Note.query.filter(unindexed_column(Note.id).in_(tagged_note_ids(['工作'])))
+            .order_by(Note.updated_at.desc(), Note.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/notes/<id>': Note.query.filter(Note.id == 1),
+        'GET /api/notes/<id>/revisions': NoteRevision.query.filter(NoteRevision.note_id == 1)
+            .order_by(NoteRevision.rev.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/notes/<id>?at=': NoteRevision.query.filter(NoteRevision.note_id == 1, NoteRevision.created_at <= now)
+            .order_by(NoteRevision.created_at.desc(), NoteRevision.id.desc()).limit(1),
+        'GET /api/tags': db.select(tags_table.c.name, db.func.count()).select_from(
+            tags_table.join(note_tags_table, note_tags_table.c.tag_id == tags_table.c.id)
+        ).group_by(tags_table.c.name),
+        'GET /api/todos': Todo.query.order_by(Todo.created_at.desc(), Todo.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/todos?cursor=': Todo.query.filter(db.tuple_(Todo.created_at, Todo.id) < (now, 1))
+            .order_by(Todo.created_at.desc(), Todo.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/projects': Project.query.order_by(Project.updated_at.desc(), Project.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/projects/<id>/tasks': Task.query.filter(Task.project_id == 1)
+            .order_by(Task.created_at.desc(), Task.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/todos?completed=&sort=due_date': Todo.query.filter(Todo.completed.is_(False))
+            .order_by(Todo.due_date.asc(), Todo.id.asc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/todos?due_before=&sort=due_date': Todo.query.filter(Todo.due_date < now)
+            .order_by(Todo.due_date.desc(), Todo.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/todos?completed=': Todo.query.filter(Todo.completed.is_(True))
+            .order_by(Todo.created_at.desc(), Todo.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/todos?count_only=': Todo.query.with_entities(Todo.completed, Todo.priority, db.func.count())
+            .group_by(Todo.completed, Todo.priority),
+        'GET /api/projects/<id>/tasks?status=': Task.query.filter(Task.project_id == 1, Task.status.in_(['todo']))
+            .order_by(Task.created_at.desc(), Task.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/projects/<id>/tasks?assignee=': Task.query.filter(Task.project_id == 1, Task.assignee.in_(['张三']))
+            .order_by(Task.created_at.desc(), Task.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/projects/<id>/tasks?sort=due_date': Task.query.filter(Task.project_id == 1)
+            .order_by(Task.due_date.asc(), Task.id.asc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/projects/<id>/tasks?count_only=': Task.query.filter(Task.project_id == 1)
+            .with_entities(Task.status, Task.priority, db.func.count()).group_by(Task.status, Task.priority),
+        'GET /api/tasks': Task.query.order_by(Task.created_at.desc(), Task.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/tasks?include=project': Task.query.join(Project, Task.project_id == Project.id)
+            .with_entities(Task.id, Project.title).order_by(Task.created_at.desc(), Task.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/tasks?assignee=': Task.query.filter(Task.assignee.in_(['张三']))
+            .order_by(Task.created_at.desc(), Task.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/tasks?status=': Task.query.filter(Task.status.in_(['todo']))
+            .order_by(Task.created_at.desc(), Task.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/tasks?status=a,b': Task.query.filter(in_filter(Task.status, ['todo', 'in_progress']))
+            .order_by(Task.created_at.desc(), Task.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/tasks?due_before=&sort=due_date': Task.query.filter(Task.due_date < now)
+            .order_by(Task.due_date.desc(), Task.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/tasks?sort=updated_at': Task.query.order_by(Task.updated_at.desc(), Task.id.desc()).limit(DEFAULT_PAGE_SIZE),
+        'GET /api/tasks?count_only=': Task.query.with_entities(Task.status, Task.priority, db.func.count())
+            .group_by(Task.status, Task.priority),
+        'project_task_stats': db.session.query(Task.project_id, Task.status, db.func.count(Task.id))
+            .filter(Task.project_id.in_([1, 2])).group_by(Task.project_id, Task.status),
+        'GET /api/sync': db.select(change_log).where(change_log.c.seq > 1, db.literal_column('+entity').in_(['notes', 'todos']))
+            .order_by(change_log.c.seq).limit(SYNC_DEFAULT_LIMIT),
+        'invalidate_chat_cache': db.select(ChatCacheRef.cache_key)
+            .where(ChatCacheRef.entity == 'notes', ChatCacheRef.entity_id == 1),
+        'claim_index_batch': db.select(queue.c.id).where(
+            queue.c.attempts < INDEX_MAX_ATTEMPTS,
+            db.or_(queue.c.locked_until.is_(None), queue.c.locked_until < now)
+        ).order_by(queue.c.enqueued_at).limit(INDEX_BATCH_SIZE)
+    }
+
+def explain_query_plan(statement):
+    """返回查询的 EXPLAIN QUERY PLAN 结果（每行一个步骤）"""
+    if hasattr(statement, 'statement'):
+        statement = statement.statement
+    compiled = statement.compile(db.engine, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    return [row[-1] for row in rows]
+
+def unindexed_steps(plan):
+    """查询计划中的全表扫描（未使用索引的 SCAN 表）和临时排序"""
+    problems = []
+    for step in plan:
+        if step.startswith('SCAN ') and ' USING ' not in step and 'VIRTUAL TABLE' not in step:
+            problems.append(step)
+        elif 'USE TEMP B-TREE' in step:
+            problems.append(step)
+    return problems
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """检查各接口的查询都使用了索引，存在全表扫描或临时排序时以非零状态退出"""
+    failures = 0
+    for route, statement in route_queries().items():
+        plan = explain_query_plan(statement)
+        problems = unindexed_steps(plan)
+        print(f"{'❌' if problems else '✓'} {route}: {' | '.join(plan)}")
+        failures += bool(problems)
+    if failures:
+        print(f"❌ {failures} 个查询未使用索引")
+        raise SystemExit(1)
+    print("✅ 所有查询都使用了索引")
 
 # 错误处理
 @app.errorhandler(404)
@@ -1365,6 +4134,9 @@ def internal_error(error):
 # 创建数据库表
 with app.app_context():
     db.create_all()
+    if AUTO_MIGRATE:
+        for version, name in run_migrations():
+            print(f'已执行数据库迁移 [{version:03d}] {name}')
     
     # 创建示例数据（如果表是空的）
     if Note.query.count() == 0:
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ASGI入口
+长连接接口在事件循环中处理，其余接口交给线程池中的Flask应用（行为与 `gunicorn app:app` 相同）：
+
+- GET /api/events：数据变更的SSE推送（见 events.py），每个订阅者只是一个协程
+- GET /api/events/stats：当前订阅者数和已发布的变更
+- POST /api/chat：等待上游回复期间不占用线程（见 async_chat.py），ASYNC_CHAT=false 时仍由Flask处理
+
+用法：
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+    gunicorn asgi:application（railway.toml / Procfile，worker见 gunicorn.conf.py）
+"""
+
+import asyncio
+import os
+from fnmatch import fnmatch
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import async_chat
+import events
+from async_chat import send_json
+from app import EXPORT_MODELS, allowed_origins, app, latest_change_seq, parse_entity_types, read_changes
+
+# 执行Flask接口的线程数，与 gunicorn 的线程数一致（数据库连接池按此计算）
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', os.getenv('GUNICORN_THREADS', 4)))
+EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', events.POLL_INTERVAL))
+ASYNC_CHAT = os.getenv('ASYNC_CHAT', 'true').lower() in ('1', 'true', 'yes')
+
+def fetch_changes(since, limit):
+    with app.app_context():
+        return read_changes(since, list(EXPORT_MODELS), limit)
+
+def fetch_latest_seq():
+    with app.app_context():
+        return latest_change_seq()
+
+hub = events.EventHub(fetch_changes, fetch_latest_seq, EVENTS_POLL_INTERVAL)
+wsgi_application = WSGIMiddleware(app, workers=WSGI_THREADS)
+
+@event.listens_for(Session, 'after_commit')
+def notify_event_hub(session):
+    hub.notify()
+
+def request_headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+def cors_headers(headers):
+    """与 app.py 中 Flask-CORS 的来源配置一致"""
+    origin = headers.get('origin')
+    if origin and any(fnmatch(origin, pattern) for pattern in allowed_origins):
+        return [
+            (b'access-control-allow-origin', origin.encode('latin-1')),
+            (b'access-control-allow-credentials', b'true'),
+            (b'vary', b'Origin')
+        ]
+    return []
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def events_endpoint(scope, receive, send):
+    """GET /api/events?types=notes,todos&since=<seq>（或 Last-Event-ID 请求头）"""
+    headers = request_headers(scope)
+    params = parse_qs(scope['query_string'].decode('latin-1'))
+    cors = cors_headers(headers)
+    try:
+        types = parse_entity_types(params.get('types', [''])[0])
+        since = headers.get('last-event-id') or params.get('since', [None])[0]
+        since = int(since) if since is not None else None
+    except ValueError as e:
+        await send_json(send, 400, {'success': False, 'error': str(e)}, cors)
+        return
+
+    try:
+        await hub.start()
+    except Exception as e:
+        await send_json(send, 500, {'success': False, 'error': str(e)}, cors)
+        return
+
+    subscriber = hub.subscribe(types)
+
+    async def pump():
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no')  # 禁止nginx等代理缓冲
+            ] + cors
+        })
+        async for message in hub.stream(subscriber, since):
+            await send({'type': 'http.response.body', 'body': message, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    pump_task = asyncio.ensure_future(pump())
+    disconnect_task = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({pump_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        hub.unsubscribe(subscriber)
+        for task in (pump_task, disconnect_task):
+            task.cancel()
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await hub.stop()
+            await async_chat.close_async_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        if scope['path'] == '/api/events':
+            await events_endpoint(scope, receive, send)
+            return
+        if scope['path'] == '/api/events/stats':
+            await send_json(send, 200, {'success': True, 'data': hub.stats()}, cors_headers(request_headers(scope)))
+            return
+
+    if ASYNC_CHAT and scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/api/chat':
+        await async_chat.chat_endpoint(scope, receive, send, cors_headers(request_headers(scope)))
+        return
+
+    await wsgi_application(scope, receive, send)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步聊天接口（asgi.py 中的 POST /api/chat）
+同步的 chat() 在整个OpenRouter往返期间（最长30秒）占用一个gunicorn线程，
+几个慢请求就会让同一进程的增删改查请求排队。这里把等待上游的部分放到事件循环中：
+
+- 解析请求、知识库检索、构建请求和查询缓存与同步接口相同（app.prepare_chat），在线程池中执行，耗时很短
+- 上游请求使用进程级共享的 httpx.AsyncClient（keep-alive连接池），等待期间不占用线程
+- 回复写入缓存同样在线程池中执行
+
+只有发送请求和读取响应是异步实现的；构建请求、解析数据块、取出回复、错误提示、SSE事件和写入缓存
+都调用 app 中同步接口所用的函数，请求参数、响应格式和错误信息与同步接口一致。
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+
+import json_provider
+from app import (
+    CHAT_REPLY_EMPTY, CHAT_REPLY_FAILED, CHAT_REPLY_UNAVAILABLE, OPENROUTER_API_URL, OPENROUTER_CONNECT_TIMEOUT,
+    OPENROUTER_MAX_RETRIES, OPENROUTER_POOL_SIZE, OPENROUTER_READ_TIMEOUT, OPENROUTER_RETRY_BACKOFF,
+    ChatRequestError, app, cache_reply, cached_event_stream, chat_result, completion_content, delta_event,
+    done_event, error_event, fallback_reply, parse_stream_line, prepare_chat, stream_request_data
+)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRY_AFTER = 30  # 秒，Retry-After 超过此值时不再等待
+
+_client = None
+
+def get_async_client():
+    """进程级共享的异步HTTP客户端（在事件循环中首次使用时创建）"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=OPENROUTER_POOL_SIZE),
+            timeout=httpx.Timeout(OPENROUTER_READ_TIMEOUT, connect=OPENROUTER_CONNECT_TIMEOUT),
+            transport=httpx.AsyncHTTPTransport(retries=OPENROUTER_MAX_RETRIES)  # 只重试建立连接
+        )
+    return _client
+
+async def close_async_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def retry_delay(response, attempt):
+    """与同步客户端相同：遵守 Retry-After，否则按指数退避"""
+    retry_after = response.headers.get('retry-after')
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), MAX_RETRY_AFTER)
+    return OPENROUTER_RETRY_BACKOFF * (2 ** attempt)
+
+async def openrouter_send(headers, data, stream=False):
+    """发送上游请求，对429和5xx按退避重试；返回未读取响应体的 httpx.Response，调用方负责关闭"""
+    client = get_async_client()
+    attempt = 0
+    while True:
+        request = client.build_request('POST', OPENROUTER_API_URL, headers=headers, json=data)
+        response = await client.send(request, stream=stream)
+        if response.status_code not in RETRY_STATUSES or attempt >= OPENROUTER_MAX_RETRIES:
+            return response
+        await response.aclose()
+        await asyncio.sleep(retry_delay(response, attempt))
+        attempt += 1
+
+def in_app_context(func, *args, **kwargs):
+    """在线程中以应用上下文执行同步函数（数据库会话在上下文结束时归还连接）"""
+    with app.app_context():
+        return func(*args, **kwargs)
+
+async def call_openrouter(headers, data, cache_key=None, cache_refs=()):
+    """异步版的 app.call_openrouter_api，只有发送请求不同，解析回复和写入缓存共用 app 中的函数"""
+    start_time = time.time()
+    try:
+        response = await openrouter_send(headers, data)
+        try:
+            response.raise_for_status()
+            result = response.json()
+        finally:
+            await response.aclose()
+
+        content = completion_content(result)
+        if content is None:
+            print(f"API响应中没有choices或choices为空: {result}")
+            return fallback_reply(CHAT_REPLY_EMPTY)
+        await asyncio.to_thread(in_app_context, cache_reply, cache_key, data, content, start_time, cache_refs)
+        return content
+
+    except httpx.HTTPError as e:
+        print(f"请求错误: {e}")
+        return fallback_reply(CHAT_REPLY_UNAVAILABLE)
+    except Exception as e:
+        print(f"处理OpenRouter响应时出错: {e}")
+        return fallback_reply(CHAT_REPLY_FAILED)
+
+async def chat_event_stream(plan):
+    """异步版的 app.chat_event_stream：逐段转发上游回复为SSE事件"""
+    data = stream_request_data(plan['payload'])
+    start_time = time.time()
+    chunks = []
+    try:
+        response = await openrouter_send(plan['headers'], data, stream=True)
+        try:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                content = parse_stream_line(line)
+                if content:
+                    chunks.append(content)
+                    yield delta_event(content)
+        finally:
+            await response.aclose()
+    except httpx.HTTPError as e:
+        print(f"流式请求错误: {e}")
+        yield error_event(CHAT_REPLY_UNAVAILABLE)
+        return
+    except Exception as e:
+        print(f"处理OpenRouter流式响应时出错: {e}")
+        yield error_event(CHAT_REPLY_FAILED)
+        return
+
+    await asyncio.to_thread(
+        in_app_context, cache_reply, plan['cache_key'], data, ''.join(chunks), start_time, plan['cache_refs']
+    )
+    yield done_event(plan['knowledge_used'], plan['context_usage'], cached=False)
+
+async def iterate_events(events):
+    """把同步生成的SSE事件（如 app.cached_event_stream）交给 send_event_stream"""
+    for message in events:
+        yield message
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+async def send_response(send, status, body, content_type, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())] + list(headers)
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def send_json(send, status, data, headers=()):
+    await send_response(send, status, json_provider.dumps(data).encode('utf-8'), b'application/json', headers)
+
+async def send_event_stream(send, events, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')  # 禁止反向代理缓冲
+        ] + list(headers)
+    })
+    async for message in events:
+        await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def chat_endpoint(scope, receive, send, headers=()):
+    """POST /api/chat 的ASGI处理函数；headers 为附加的响应头（CORS）"""
+    body = await read_body(receive)
+    if body is None:
+        return
+
+    try:
+        plan = await asyncio.to_thread(in_app_context, prepare_chat, json.loads(body or b'null'))
+    except ChatRequestError as e:
+        await send_json(send, e.status_code, {'error': str(e)}, headers)
+        return
+    except Exception as e:
+        print(f'聊天接口出错: {str(e)}')
+        await send_json(send, 500, {'error': '聊天服务暂时不可用'}, headers)
+        return
+
+    if plan['cached_response'] is not None:
+        if plan['stream']:
+            events = cached_event_stream(plan['cached_response'], plan['knowledge_used'], plan['context_usage'])
+            await send_event_stream(send, iterate_events(events), headers)
+        else:
+            await send_json(send, 200, chat_result(plan['cached_response'], plan, cached=True), headers)
+        return
+
+    if plan['stream']:
+        await send_event_stream(send, chat_event_stream(plan), headers)
+        return
+
+    response_text = await call_openrouter(
+        plan['headers'], plan['payload'], cache_key=plan['cache_key'], cache_refs=plan['cache_refs']
+    )
+    await send_json(send, 200, chat_result(response_text, plan, cached=False), headers)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量接口基准测试
+用 Flask 测试客户端在临时数据库上比较逐条请求与批量接口（/api/<类型>/batch）的吞吐量：
+
+- 创建笔记：POST /api/notes 逐条 vs POST /api/notes/batch
+- 更新待办：PUT /api/todos/<id> 逐条 vs PATCH /api/todos/batch
+- 删除任务：DELETE /api/tasks/<id> 逐条 vs DELETE /api/tasks/batch
+
+测试客户端不经过网络，因此结果只反映每次请求的处理和事务提交开销，
+实际部署中逐条请求还要加上每次的网络往返。
+
+用法：
+    python benchmark_batch.py --items 1000 --batch-size 200
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def check(response):
+    assert response.status_code < 400, response.get_json()
+    return response.get_json().get('data')
+
+def create_rows(client, path, items, batch_size):
+    """用批量接口准备测试数据，返回新建的id列表"""
+    ids = []
+    for chunk in chunks(items, batch_size):
+        ids.extend(result['id'] for result in check(client.post(path, json={'items': chunk}))['results'])
+    return ids
+
+def run(client, item_count, batch_size):
+    """返回 [(操作, 逐条耗时, 批量耗时)]"""
+    rows = []
+
+    notes = [{'title': f'笔记 {i}', 'content': f'基准测试内容 {i}', 'tags': ['benchmark']} for i in range(item_count)]
+    single = timed(lambda: [check(client.post('/api/notes', json=note)) for note in notes])
+    batch = timed(lambda: create_rows(client, '/api/notes/batch', notes, batch_size))
+    rows.append(('创建笔记', single, batch))
+
+    todos = [{'title': f'待办 {i}', 'priority': 'low'} for i in range(item_count)]
+    todo_ids = create_rows(client, '/api/todos/batch', todos, batch_size)
+    updates = [{'id': todo_id, 'completed': True, 'priority': 'high'} for todo_id in todo_ids]
+    single = timed(lambda: [check(client.put(f"/api/todos/{item['id']}", json=item)) for item in updates])
+    batch = timed(lambda: [check(client.patch('/api/todos/batch', json={'items': chunk})) for chunk in chunks(updates, batch_size)])
+    rows.append(('更新待办', single, batch))
+
+    project = check(client.post('/api/projects', json={'name': '批量接口基准测试'}))
+    tasks = [{'title': f'任务 {i}', 'project_id': project['id']} for i in range(item_count)]
+    task_ids = create_rows(client, '/api/tasks/batch', tasks, batch_size)
+    single = timed(lambda: [check(client.delete(f'/api/tasks/{task_id}')) for task_id in task_ids])
+    task_ids = create_rows(client, '/api/tasks/batch', tasks, batch_size)
+    batch = timed(lambda: [check(client.delete('/api/tasks/batch', json={'ids': chunk})) for chunk in chunks(task_ids, batch_size)])
+    rows.append(('删除任务', single, batch))
+
+    return rows
+
+def print_results(rows, item_count, batch_size):
+    """打印结果表"""
+    print(f"\n📊 {item_count} 条数据，每批 {batch_size} 条")
+    print(f"{'操作':<6} {'逐条(条/秒)':>12} {'批量(条/秒)':>12} {'提升':>7}")
+    for operation, single, batch in rows:
+        print(f"{operation:<6} {item_count / single:>12.0f} {item_count / batch:>12.0f} {single / batch:>6.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较逐条请求与批量接口的吞吐量')
+    parser.add_argument('--items', type=int, default=1000, help='每种操作的数据条数')
+    parser.add_argument('--batch-size', type=int, default=200, help='每次批量请求的条数')
+    args = parser.parse_args()
+
+    print("=== AI记事本批量接口基准测试 ===")
+
+    workdir = tempfile.mkdtemp(prefix='notes-batch-bench-')
+    # 必须在导入 app 之前设置：使用临时数据库，不启动后台索引线程
+    os.environ['SQLITE_PATH'] = os.path.join(workdir, 'notes.db')
+    os.environ['VECTOR_INDEX_DIR'] = os.path.join(workdir, 'vector_index')
+    os.environ['INDEX_WORKER_ENABLED'] = 'false'
+    try:
+        from app import app
+
+        rows = run(app.test_client(), args.items, args.batch_size)
+        print_results(rows, args.items, args.batch_size)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+聊天并发基准测试
+用 fake_llm_server.py 模拟固定延迟的上游模型，在同一个 asgi.py 进程上比较：
+
+- 同步：ASYNC_CHAT=false，/api/chat 由Flask在 WSGI_THREADS 个线程中处理（与 gunicorn gthread 相同）
+- 异步：ASYNC_CHAT=true，/api/chat 在事件循环中等待上游（async_chat.py）
+
+同时发起 --chats 个聊天请求，期间持续请求 GET /api/notes，
+记录聊天完成的耗时、每秒完成数，以及增删改查请求在聊天负载下的延迟。
+
+用法：
+    python benchmark_chat_concurrency.py --chats 50 --llm-delay 2
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmark_events import wait_until_ready
+from benchmark_search import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+async def chat(client, base_url, index, stream):
+    start = time.perf_counter()
+    payload = {'message': f'并发测试 {index}', 'cache': False, 'use_knowledge_base': False, 'stream': stream}
+    async with client.stream('POST', f'{base_url}/api/chat', json=payload) as response:
+        await response.aread()
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+async def probe_crud(client, base_url, stop, latencies):
+    """聊天进行期间持续请求笔记列表"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get(f'{base_url}/api/notes?limit=20')
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.05)
+
+async def run_load(base_url, chats, stream):
+    limits = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        stop = asyncio.Event()
+        crud_latencies = []
+        probe = asyncio.create_task(probe_crud(client, base_url, stop, crud_latencies))
+        start = time.perf_counter()
+        durations = await asyncio.gather(*[chat(client, base_url, i, stream) for i in range(chats)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe
+    return {
+        'elapsed': elapsed,
+        'chats_per_sec': chats / elapsed,
+        'chat_p50': percentile(durations, 50),
+        'chat_max': max(durations),
+        'crud_p50': percentile(crud_latencies, 50),
+        'crud_p95': percentile(crud_latencies, 95)
+    }
+
+def run_mode(mode, args, llm_url, workdir):
+    env = dict(
+        os.environ,
+        SQLITE_PATH=os.path.join(workdir, f'{mode}.db'),
+        VECTOR_INDEX_DIR=os.path.join(workdir, f'vector_index-{mode}'),
+        INDEX_WORKER_ENABLED='false',
+        OPENROUTER_API_URL=llm_url,
+        OPENROUTE_API_KEY='benchmark',
+        ASYNC_CHAT='true' if mode == '异步' else 'false',
+        WSGI_THREADS=str(args.threads)
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(args.port), '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{args.port}'
+    try:
+        wait_until_ready(base_url)
+        return asyncio.run(run_load(base_url, args.chats, args.stream))
+    finally:
+        server.terminate()
+        server.wait()
+
+def print_results(rows, args):
+    """打印结果表"""
+    print(f"\n📊 {args.chats} 个并发聊天，上游延迟 {args.llm_delay}s，{args.threads} 个线程")
+    print(f"{'模式':<4} {'总耗时(s)':>9} {'聊天/秒':>8} {'聊天p50(s)':>10} {'聊天最长(s)':>11} {'列表p50(ms)':>11} {'列表p95(ms)':>11}")
+    for mode, result in rows:
+        print(
+            f"{mode:<4} {result['elapsed']:>9.1f} {result['chats_per_sec']:>8.1f} {result['chat_p50']:>10.1f} "
+            f"{result['chat_max']:>11.1f} {result['crud_p50']:>11.0f} {result['crud_p95']:>11.0f}"
+        )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较同步和异步聊天接口的并发能力')
+    parser.add_argument('--chats', type=int, default=50, help='并发聊天请求数')
+    parser.add_argument('--llm-delay', type=float, default=2.0, help='模拟上游的首个token延迟（秒）')
+    parser.add_argument('--threads', type=int, default=4, help='处理Flask接口的线程数')
+    parser.add_argument('--stream', action='store_true', help='使用流式聊天')
+    parser.add_argument('--port', type=int, default=5097, help='测试服务的端口')
+    parser.add_argument('--llm-port', type=int, default=8097, help='模拟上游服务的端口')
+    args = parser.parse_args()
+
+    print("=== AI记事本聊天并发基准测试 ===")
+
+    workdir = tempfile.mkdtemp(prefix='notes-chat-bench-')
+    llm = subprocess.Popen(
+        [sys.executable, 'fake_llm_server.py', '--port', str(args.llm_port),
+         '--first-token-delay', str(args.llm_delay), '--token-delay', '0.01'],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL
+    )
+    try:
+        llm_url = f'http://127.0.0.1:{args.llm_port}/v1/chat/completions'
+        rows = []
+        for mode in ('同步', '异步'):
+            print(f"运行{mode}模式...", flush=True)
+            rows.append((mode, run_mode(mode, args, llm_url, workdir)))
+        print_results(rows, args)
+    finally:
+        llm.terminate()
+        llm.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
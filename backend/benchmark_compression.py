@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+笔记正文压缩存储基准测试
+在临时数据库中写入 --notes 条笔记：大部分是几百字节到几KB的普通笔记，
+约 --large-ratio 是粘贴进来的文档和聊天记录（--large-kb KB 左右，带时间戳、链接和代码块），
+先以原文保存（NOTE_COMPRESS_THRESHOLD=0），测量后用 `flask compress-notes` 按阈值原地压缩，再测量一次：
+
+- 数据库文件大小（VACUUM 之后）和正文占用的字节数
+- 打开大笔记 GET /api/notes/<id>（读取并解压完整正文）
+- 侧边栏列表 GET /api/notes?fields=id,title,snippet（压缩的正文只解压开头）
+- 全文搜索 POST /api/search（snippet() 只对返回的结果解压）
+
+语料由有限的词表随机生成，重复度高于真实文本，压缩率偏乐观（真实中文文本用zlib通常为2~3倍）。
+用 Flask 测试客户端在进程内请求，读取基本命中操作系统的页缓存，不包括磁盘IO的差别。
+
+用法：
+    python benchmark_compression.py --notes 5000 --large-ratio 0.05 --large-kb 200
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmark_search import QUERIES, generate_sentence, percentile
+
+def small_note(rng):
+    return '\n\n'.join(generate_sentence(rng) for _ in range(rng.randint(2, 20)))
+
+def chat_transcript(rng, size_kb):
+    """聊天记录：带时间戳的多轮对话，偶尔夹带链接"""
+    lines = []
+    size = 0
+    minute = 0
+    while size < size_kb * 1024:
+        minute += rng.randint(0, 3)
+        speaker = rng.choice(('用户', '助手'))
+        line = f'[{9 + minute // 60:02d}:{minute % 60:02d}] {speaker}：{generate_sentence(rng, rng.randint(6, 30))}'
+        if rng.random() < 0.05:
+            line += f' https://example.com/docs/{rng.getrandbits(48):x}'
+        lines.append(line)
+        size += len(line.encode('utf-8')) + 1
+    return '\n'.join(lines)
+
+def pasted_document(rng, size_kb):
+    """粘贴的文档：Markdown标题、段落、列表和代码块"""
+    parts = []
+    size = 0
+    section = 0
+    while size < size_kb * 1024:
+        section += 1
+        block = [f'## {section}. {generate_sentence(rng, 4)}']
+        block.extend(generate_sentence(rng, rng.randint(20, 60)) for _ in range(rng.randint(2, 5)))
+        block.extend(f'- {generate_sentence(rng, 6)}' for _ in range(rng.randint(0, 5)))
+        if rng.random() < 0.3:
+            block.append(f"```python\nresult = query(limit={rng.randint(1, 500)}, offset={rng.randint(0, 10000)})\n```")
+        text = '\n\n'.join(block)
+        parts.append(text)
+        size += len(text.encode('utf-8'))
+    return '\n\n'.join(parts)
+
+def seed_notes(client, note_count, large_ratio, large_kb, seed):
+    """写入语料，返回大笔记的id列表"""
+    rng = random.Random(seed)
+    large_ids = []
+    items = []
+    for i in range(note_count):
+        if rng.random() < large_ratio:
+            size_kb = rng.randint(large_kb // 4, large_kb * 2)
+            content = chat_transcript(rng, size_kb) if i % 2 else pasted_document(rng, size_kb)
+            items.append(({'title': f'粘贴 {i}', 'content': content, 'tags': ['资料']}, True))
+        else:
+            items.append(({'title': f'笔记 {i}', 'content': small_note(rng), 'tags': ['日常']}, False))
+
+    for start in range(0, len(items), 100):
+        batch = items[start:start + 100]
+        response = client.post('/api/notes/batch', json={'items': [item for item, _ in batch]})
+        assert response.status_code == 200, response.get_json()
+        ids = [result['id'] for result in response.get_json()['data']['results']]
+        large_ids.extend(note_id for note_id, (_, large) in zip(ids, batch) if large)
+    return large_ids
+
+def vacuum(app, db):
+    """合并WAL并整理数据库文件，返回文件大小（字节）"""
+    with app.app_context():
+        db.session.remove()
+        connection = db.engine.raw_connection()
+        try:
+            connection.driver_connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            connection.driver_connection.execute('VACUUM')
+        finally:
+            connection.close()
+    return os.path.getsize(os.environ['SQLITE_PATH'])
+
+def content_bytes(app, db):
+    """正文存储形式占用的字节数及压缩保存的笔记数"""
+    with app.app_context():
+        return db.session.execute(db.text(
+            "SELECT SUM(length(CAST(content AS BLOB))), SUM(typeof(content) = 'blob') FROM notes"
+        )).one()
+
+def timed(func, repeat):
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def measure(app, db, client, large_ids, repeat):
+    def get_note(i):
+        response = client.get(f'/api/notes/{large_ids[i % len(large_ids)]}')
+        assert response.status_code == 200
+
+    def list_snippets(i):
+        response = client.get('/api/notes?fields=id,title,snippet&limit=50')
+        assert response.status_code == 200
+
+    def search(i):
+        response = client.post('/api/search', json={'query': QUERIES[i % len(QUERIES)], 'limit': 20})
+        assert response.status_code == 200
+
+    stored, compressed = content_bytes(app, db)
+    result = {'file_bytes': vacuum(app, db), 'content_bytes': stored, 'compressed_notes': compressed or 0}
+    for name, func in (('get_note', get_note), ('list', list_snippets), ('search', search)):
+        func(0)  # 预热
+        timings = timed(func, repeat)
+        result[name] = (percentile(timings, 50), percentile(timings, 95))
+    return result
+
+def print_results(before, after, migrate_seconds, args):
+    """打印结果表"""
+    print(f"\n📊 {args.notes} 条笔记（约 {args.large_ratio:.0%} 为 {args.large_kb // 4}~{args.large_kb * 2}KB 的粘贴内容），"
+          f"压缩阈值 {args.threshold} 字节，迁移用时 {migrate_seconds:.1f}s")
+    print(f"{'':<22} {'原文':>14} {'压缩后':>14}")
+    print(f"{'数据库文件(MB)':<22} {before['file_bytes'] / 1024 / 1024:>14.1f} {after['file_bytes'] / 1024 / 1024:>14.1f}")
+    print(f"{'正文(MB)':<22} {before['content_bytes'] / 1024 / 1024:>14.1f} {after['content_bytes'] / 1024 / 1024:>14.1f}")
+    print(f"{'压缩保存的笔记':<22} {before['compressed_notes']:>14} {after['compressed_notes']:>14}")
+    for name, label in (('get_note', '打开大笔记'), ('list', '列表+摘要'), ('search', '全文搜索')):
+        print(f"{label + ' p50/p95(ms)':<22} {before[name][0]:>7.2f}/{before[name][1]:<6.2f} {after[name][0]:>7.2f}/{after[name][1]:<6.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='测量大笔记正文压缩前后的数据库大小和读取延迟')
+    parser.add_argument('--notes', type=int, default=5000, help='笔记条数')
+    parser.add_argument('--large-ratio', type=float, default=0.05, help='粘贴的大笔记所占比例')
+    parser.add_argument('--large-kb', type=int, default=200, help='大笔记的典型大小（KB，实际在 1/4~2 倍之间）')
+    parser.add_argument('--threshold', type=int, default=16384, help='压缩阈值（字节）')
+    parser.add_argument('--repeat', type=int, default=200, help='每种请求的次数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    print("=== AI记事本正文压缩存储基准测试 ===")
+
+    workdir = tempfile.mkdtemp(prefix='notes-compression-bench-')
+    # 必须在导入 app 之前设置：使用临时数据库，不启动后台索引线程，写入时不压缩（作为改造前的基线）
+    os.environ['SQLITE_PATH'] = os.path.join(workdir, 'notes.db')
+    os.environ['VECTOR_INDEX_DIR'] = os.path.join(workdir, 'vector_index')
+    os.environ['INDEX_WORKER_ENABLED'] = 'false'
+    os.environ['NOTE_COMPRESS_THRESHOLD'] = '0'
+    try:
+        from app import app, db
+
+        client = app.test_client()
+        start = time.perf_counter()
+        large_ids = seed_notes(client, args.notes, args.large_ratio, args.large_kb, args.seed)
+        print(f"✓ 已写入测试数据（{len(large_ids)} 条大笔记，{time.perf_counter() - start:.1f}s）")
+
+        before = measure(app, db, client, large_ids, args.repeat)
+
+        start = time.perf_counter()
+        result = app.test_cli_runner().invoke(args=['compress-notes', '--threshold', str(args.threshold), '--batch-size', '500'])
+        assert result.exit_code == 0, result.output
+        migrate_seconds = time.perf_counter() - start
+
+        after = measure(app, db, client, large_ids, args.repeat)
+        print_results(before, after, migrate_seconds, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite并发基准测试
+模拟 gunicorn 的多个worker进程同时读写同一个数据库文件，
+比较各存储配置（storage.py）下的读写吞吐量、延迟和 "database is locked" 错误数。
+
+读操作与 GET /api/notes?limit=50 相同，写操作与 PUT /api/notes/<id> 相同（单行更新后提交）。
+
+用法：
+    python benchmark_concurrency.py --workers 1,4,8 --seconds 5
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from benchmark_search import create_corpus, percentile
+from storage import SQLITE_PROFILES, apply_sqlite_pragmas, sqlite_pragmas
+
+def worker(db_path, profile, seconds, write_ratio, note_count, seed, results):
+    """一个worker进程：在限定时间内循环执行读写，结果放入队列"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)  # 与SQLAlchemy相同，使用sqlite3默认的5秒超时
+    apply_sqlite_pragmas(conn, sqlite_pragmas(profile))
+
+    stats = {'reads': 0, 'writes': 0, 'locked': 0, 'read_ms': [], 'write_ms': []}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                note_id = rng.randint(1, note_count)
+                conn.execute(
+                    "UPDATE notes SET content = content || ?, updated_at = ? WHERE id = ?",
+                    ('。', time.strftime('%Y-%m-%d %H:%M:%S'), note_id)
+                )
+                conn.commit()
+                stats['writes'] += 1
+                stats['write_ms'].append((time.perf_counter() - start) * 1000)
+            else:
+                conn.execute(
+                    "SELECT id, title, tags, substr(content, 1, 200), updated_at FROM notes "
+                    "ORDER BY updated_at DESC, id DESC LIMIT 50"
+                ).fetchall()
+                stats['reads'] += 1
+                stats['read_ms'].append((time.perf_counter() - start) * 1000)
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            conn.rollback()
+            stats['locked'] += 1
+    conn.close()
+    results.put(stats)
+
+def run(profile, workers, seconds, write_ratio, note_count, base_db, workdir):
+    """用指定配置和worker数运行一轮，返回汇总结果"""
+    db_path = os.path.join(workdir, f'{profile}-{workers}.db')
+    shutil.copyfile(base_db, db_path)
+    conn = sqlite3.connect(db_path)
+    apply_sqlite_pragmas(conn, sqlite_pragmas(profile))
+    conn.close()
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(db_path, profile, seconds, write_ratio, note_count, seed, results))
+        for seed in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    read_ms = [value for stats in collected for value in stats['read_ms']]
+    write_ms = [value for stats in collected for value in stats['write_ms']]
+    return {
+        'profile': profile,
+        'workers': workers,
+        'reads_per_sec': sum(stats['reads'] for stats in collected) / seconds,
+        'writes_per_sec': sum(stats['writes'] for stats in collected) / seconds,
+        'read_p95': percentile(read_ms, 95) if read_ms else 0.0,
+        'write_p95': percentile(write_ms, 95) if write_ms else 0.0,
+        'locked': sum(stats['locked'] for stats in collected)
+    }
+
+def print_results(rows):
+    """打印结果表"""
+    print(f"\n📊 并发读写结果")
+    print(f"{'配置':<8} {'worker':>6} {'读/秒':>9} {'写/秒':>8} {'读p95(ms)':>10} {'写p95(ms)':>10} {'locked':>7}")
+    for row in rows:
+        print(
+            f"{row['profile']:<8} {row['workers']:>6} {row['reads_per_sec']:>9.0f} {row['writes_per_sec']:>8.0f} "
+            f"{row['read_p95']:>10.2f} {row['write_p95']:>10.2f} {row['locked']:>7}"
+        )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较SQLite存储配置的并发读写性能')
+    parser.add_argument('--workers', default='1,4,8', help='逗号分隔的并发worker进程数')
+    parser.add_argument('--seconds', type=float, default=5, help='每轮运行的秒数')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='写操作的比例')
+    parser.add_argument('--notes', type=int, default=10000, help='生成的笔记数量')
+    parser.add_argument('--profiles', default=','.join(SQLITE_PROFILES), help='逗号分隔的存储配置')
+    args = parser.parse_args()
+
+    print("=== AI记事本SQLite并发基准测试 ===")
+
+    workdir = tempfile.mkdtemp(prefix='notes-concurrency-bench-')
+    try:
+        base_db = os.path.join(workdir, 'corpus.db')
+        create_corpus(base_db, args.notes)
+        rows = []
+        for profile in args.profiles.split(','):
+            for workers in args.workers.split(','):
+                print(f"运行 {profile} 配置，{workers} 个worker...", flush=True)
+                rows.append(run(profile, int(workers), args.seconds, args.write_ratio, args.notes, base_db, workdir))
+        print_results(rows)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
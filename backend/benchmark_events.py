@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SSE推送负载测试
+在临时数据库上用 uvicorn 启动 asgi.py，建立大量 /api/events 订阅连接，
+再通过 POST /api/notes 写入笔记，测量从发出写入请求到变更送达各订阅者的延迟，
+并记录服务进程的线程数和内存（订阅者不应各占一个线程或数据库连接）。
+
+用法：
+    python benchmark_events.py --subscribers 1000 --writes 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmark_search import percentile
+
+def process_status(pid):
+    """服务进程的线程数和RSS（MB）"""
+    status = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            status[name] = value.strip()
+    return int(status['Threads']), int(status['VmRSS'].split()[0]) / 1024
+
+def http_json(url, payload=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+def wait_until_ready(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            http_json(f'{base_url}/api/health')
+            return
+        except Exception:
+            time.sleep(0.3)
+    raise RuntimeError('服务未能启动')
+
+async def subscribe(host, port, received, ready):
+    """一个订阅连接：记录每条事件（按笔记标题）的到达时间"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'GET /api/events?types=notes HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n'.encode())
+    await writer.drain()
+    status = await reader.readline()
+    if b' 200 ' not in status:
+        raise RuntimeError(status.decode().strip())
+    ready.append(1)
+    try:
+        # 每条SSE消息由一次发送写出，按行解析即可（分块传输的长度行不以 data: 开头）
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b'data: '):
+                change = json.loads(line[6:])
+                if change.get('data'):
+                    received.append((change['data']['title'], time.perf_counter()))
+    except asyncio.CancelledError:
+        pass
+    finally:
+        writer.close()
+
+async def run(args, base_url, server):
+    received = []
+    ready = []
+    tasks = []
+    for _ in range(args.subscribers):
+        tasks.append(asyncio.create_task(subscribe('127.0.0.1', args.port, received, ready)))
+        if len(tasks) % 100 == 0:
+            await asyncio.sleep(0.05)
+
+    while len(ready) < args.subscribers:
+        await asyncio.sleep(0.1)
+        failed = [task for task in tasks if task.done() and task.exception()]
+        if failed:
+            raise failed[0].exception()
+    # 等待服务端全部登记为订阅者
+    while (await asyncio.to_thread(http_json, f'{base_url}/api/events/stats'))['data']['subscribers'] < args.subscribers:
+        await asyncio.sleep(0.1)
+    threads, rss = process_status(server.pid)
+    print(f"✓ {args.subscribers} 个订阅者已连接（服务进程 {threads} 个线程，RSS {rss:.0f}MB）")
+
+    sent = {}
+    for i in range(args.writes):
+        title = f'推送测试 {i}'
+        sent[title] = time.perf_counter()
+        await asyncio.to_thread(http_json, f'{base_url}/api/notes', {'title': title, 'content': '负载测试'})
+        await asyncio.sleep(args.interval)
+
+    expected = args.subscribers * args.writes
+    deadline = time.perf_counter() + 10
+    while len(received) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+    threads_after, rss_after = process_status(server.pid)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = [(at - sent[title]) * 1000 for title, at in received if title in sent]
+    return {
+        'expected': expected,
+        'delivered': len(latencies),
+        'p50': percentile(latencies, 50) if latencies else 0.0,
+        'p95': percentile(latencies, 95) if latencies else 0.0,
+        'max': max(latencies) if latencies else 0.0,
+        'threads': threads_after,
+        'rss': rss_after
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SSE推送的并发订阅负载测试')
+    parser.add_argument('--subscribers', type=int, default=1000, help='并发订阅连接数')
+    parser.add_argument('--writes', type=int, default=20, help='写入的笔记数')
+    parser.add_argument('--interval', type=float, default=0.2, help='两次写入的间隔（秒）')
+    parser.add_argument('--port', type=int, default=5099, help='测试服务的端口')
+    args = parser.parse_args()
+
+    print("=== AI记事本SSE推送负载测试 ===")
+
+    workdir = tempfile.mkdtemp(prefix='notes-events-bench-')
+    env = dict(
+        os.environ,
+        SQLITE_PATH=os.path.join(workdir, 'notes.db'),
+        VECTOR_INDEX_DIR=os.path.join(workdir, 'vector_index'),
+        INDEX_WORKER_ENABLED='false'
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(args.port), '--log-level', 'warning',
+         '--backlog', str(max(2048, args.subscribers))],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env
+    )
+    base_url = f'http://127.0.0.1:{args.port}'
+    try:
+        wait_until_ready(base_url)
+        result = asyncio.run(run(args, base_url, server))
+
+        print(f"\n📊 {args.subscribers} 个订阅者，{args.writes} 次写入")
+        print(f"送达: {result['delivered']}/{result['expected']}")
+        print(f"发出写入请求到送达的延迟(ms): p50 {result['p50']:.0f}，p95 {result['p95']:.0f}，最大 {result['max']:.0f}")
+        print(f"服务进程: {result['threads']} 个线程，RSS {result['rss']:.0f}MB")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
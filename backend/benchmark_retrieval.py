@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+知识库检索延迟基准测试
+在不同规模的生成语料上测量聊天知识库检索各环节的 p50/p95 延迟：
+
+- LIKE：旧实现，按更新时间取最新的匹配结果
+- FTS：FTS5 bm25 召回候选
+- 向量：内存映射向量索引的 top-k 相似度召回（含查询编码）
+- 混合：FTS + 向量召回，再做倒数排名融合（与 app.py 的 rank_knowledge 相同）
+
+语料向量使用随机单位向量（检索耗时与向量内容无关），查询使用 hashing 嵌入，
+因此结果不包含 sentence-transformers 模型推理的耗时。
+
+用法：
+    python benchmark_retrieval.py --sizes 10000,100000,1000000
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+import compression
+from benchmark_search import QUERIES, create_corpus, fts_top, like_top, percentile
+from migrations import FTS_COMPRESSED_COLUMNS, FTS_TABLES, create_fts_table
+from retrieval import reciprocal_rank_fusion
+from search_tokenizer import build_match_query, register_functions
+from vector_index import HashingEmbedder, VectorIndex
+
+CANDIDATES = 30  # 与 app.py 的 KNOWLEDGE_CANDIDATES 一致
+VECTOR_BATCH = 50000
+
+def build_vector_index(directory, note_count, embedder, seed=42):
+    """写入随机的单位向量"""
+    rng = np.random.default_rng(seed)
+    index = VectorIndex(directory, embedder.dim, embedder.name)
+    for start in range(1, note_count + 1, VECTOR_BATCH):
+        ids = list(range(start, min(start + VECTOR_BATCH, note_count + 1)))
+        index.upsert(ids, rng.standard_normal((len(ids), embedder.dim), dtype=np.float32))
+    return index
+
+def measure(func, repeat):
+    """对每个查询执行 repeat 次，返回全部耗时（毫秒）"""
+    latencies = []
+    for query in QUERIES:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def run_size(note_count, tokenizer, limit, repeat, workdir):
+    """在一个规模上运行基准测试，返回 {环节: 耗时列表}"""
+    db_path = os.path.join(workdir, f'notes-{note_count}.db')
+    print(f"\n生成 {note_count} 条笔记...", end=" ", flush=True)
+    start = time.perf_counter()
+    create_corpus(db_path, note_count)
+    print(f"✓ {time.perf_counter() - start:.1f}s")
+
+    conn = sqlite3.connect(db_path)
+    register_functions(conn)
+    compression.register_functions(conn)
+    print(f"构建 {tokenizer} 全文索引...", end=" ", flush=True)
+    start = time.perf_counter()
+    source, columns = FTS_TABLES['notes_fts']
+    create_fts_table(conn.cursor(), 'notes_fts', source, columns, tokenizer, FTS_COMPRESSED_COLUMNS['notes_fts'])
+    conn.commit()
+    print(f"✓ {time.perf_counter() - start:.1f}s")
+
+    embedder = HashingEmbedder()
+    print("构建向量索引...", end=" ", flush=True)
+    start = time.perf_counter()
+    index = build_vector_index(os.path.join(workdir, f'vectors-{note_count}'), note_count, embedder)
+    print(f"✓ {time.perf_counter() - start:.1f}s")
+
+    def keyword(query):
+        match_query = build_match_query(query, tokenizer)
+        if match_query is None:
+            # 与 app.py 相同：该分词模式无法处理的查询回退到LIKE
+            return [row[0] for row in like_top(conn, query, CANDIDATES)]
+        return [row[0] for row in fts_top(conn, match_query, CANDIDATES)]
+
+    def semantic(query):
+        return [note_id for note_id, _ in index.search(embedder.encode([query])[0], CANDIDATES)]
+
+    def hybrid(query):
+        return reciprocal_rank_fusion({'keyword': keyword(query), 'semantic': semantic(query)}, limit=limit)
+
+    results = {
+        'LIKE': measure(lambda query: like_top(conn, query, limit), repeat),
+        'FTS': measure(keyword, repeat),
+        '向量': measure(semantic, repeat),
+        '混合': measure(hybrid, repeat)
+    }
+    conn.close()
+    return results
+
+def print_results(rows):
+    """打印结果表"""
+    print(f"\n📊 检索延迟（{len(QUERIES)} 个查询）")
+    print(f"{'笔记数':>10} {'环节':<6} {'p50(ms)':>9} {'p95(ms)':>9}")
+    for note_count, results in rows:
+        for stage, latencies in results.items():
+            print(f"{note_count:>10} {stage:<6} {percentile(latencies, 50):>9.2f} {percentile(latencies, 95):>9.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='测量知识库混合检索的延迟')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='逗号分隔的笔记数量')
+    parser.add_argument('--tokenizer', default=os.getenv('FTS_TOKENIZER', 'bigram'), help='全文索引的分词模式')
+    parser.add_argument('--limit', type=int, default=10, help='融合后返回的结果数')
+    parser.add_argument('--repeat', type=int, default=5, help='每个查询的执行次数')
+    parser.add_argument('--keep', action='store_true', help='保留生成的数据库和索引文件')
+    args = parser.parse_args()
+
+    print("=== AI记事本知识库检索基准测试 ===")
+
+    workdir = tempfile.mkdtemp(prefix='notes-retrieval-bench-')
+    try:
+        rows = []
+        for size in args.sizes.split(','):
+            note_count = int(size)
+            rows.append((note_count, run_size(note_count, args.tokenizer, args.limit, args.repeat, workdir)))
+        print_results(rows)
+    finally:
+        if args.keep:
+            print(f"\n数据文件保留在: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
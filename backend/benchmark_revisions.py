@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+修订历史存储基准测试
+模拟自动保存：一篇约 --size-kb KB 的笔记，共保存 --saves 次（其中约5%是撤销回上一版本），
+正文分两种（--layout）：
+
+- markdown：约100字的短行，每次保存在随机位置改动一行或插入一行
+- paragraph：整篇只有一行（聊天记录、粘贴的文章），每次保存在随机位置插入或删除几个字
+
+比较修订历史占用的空间：
+
+- 完整副本：每个版本保存一份原文
+- 压缩副本：每个版本保存一份zlib压缩的原文
+- 修订存储：按内容去重 + delta链（每 REVISION_SNAPSHOT_INTERVAL 个版本一个完整快照）
+
+并记录保存请求（PUT /api/notes/<id>，含记录修订）和读取任意历史版本的延迟。
+
+用法：
+    python benchmark_revisions.py --saves 500 --size-kb 20
+    python benchmark_revisions.py --layout paragraph --size-kb 5
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import zlib
+
+from benchmark_search import percentile
+
+PARAGRAPH = '本段记录项目的进展和待解决的问题，包括接口设计、数据迁移和性能测试的结论。 Notes on API design, migrations and benchmarks.'
+
+def initial_content(size_kb, layout='markdown'):
+    if layout == 'paragraph':
+        text = ''
+        while len(text.encode('utf-8')) < size_kb * 1024:
+            text += PARAGRAPH.rstrip('.') + f'（{len(text)}）。'
+        return [text]
+    
+    lines = []
+    section = 0
+    while sum(len(line.encode('utf-8')) for line in lines) < size_kb * 1024:
+        if len(lines) % 12 == 0:
+            section += 1
+            lines.append(f'## 第{section}节\n')
+        lines.append(f'{PARAGRAPH} ({len(lines)})\n')
+    return lines
+
+def edit(lines, rng, step, layout='markdown'):
+    """自动保存之间的一次小改动"""
+    lines = list(lines)
+    index = rng.randrange(len(lines))
+    if layout == 'paragraph':
+        line = lines[index]
+        position = rng.randrange(len(line))
+        if rng.random() < 0.3:
+            lines[index] = line[:position] + line[position + rng.randint(1, 5):]
+        else:
+            lines[index] = line[:position] + f'补充{step}' + line[position:]
+    elif rng.random() < 0.3:
+        lines.insert(index, f'- 新增的待办事项 {step}\n')
+    else:
+        lines[index] = lines[index].rstrip('\n') + f' 补充{step}\n'
+    return lines
+
+def run(client, saves, size_kb, seed, layout='markdown'):
+    from app import RevisionBlob, app, db
+
+    rng = random.Random(seed)
+    lines = initial_content(size_kb, layout)
+    note_id = client.post('/api/notes', json={'title': '自动保存测试', 'content': ''.join(lines)}).get_json()['data']['id']
+
+    versions = [''.join(lines)]
+    save_timings = []
+    previous = lines
+    for step in range(saves):
+        if step and rng.random() < 0.05:
+            lines, previous = previous, lines  # 撤销：回到上一版本的正文
+        else:
+            previous, lines = lines, edit(lines, rng, step, layout)
+        content = ''.join(lines)
+        versions.append(content)
+        start = time.perf_counter()
+        response = client.put(f'/api/notes/{note_id}', json={'content': content})
+        save_timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.get_json()
+
+    revision_count = len(versions)
+    read_timings = []
+    for _ in range(100):
+        rev = rng.randint(1, revision_count)
+        start = time.perf_counter()
+        data = client.get(f'/api/notes/{note_id}/revisions/{rev}').get_json()['data']
+        read_timings.append((time.perf_counter() - start) * 1000)
+        assert data['content'] == versions[rev - 1], f'版本 {rev} 内容不一致'
+
+    with app.app_context():
+        stored, blobs = db.session.execute(
+            db.select(db.func.sum(db.func.length(RevisionBlob.data)), db.func.count())
+        ).one()
+        full_blobs = db.session.scalar(db.select(db.func.count()).where(RevisionBlob.kind == 'full'))
+    return {
+        'revisions': revision_count,
+        'blobs': blobs,
+        'full_blobs': full_blobs,
+        'full_bytes': sum(len(text.encode('utf-8')) for text in versions),
+        'compressed_bytes': sum(len(zlib.compress(text.encode('utf-8'))) for text in versions),
+        'stored_bytes': stored,
+        'save_p50': percentile(save_timings, 50),
+        'save_p95': percentile(save_timings, 95),
+        'read_p50': percentile(read_timings, 50),
+        'read_p95': percentile(read_timings, 95)
+    }
+
+def print_results(result, args):
+    """打印结果表"""
+    print(f"\n📊 {args.size_kb}KB {args.layout} 笔记，{result['revisions']} 个版本"
+          f"（{result['blobs']} 个不同正文，其中 {result['full_blobs']} 个完整快照）")
+    print(f"{'存储方式':<8} {'大小(KB)':>10} {'相对完整副本':>12}")
+    for name, size in (('完整副本', result['full_bytes']), ('压缩副本', result['compressed_bytes']), ('修订存储', result['stored_bytes'])):
+        print(f"{name:<8} {size / 1024:>10.1f} {size / result['full_bytes']:>11.1%}")
+    print(f"保存延迟(ms): p50 {result['save_p50']:.1f}，p95 {result['save_p95']:.1f}")
+    print(f"读取历史版本(ms): p50 {result['read_p50']:.1f}，p95 {result['read_p95']:.1f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='测量自动保存场景下修订历史的存储大小和读写延迟')
+    parser.add_argument('--saves', type=int, default=500, help='保存次数')
+    parser.add_argument('--size-kb', type=int, default=20, help='笔记正文的大小（KB）')
+    parser.add_argument('--layout', choices=('markdown', 'paragraph'), default='markdown', help='正文为短行或整篇一行')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    print("=== AI记事本修订历史存储基准测试 ===")
+
+    workdir = tempfile.mkdtemp(prefix='notes-revisions-bench-')
+    # 必须在导入 app 之前设置：使用临时数据库，不启动后台索引线程
+    os.environ['SQLITE_PATH'] = os.path.join(workdir, 'notes.db')
+    os.environ['VECTOR_INDEX_DIR'] = os.path.join(workdir, 'vector_index')
+    os.environ['INDEX_WORKER_ENABLED'] = 'false'
+    try:
+        from app import app
+
+        result = run(app.test_client(), args.saves, args.size_kb, args.seed, args.layout)
+        print_results(result, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
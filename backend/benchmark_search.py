@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全文搜索基准测试脚本
+在生成的中文笔记语料上比较各分词模式的FTS5索引与LIKE扫描的召回率和查询延迟
+
+用法：
+    python benchmark_search.py --notes 100000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import compression
+from migrations import FTS_COMPRESSED_COLUMNS, FTS_TABLES, create_fts_table
+from search_tokenizer import TOKENIZERS, build_match_query, register_functions
+
+# 语料词表：常见的两字、三字、四字中文词和少量英文词
+VOCABULARY = [
+    '学习', '工作', '项目', '会议', '计划', '总结', '问题', '方案', '数据', '分析',
+    '设计', '开发', '测试', '部署', '文档', '需求', '用户', '产品', '市场', '运营',
+    '机器学习', '深度学习', '神经网络', '自然语言', '数据库', '服务器', '前端', '后端',
+    '读书笔记', '时间管理', '健康', '跑步', '早餐', '红烧肉', '旅行', '预算', '周报',
+    '人工智能', '知识库', '搜索引擎', '索引', '缓存', '性能优化', '并发', '事务',
+    '算法', '架构', '微服务', '容器', '日志', '监控', '告警', '复盘', '目标', '习惯',
+    'Python', 'SQLite', 'React', 'API', 'Docker', 'Git',
+]
+CONNECTORS = ['的', '和', '与', '了', '在', '是', '要', '把', '对', '从']
+
+# 低频词：只出现在约千分之一的笔记中，LIKE需要扫描全表才能凑够结果
+RARE_WORDS = ['量子计算', '区块链', '碳中和', '元宇宙']
+
+# 基准查询：两字词、四字词、多词组合、英文词
+QUERIES = [
+    '学习', '项目', '数据', '会议', '预算', '缓存',
+    '机器学习', '神经网络', '时间管理', '性能优化', '读书笔记', '搜索引擎',
+    '数据库 索引', '深度学习 Python', '周报 总结', '微服务 监控',
+    'Python', 'SQLite', 'Docker',
+    '量子计算', '区块链', '碳中和', '元宇宙',
+]
+
+def generate_sentence(rng, words=12):
+    """随机生成一句中文"""
+    parts = []
+    for _ in range(words):
+        parts.append(rng.choice(VOCABULARY))
+        parts.append(rng.choice(CONNECTORS))
+    return ''.join(parts) + '。'
+
+def create_corpus(db_path, note_count, seed=42):
+    """创建与 app.py 结构一致的 notes 表并写入生成的中文笔记"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE notes (
+            id INTEGER PRIMARY KEY,
+            title VARCHAR(200) NOT NULL,
+            content TEXT NOT NULL,
+            tags TEXT,
+            created_at DATETIME,
+            updated_at DATETIME
+        )
+    """)
+    conn.execute("CREATE INDEX idx_notes_updated_at ON notes(updated_at DESC)")
+
+    batch = []
+    for i in range(1, note_count + 1):
+        title = rng.choice(VOCABULARY) + rng.choice(VOCABULARY)
+        content = ''.join(generate_sentence(rng) for _ in range(rng.randint(2, 8)))
+        if rng.random() < 0.001:
+            content += rng.choice(RARE_WORDS) + '。'
+        tags = '["' + rng.choice(VOCABULARY) + '"]'
+        timestamp = f'2024-01-01 00:00:{i:06d}'
+        batch.append((i, title, content, tags, timestamp, timestamp))
+        if len(batch) >= 5000:
+            conn.executemany("INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+def like_ids(conn, query):
+    """LIKE扫描的结果（作为召回率的标准答案）"""
+    clauses = []
+    params = []
+    for term in query.split():
+        clauses.append("(title LIKE ? OR content LIKE ? OR tags LIKE ?)")
+        params += [f'%{term}%'] * 3
+    sql = f"SELECT id FROM notes WHERE {' AND '.join(clauses)}"
+    return {row[0] for row in conn.execute(sql, params)}
+
+def like_top(conn, query, limit):
+    """与 app.py 回退路径相同的LIKE查询：按更新时间取前 limit 条"""
+    clauses = []
+    params = []
+    for term in query.split():
+        clauses.append("(title LIKE ? OR content LIKE ? OR tags LIKE ?)")
+        params += [f'%{term}%'] * 3
+    sql = f"SELECT id FROM notes WHERE {' AND '.join(clauses)} ORDER BY updated_at DESC LIMIT ?"
+    return conn.execute(sql, params + [limit]).fetchall()
+
+def fts_ids(conn, match_query):
+    """FTS索引命中的全部结果"""
+    return {row[0] for row in conn.execute("SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?", (match_query,))}
+
+def fts_top(conn, match_query, limit):
+    """与 app.py 相同的FTS查询：按bm25取前 limit 条"""
+    sql = """
+        SELECT rowid, rank FROM notes_fts
+        WHERE notes_fts MATCH ? AND rank MATCH 'bm25(10.0, 1.0, 5.0)'
+        ORDER BY rank LIMIT ?
+    """
+    return conn.execute(sql, (match_query, limit)).fetchall()
+
+def timed(func, *args, repeat=3):
+    """多次执行取最快一次的耗时（毫秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def percentile(values, pct):
+    """计算百分位数"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_benchmark(note_count, limit, workdir):
+    """对LIKE和每种分词模式运行基准测试，返回结果行"""
+    base_db = os.path.join(workdir, 'corpus.db')
+    print(f"生成 {note_count} 条中文笔记语料...")
+    start = time.perf_counter()
+    create_corpus(base_db, note_count)
+    print(f"✓ 语料生成完成，用时 {time.perf_counter() - start:.1f}s，大小 {os.path.getsize(base_db) / 1024 / 1024:.1f} MB")
+
+    conn = sqlite3.connect(base_db)
+    truth = {query: like_ids(conn, query) for query in QUERIES}
+    like_latencies = [timed(like_top, conn, query, limit) for query in QUERIES]
+    conn.close()
+
+    results = [{
+        'mode': 'LIKE',
+        'build_seconds': 0.0,
+        'size_mb': os.path.getsize(base_db) / 1024 / 1024,
+        'p50': percentile(like_latencies, 50),
+        'p95': percentile(like_latencies, 95),
+        'recall': 1.0,
+        'fallbacks': 0
+    }]
+
+    source, columns = FTS_TABLES['notes_fts']
+    for tokenizer in TOKENIZERS:
+        db_path = os.path.join(workdir, f'{tokenizer}.db')
+        shutil.copyfile(base_db, db_path)
+        conn = sqlite3.connect(db_path)
+        register_functions(conn)
+        compression.register_functions(conn)
+
+        print(f"构建 {tokenizer} 索引...", end=" ", flush=True)
+        start = time.perf_counter()
+        create_fts_table(conn.cursor(), 'notes_fts', source, columns, tokenizer, FTS_COMPRESSED_COLUMNS['notes_fts'])
+        conn.commit()
+        build_seconds = time.perf_counter() - start
+        print(f"✓ {build_seconds:.1f}s")
+
+        latencies = []
+        recalls = []
+        fallbacks = 0
+        for query in QUERIES:
+            match_query = build_match_query(query, tokenizer)
+            if match_query is None:
+                # 该分词模式无法处理的查询，app.py 会回退到LIKE扫描
+                fallbacks += 1
+                latencies.append(timed(like_top, conn, query, limit))
+                recalls.append(1.0)
+                continue
+            latencies.append(timed(fts_top, conn, match_query, limit))
+            expected = truth[query]
+            found = fts_ids(conn, match_query)
+            recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+        conn.close()
+
+        results.append({
+            'mode': tokenizer,
+            'build_seconds': build_seconds,
+            'size_mb': os.path.getsize(db_path) / 1024 / 1024,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'recall': statistics.mean(recalls),
+            'fallbacks': fallbacks
+        })
+
+    return results
+
+def print_results(results, query_count):
+    """打印结果表"""
+    print(f"\n📊 基准测试结果（{query_count} 个查询）")
+    print(f"{'模式':<10} {'建索引(s)':>10} {'库大小(MB)':>11} {'p50(ms)':>9} {'p95(ms)':>9} {'召回率':>8} {'回退LIKE':>9}")
+    for row in results:
+        print(
+            f"{row['mode']:<10} {row['build_seconds']:>10.1f} {row['size_mb']:>11.1f} "
+            f"{row['p50']:>9.2f} {row['p95']:>9.2f} {row['recall']:>8.1%} {row['fallbacks']:>9}"
+        )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较各分词模式的全文搜索召回率与延迟')
+    parser.add_argument('--notes', type=int, default=100000, help='生成的笔记数量')
+    parser.add_argument('--limit', type=int, default=20, help='每次查询返回的结果数')
+    parser.add_argument('--keep', action='store_true', help='保留生成的数据库文件')
+    args = parser.parse_args()
+
+    print("=== AI记事本全文搜索基准测试 ===")
+    print()
+
+    workdir = tempfile.mkdtemp(prefix='notes-search-bench-')
+    try:
+        print_results(run_benchmark(args.notes, args.limit, workdir), len(QUERIES))
+    finally:
+        if args.keep:
+            print(f"\n数据库文件保留在: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列表序列化基准测试
+在临时数据库中写入 --notes 条笔记，测量一次 get_notes()（不分页，返回全部笔记）的CPU时间：
+
+- ORM+标准库：构造Note对象、逐个调用 to_dict()，再用标准库json序列化（改动前的实现）
+- 按列+标准库：paginated_response 直接查询列值，不构造ORM对象
+- 按列+orjson：同上，由 json_provider.FastJSONProvider 使用 orjson 序列化
+
+只调用视图函数本身（跳过条件请求的判断），用 time.process_time 计时，
+包括查询、构造响应和生成响应体，不包括测试客户端的开销。
+
+用法：
+    python benchmark_serialization.py --notes 10000 --repeat 10
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmark_search import percentile
+
+def seed_notes(client, note_count, content_size):
+    body = ('基准测试正文，包含中文和 ASCII text。' * (content_size // 20 + 1))[:content_size]
+    for start in range(0, note_count, 500):
+        items = [
+            {'title': f'笔记 {i}', 'content': body, 'tags': ['benchmark', f'分组{i % 10}']}
+            for i in range(start, min(start + 500, note_count))
+        ]
+        response = client.post('/api/notes/batch', json={'items': items})
+        assert response.status_code == 200, response.get_json()
+
+def measure(app, provider, handler, repeat):
+    """返回每次请求的CPU时间（ms）列表和响应体大小"""
+    app.json = provider
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        with app.test_request_context('/api/notes'):
+            start = time.process_time()
+            response = handler()
+            body = response.get_data()
+            timings.append((time.process_time() - start) * 1000)
+        size = len(body)
+    return timings, size
+
+def run(app, repeat):
+    from flask import jsonify
+    from flask.json.provider import DefaultJSONProvider
+
+    import json_provider
+    from app import Note, get_notes
+
+    class StdlibJSONProvider(DefaultJSONProvider):
+        default = staticmethod(json_provider.json_default)
+
+    def orm_notes():
+        notes = Note.query.order_by(Note.updated_at.desc(), Note.id.desc()).all()
+        return jsonify({'success': True, 'data': [note.to_dict() for note in notes]})
+
+    stdlib = StdlibJSONProvider(app)
+    configs = [('ORM+标准库', stdlib, orm_notes), ('按列+标准库', stdlib, get_notes.__wrapped__)]
+    if json_provider.orjson is not None:
+        configs.append(('按列+orjson', json_provider.FastJSONProvider(app), get_notes.__wrapped__))
+    else:
+        print("⚠️ 未安装 orjson，跳过 按列+orjson")
+
+    rows = []
+    with app.app_context():
+        for name, provider, handler in configs:
+            measure(app, provider, handler, 1)  # 预热
+            timings, size = measure(app, provider, handler, repeat)
+            rows.append((name, percentile(timings, 50), percentile(timings, 95), size))
+    return rows
+
+def print_results(rows, note_count):
+    """打印结果表"""
+    print(f"\n📊 get_notes() 返回 {note_count} 条笔记，每次请求的CPU时间")
+    baseline = rows[0][1]
+    print(f"{'实现':<10} {'p50(ms)':>9} {'p95(ms)':>9} {'响应(KB)':>9} {'提升':>6}")
+    for name, p50, p95, size in rows:
+        print(f"{name:<10} {p50:>9.1f} {p95:>9.1f} {size / 1024:>9.0f} {baseline / p50:>5.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较列表接口不同序列化方式的CPU时间')
+    parser.add_argument('--notes', type=int, default=10000, help='笔记条数')
+    parser.add_argument('--content-size', type=int, default=500, help='每条笔记正文的字符数')
+    parser.add_argument('--repeat', type=int, default=10, help='每种实现的请求次数')
+    args = parser.parse_args()
+
+    print("=== AI记事本列表序列化基准测试 ===")
+
+    workdir = tempfile.mkdtemp(prefix='notes-serialization-bench-')
+    # 必须在导入 app 之前设置：使用临时数据库，不启动后台索引线程
+    os.environ['SQLITE_PATH'] = os.path.join(workdir, 'notes.db')
+    os.environ['VECTOR_INDEX_DIR'] = os.path.join(workdir, 'vector_index')
+    os.environ['INDEX_WORKER_ENABLED'] = 'false'
+    try:
+        from app import app
+
+        seed_notes(app.test_client(), args.notes, args.content_size)
+        rows = run(app, args.repeat)
+        print_results(rows, args.notes)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨项目任务查询基准测试
+在临时数据库中写入 --projects 个项目、共 --tasks 个任务（负责人从 --assignees 个人中轮换），
+比较"某人在所有项目中的任务"的两种取法：
+
+- 逐项目：GET /api/projects，再对每个项目请求 GET /api/projects/<id>/tasks?assignee=
+- 全局接口：GET /api/tasks?assignee=&include=project，项目摘要通过 JOIN 在同一条查询中取得
+
+同时记录全局接口翻完所有分页和 count_only 计数的耗时。
+用 Flask 测试客户端在进程内请求，结果不包括网络往返（逐项目方式实际还要乘以请求数的往返延迟）。
+
+用法：
+    python benchmark_tasks.py --projects 500 --tasks 100000
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmark_search import percentile
+
+STATUSES = ('todo', 'in_progress', 'done')
+PRIORITIES = ('low', 'medium', 'high')
+
+def check(response):
+    assert response.status_code < 300, response.get_json()
+    return response.get_json()
+
+def seed(client, project_count, task_count, assignee_count, batch_size):
+    """写入测试数据（任务用批量接口），返回 [负责人]"""
+    project_ids = [check(client.post('/api/projects', json={'title': f'项目 {i}'}))['data']['id'] for i in range(project_count)]
+
+    assignees = [f'成员{i}' for i in range(assignee_count)]
+    for start in range(0, task_count, batch_size):
+        items = [
+            {
+                'title': f'任务 {i}',
+                'project_id': project_ids[i % project_count],
+                'assignee': assignees[i % assignee_count],
+                'status': STATUSES[i % len(STATUSES)],
+                'priority': PRIORITIES[(i // 3) % len(PRIORITIES)],
+                'due_date': f'2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}T09:00:00' if i % 4 else None
+            }
+            for i in range(start, min(start + batch_size, task_count))
+        ]
+        check(client.post('/api/tasks/batch', json={'items': items}))
+    return assignees
+
+def per_project(client, assignee):
+    """逐项目请求，返回 (任务数, 请求数)"""
+    projects = check(client.get('/api/projects'))['data']
+    tasks = 0
+    for project in projects:
+        tasks += len(check(client.get(f"/api/projects/{project['id']}/tasks?assignee={assignee}"))['data'])
+    return tasks, len(projects) + 1
+
+def all_pages(client, url):
+    """翻完全局接口的所有分页，返回 (任务数, 请求数)"""
+    tasks = 0
+    requests_made = 0
+    cursor = None
+    while True:
+        result = check(client.get(url + (f'&cursor={cursor}' if cursor else '')))
+        requests_made += 1
+        tasks += len(result['data'])
+        if not result['pagination']['has_more']:
+            return tasks, requests_made
+        cursor = result['pagination']['next_cursor']
+
+def first_page(client, url):
+    result = check(client.get(url))
+    return len(result['data']), 1
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, value
+
+def run(client, assignee, page_size, repeat):
+    """返回 [(方式, p50毫秒, 任务数, 请求数)]"""
+    cases = [
+        ('逐项目请求（全部）', lambda: per_project(client, assignee), max(1, repeat // 5)),
+        ('全局接口首页', lambda: first_page(client, f'/api/tasks?assignee={assignee}&limit={page_size}'), repeat),
+        ('全局接口首页+项目', lambda: first_page(client, f'/api/tasks?assignee={assignee}&include=project&limit={page_size}'), repeat),
+        ('全局接口全部分页+项目', lambda: all_pages(client, f'/api/tasks?assignee={assignee}&include=project&limit=500'), repeat),
+        ('全局接口不分页+项目', lambda: first_page(client, f'/api/tasks?assignee={assignee}&include=project'), repeat),
+        ('count_only', lambda: (check(client.get(f'/api/tasks?assignee={assignee}&count_only=true'))['data']['total'], 1), repeat)
+    ]
+    rows = []
+    for name, func, times in cases:
+        timings, (tasks, requests_made) = timed(func, times)
+        rows.append((name, percentile(timings, 50), tasks, requests_made))
+    return rows
+
+def print_results(rows, args):
+    """打印结果表"""
+    print(f"\n📊 {args.projects} 个项目，{args.tasks} 个任务，查询一位负责人（约 {args.tasks // args.assignees} 个任务）")
+    print(f"{'方式':<16} {'p50(ms)':>10} {'任务数':>8} {'请求数':>7}")
+    for name, p50, tasks, requests_made in rows:
+        print(f"{name:<16} {p50:>10.1f} {tasks:>8} {requests_made:>7}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较逐项目请求与跨项目任务接口')
+    parser.add_argument('--projects', type=int, default=500, help='项目数')
+    parser.add_argument('--tasks', type=int, default=100000, help='任务总数')
+    parser.add_argument('--assignees', type=int, default=50, help='负责人数')
+    parser.add_argument('--page-size', type=int, default=50, help='首页条数')
+    parser.add_argument('--repeat', type=int, default=10, help='每种方式的重复次数')
+    args = parser.parse_args()
+
+    print("=== AI记事本跨项目任务查询基准测试 ===")
+
+    workdir = tempfile.mkdtemp(prefix='notes-tasks-bench-')
+    # 必须在导入 app 之前设置：使用临时数据库，不启动后台索引线程
+    os.environ['SQLITE_PATH'] = os.path.join(workdir, 'notes.db')
+    os.environ['VECTOR_INDEX_DIR'] = os.path.join(workdir, 'vector_index')
+    os.environ['INDEX_WORKER_ENABLED'] = 'false'
+    try:
+        from app import BATCH_MAX_ITEMS, app
+
+        client = app.test_client()
+        start = time.perf_counter()
+        assignees = seed(client, args.projects, args.tasks, args.assignees, BATCH_MAX_ITEMS)
+        print(f"✓ 已写入测试数据（{time.perf_counter() - start:.1f}s）")
+
+        rows = run(client, assignees[0], args.page_size, args.repeat)
+        print_results(rows, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导出/导入内存检查
+生成指定大小的数据库，通过 GET /api/export 把全部数据流式写入文件，
+再用 POST /api/import 把该文件流式导入到一个空数据库，
+分别在独立进程中记录峰值内存（RSS），并核对导入前后的行数。
+
+峰值内存应与数据量无关：超过 --max-rss-mb 时以非零状态退出。
+注意 SQLite 的 mmap_size（wal 配置为256MB）读取过的页面也计入RSS。
+tests/test_export_memory.py 以较小的数据量（按比例缩小页缓存和批大小）运行同样的检查。
+
+用法：
+    python check_export_memory.py --size-mb 2048
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmark_search import generate_sentence
+
+NOTE_BATCH = 200
+ENTITY_TABLES = ('projects', 'tasks', 'notes', 'todos')
+
+def current_rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1024 / 1024
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux下单位为KB
+
+def load_app(db_path, workdir):
+    """在子进程中按指定数据库导入 app（环境变量必须在导入前设置）"""
+    os.environ['SQLITE_PATH'] = db_path
+    os.environ['VECTOR_INDEX_DIR'] = os.path.join(workdir, 'vector_index')
+    os.environ['INDEX_WORKER_ENABLED'] = 'false'
+    import app
+    return app
+
+def table_counts(db_path):
+    conn = sqlite3.connect(db_path)
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ENTITY_TABLES}
+    conn.close()
+    return counts
+
+def generate(db_path, workdir, size_mb, note_kb, item_rows, results):
+    """建表后写入约 size_mb 的笔记，以及 item_rows 条任务和待办（分属100个项目）"""
+    app = load_app(db_path, workdir)
+    rng = random.Random(42)
+    paragraphs = [''.join(generate_sentence(rng) for _ in range(20)) for _ in range(500)]
+
+    with app.app.app_context():
+        # 使用应用的连接：全文索引触发器依赖其中注册的自定义函数
+        conn = app.db.engine.raw_connection()
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT INTO projects (title, description, status, priority, created_at, updated_at) "
+            "VALUES (?, '', 'active', 'medium', datetime('now'), datetime('now'))",
+            [(f'项目 {i}',) for i in range(100)]
+        )
+        cursor.executemany(
+            "INSERT INTO tasks (title, description, status, priority, assignee, project_id, created_at, updated_at) "
+            "VALUES (?, ?, 'todo', 'medium', '', ?, datetime('now'), datetime('now'))",
+            [(f'任务 {i}', rng.choice(paragraphs), i % 100 + 1) for i in range(item_rows)]
+        )
+        cursor.executemany(
+            "INSERT INTO todos (title, description, completed, priority, created_at, updated_at) "
+            "VALUES (?, ?, 0, 'low', datetime('now'), datetime('now'))",
+            [(f'待办 {i}', rng.choice(paragraphs)) for i in range(item_rows)]
+        )
+
+        written = 0
+        target = size_mb * 1024 * 1024
+        while written < target:
+            batch = []
+            for _ in range(NOTE_BATCH):
+                content = ''
+                while len(content.encode('utf-8')) < note_kb * 1024:
+                    content += rng.choice(paragraphs) + '\n\n'
+                batch.append((rng.choice(paragraphs)[:30], content))
+                written += len(content.encode('utf-8'))
+            cursor.executemany(
+                "INSERT INTO notes (title, content, tags, created_at, updated_at) "
+                "VALUES (?, ?, '[\"基准测试\"]', datetime('now'), datetime('now'))",
+                batch
+            )
+            conn.commit()
+        conn.close()
+    results.put({'written_mb': written / 1024 / 1024})
+
+def export(db_path, workdir, export_path, results):
+    """调用 GET /api/export，把响应流逐块写入文件"""
+    app = load_app(db_path, workdir)
+    client = app.app.test_client()
+    baseline = current_rss_mb()
+    start = time.perf_counter()
+    response = client.get('/api/export', buffered=False)
+    with open(export_path, 'wb') as f:
+        for chunk in response.iter_encoded():
+            f.write(chunk)
+    response.close()
+    results.put({
+        'seconds': time.perf_counter() - start,
+        'baseline_mb': baseline,
+        'peak_mb': peak_rss_mb()
+    })
+
+def import_file(db_path, workdir, export_path, results):
+    """把导出文件作为请求体流式传给 POST /api/import"""
+    app = load_app(db_path, workdir)
+    client = app.app.test_client()
+    baseline = current_rss_mb()
+    start = time.perf_counter()
+    with open(export_path, 'rb') as f:
+        response = client.post(
+            '/api/import',
+            input_stream=f,
+            content_length=os.path.getsize(export_path),
+            content_type='application/x-ndjson'
+        )
+    results.put({
+        'seconds': time.perf_counter() - start,
+        'baseline_mb': baseline,
+        'peak_mb': peak_rss_mb(),
+        'response': response.get_json()
+    })
+
+def run_step(target, *args):
+    """在新进程中运行一步（spawn：每个进程按自己的 SQLITE_PATH 重新导入 app）"""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=target, args=(*args, results))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                raise RuntimeError(f'{target.__name__} 进程异常退出（退出码 {process.exitcode}）')
+    process.join()
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='检查流式导出/导入的峰值内存')
+    parser.add_argument('--size-mb', type=int, default=2048, help='生成的笔记正文总大小（MB）')
+    parser.add_argument('--note-kb', type=int, default=64, help='每条笔记正文的大小（KB）')
+    parser.add_argument('--item-rows', type=int, default=10000, help='任务和待办各自的条数')
+    parser.add_argument('--max-rss-mb', type=float, default=512, help='导出/导入进程允许的峰值RSS（MB）')
+    parser.add_argument('--keep', action='store_true', help='保留生成的数据库和导出文件')
+    args = parser.parse_args()
+
+    print("=== AI记事本导出/导入内存检查 ===")
+
+    workdir = tempfile.mkdtemp(prefix='notes-export-check-')
+    source_db = os.path.join(workdir, 'source.db')
+    target_db = os.path.join(workdir, 'target.db')
+    export_path = os.path.join(workdir, 'export.ndjson')
+    try:
+        print(f"生成约 {args.size_mb}MB 的笔记...", flush=True)
+        generated = run_step(generate, source_db, workdir, args.size_mb, args.note_kb, args.item_rows)
+        print(f"✓ 正文 {generated['written_mb']:.0f}MB，数据库 {os.path.getsize(source_db) / 1024 / 1024:.0f}MB")
+
+        print("导出...", flush=True)
+        exported = run_step(export, source_db, workdir, export_path)
+        export_mb = os.path.getsize(export_path) / 1024 / 1024
+        print(f"✓ {export_mb:.0f}MB，{exported['seconds']:.1f}s")
+
+        print("导入到空数据库...", flush=True)
+        imported = run_step(import_file, target_db, workdir, export_path)
+        print(f"✓ {imported['seconds']:.1f}s，{imported['response']['data']}")
+
+        source_counts = table_counts(source_db)
+        target_counts = table_counts(target_db)
+
+        print(f"\n📊 导出文件 {export_mb:.0f}MB")
+        print(f"{'步骤':<6} {'导入app后RSS(MB)':>18} {'峰值RSS(MB)':>13}")
+        print(f"{'导出':<6} {exported['baseline_mb']:>18.0f} {exported['peak_mb']:>13.0f}")
+        print(f"{'导入':<6} {imported['baseline_mb']:>18.0f} {imported['peak_mb']:>13.0f}")
+        print(f"源数据库行数: {source_counts}")
+        print(f"导入后行数:   {target_counts}")
+
+        failures = []
+        for step, result in (('导出', exported), ('导入', imported)):
+            if result['peak_mb'] > args.max_rss_mb:
+                failures.append(f"{step}峰值RSS {result['peak_mb']:.0f}MB 超过 {args.max_rss_mb:.0f}MB")
+        if source_counts != target_counts:
+            failures.append('导入后的行数与源数据库不一致')
+
+        if failures:
+            for failure in failures:
+                print(f"❌ {failure}")
+            sys.exit(1)
+        print("✅ 峰值内存在限制内，数据完整导入")
+    finally:
+        if args.keep:
+            print(f"\n数据文件保留在: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
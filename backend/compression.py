@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+笔记正文的压缩存储
+从文档、聊天记录粘贴的笔记可达数百KB，以原文保存会占满数据库文件和页缓存。
+超过阈值的正文在写入时用zlib压缩，以BLOB保存在原来的 notes.content 列中
+（SQLite的列类型是动态的，同一列可以同时存放TEXT和BLOB），小笔记仍保存原文：
+
+- ORM和Core读写经过 CompressedText 列类型，写入时自动压缩、读取时自动解压，接口看到的始终是原文
+- SQL中需要文本的地方使用注册到连接上的函数：note_text() 还原完整正文（全文索引触发器、LIKE回退），
+  note_prefix() 只解压开头部分（列表摘要），不解压整篇正文
+- 修改阈值后，已有的行由 `flask compress-notes` 分批重新编码
+"""
+
+import zlib
+
+from sqlalchemy.types import Text, TypeDecorator
+
+COMPRESSION_LEVEL = 6
+DEFAULT_THRESHOLD = 16384  # 字节，0 表示不压缩
+
+# UTF-8 每个字符最多4个字节，取前 n 个字符最多需要解压 4n 字节
+MAX_CHAR_BYTES = 4
+
+def encode_content(text, threshold=DEFAULT_THRESHOLD):
+    """正文的存储形式：UTF-8编码达到阈值且压缩后更小时返回zlib压缩的bytes，否则返回原文"""
+    if not text or threshold <= 0:
+        return text
+    data = text.encode('utf-8')
+    if len(data) < threshold:
+        return text
+    compressed = zlib.compress(data, COMPRESSION_LEVEL)
+    return compressed if len(compressed) < len(data) else text
+
+def note_text(value):
+    """还原完整正文（原文直接返回）"""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+def note_prefix(value, length):
+    """正文的前 length 个字符，压缩的正文只解压开头部分"""
+    if isinstance(value, bytes):
+        data = zlib.decompressobj().decompress(value, length * MAX_CHAR_BYTES)
+        # 截断处可能落在多字节字符中间，忽略不完整的字符
+        return data.decode('utf-8', errors='ignore')[:length]
+    if value is None:
+        return None
+    return value[:length]
+
+def stored_size(value):
+    """正文存储形式占用的字节数"""
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return len(value or b'')
+
+def register_functions(connection):
+    """在sqlite3连接上注册正文解码函数（notes 的全文索引触发器和内容视图需要 note_text）"""
+    connection.create_function('note_text', 1, note_text, deterministic=True)
+    connection.create_function('note_prefix', 2, note_prefix, deterministic=True)
+
+class CompressedText(TypeDecorator):
+    """超过阈值时以zlib压缩保存的文本列"""
+
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+
+    def process_bind_param(self, value, dialect):
+        return encode_content(value, self.threshold)
+
+    def process_result_value(self, value, dialect):
+        return note_text(value)
+
+    def coerce_compared_value(self, op, value):
+        """比较和LIKE的参数按原文绑定，不压缩"""
+        return self.impl
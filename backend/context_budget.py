@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+聊天上下文的token预算
+按所选模型估算token数，把排序后的知识库条目和历史对话装入固定的token预算：
+条目按相关度依次放入，超出剩余预算时在句子边界截断，与已选条目高度重叠的条目跳过。
+
+安装了 tiktoken 时OpenAI模型使用其精确计数；其他模型（以及未安装tiktoken时）
+按字符类别估算：CJK字符按每字的token数计，其余文本按每token的平均字符数计，估算值偏保守。
+"""
+
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 各模型的上下文窗口（token）
+MODEL_CONTEXT_WINDOWS = {
+    'anthropic/claude-3.5-sonnet': 200000,
+    'anthropic/claude-3-opus': 200000,
+    'anthropic/claude-3-haiku': 200000,
+    'openai/gpt-4o': 128000,
+    'openai/gpt-4-turbo': 128000,
+    'google/gemini-pro': 32768,
+    'meta-llama/llama-3.1-405b-instruct': 131072,
+    'qwen/qwen-2.5-72b-instruct': 32768
+}
+DEFAULT_CONTEXT_WINDOW = 32768
+
+# 按模型厂商估算：(每个CJK字符的token数, 其余文本每个token的平均字符数)
+TOKEN_RATIOS = {
+    'anthropic': (1.2, 3.5),
+    'openai': (1.0, 4.0),
+    'google': (1.0, 4.0),
+    'meta-llama': (1.3, 4.0),
+    'qwen': (0.8, 4.0)
+}
+DEFAULT_TOKEN_RATIO = (1.3, 3.5)
+
+# tiktoken 编码
+TIKTOKEN_ENCODINGS = {
+    'openai/gpt-4o': 'o200k_base',
+    'openai/gpt-4-turbo': 'cl100k_base'
+}
+
+# 每条消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+CJK_CHAR = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef\u3040-\u30ff\uac00-\ud7af]')
+# 句子结束位置：中英文句末标点或换行
+SENTENCE_END = re.compile(r'[。！？；!?;]|\.(?=\s)|\n')
+
+_counters = {}
+
+class TokenCounter:
+    """某个模型的token计数器"""
+
+    def __init__(self, model):
+        self.model = model
+        self.encoding = None
+        if tiktoken is not None and model in TIKTOKEN_ENCODINGS:
+            try:
+                self.encoding = tiktoken.get_encoding(TIKTOKEN_ENCODINGS[model])
+            except Exception as e:
+                # 编码文件需要下载，离线环境下使用估算
+                print(f"加载tiktoken编码失败，使用估算的token数: {e}")
+        self.cjk_ratio, self.chars_per_token = TOKEN_RATIOS.get(model.split('/')[0], DEFAULT_TOKEN_RATIO)
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        cjk = len(CJK_CHAR.findall(text))
+        return int(cjk * self.cjk_ratio + (len(text) - cjk) / self.chars_per_token + 0.999)
+
+    def count_message(self, text):
+        return self.count(text) + MESSAGE_OVERHEAD_TOKENS
+
+def get_token_counter(model):
+    """返回模型的token计数器（按模型缓存）"""
+    counter = _counters.get(model)
+    if counter is None:
+        counter = _counters[model] = TokenCounter(model)
+    return counter
+
+def context_window(model):
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+def truncate_to_tokens(text, max_tokens, counter, suffix='...'):
+    """把文本截断到 max_tokens 以内，优先在句子边界截断；放不下任何内容时返回空字符串"""
+    if counter.count(text) <= max_tokens:
+        return text
+
+    # 二分查找放得下的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if counter.count(text[:middle] + suffix) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    if low == 0:
+        return ''
+
+    prefix = text[:low]
+    boundaries = [match.end() for match in SENTENCE_END.finditer(prefix)]
+    # 句子边界太靠前时（会丢掉一半以上的内容）直接在字符处截断
+    if boundaries and boundaries[-1] >= low // 2:
+        prefix = prefix[:boundaries[-1]]
+    return prefix.rstrip() + suffix
+
+def shingles(text, size=2):
+    """去掉空白和标点后的字符n-gram集合，用于判断内容重叠"""
+    normalized = re.sub(r'[\W_]+', '', (text or '').lower())
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+def overlaps(shingle_set, selected, threshold):
+    """与已选内容的重叠度（交集 / 较小集合）是否达到阈值"""
+    if not shingle_set:
+        return False
+    for other in selected:
+        if other and len(shingle_set & other) / min(len(shingle_set), len(other)) >= threshold:
+            return True
+    return False
+
+def pack_items(items, budget, counter, min_tokens=32, overlap_threshold=0.8):
+    """按顺序把条目装入token预算
+
+    items: [(key, text)]，按优先级从高到低排列。
+    返回 (装入的 [(key, 文本)]，使用的token数，跳过的key列表)；
+    放不下完整条目时，剩余预算不少于 min_tokens 则截断后放入，之后的条目不再放入
+    """
+    packed = []
+    skipped = []
+    selected_shingles = []
+    used = 0
+    for key, text in items:
+        item_shingles = shingles(text)
+        if overlaps(item_shingles, selected_shingles, overlap_threshold):
+            skipped.append(key)
+            continue
+
+        remaining = budget - used
+        tokens = counter.count(text)
+        if tokens > remaining:
+            text = truncate_to_tokens(text, remaining, counter) if remaining >= min_tokens else ''
+            if not text:
+                skipped.append(key)
+                continue
+            tokens = counter.count(text)
+            # 截断后预算已用尽
+            budget = used + tokens
+
+        packed.append((key, text))
+        selected_shingles.append(item_shingles)
+        used += tokens
+    return packed, used, skipped
@@ -2,88 +2,51 @@
 # -*- coding: utf-8 -*-
 """
 数据库索引创建脚本
-为notes表添加必要的索引以优化查询性能
+执行 migrations.py 中的结构迁移，并可按指定的分词模式重建全文搜索索引
+（应用启动和 `flask db-upgrade` 也会执行迁移，但不会改变已有全文搜索表的分词模式）
 """
 
+import argparse
 import sqlite3
 import os
 
-def create_indexes():
-    """创建数据库索引"""
-    db_path = 'notes.db'
-    
+import compression
+from migrations import FTS_COMPRESSED_COLUMNS, FTS_TABLES, create_fts_table, upgrade
+from search_tokenizer import DEFAULT_TOKENIZER, TOKENIZERS, register_functions
+
+# 与 app.py 使用同一个数据库文件
+DEFAULT_DB_PATH = os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'notes.db'))
+
+def create_indexes(db_path=DEFAULT_DB_PATH, tokenizer=DEFAULT_TOKENIZER):
+    """执行未执行的结构迁移（索引和全文搜索表），并按指定分词模式重建全文搜索索引"""
     if not os.path.exists(db_path):
-        print(f"数据库文件 {db_path} 不存在")
+        print(f"数据库文件 {db_path} 不存在（先启动一次 app.py 创建数据表）")
         return False
     
     try:
         conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # 创建索引SQL语句
-        indexes = [
-            # 标题索引 - 用于按标题搜索和排序
-            "CREATE INDEX IF NOT EXISTS idx_notes_title ON notes(title);",
-            
-            # 更新时间索引 - 用于按时间排序（最常用）
-            "CREATE INDEX IF NOT EXISTS idx_notes_updated_at ON notes(updated_at DESC);",
-            
-            # 创建时间索引 - 用于按创建时间排序
-            "CREATE INDEX IF NOT EXISTS idx_notes_created_at ON notes(created_at DESC);",
-            
-            # 标题和更新时间复合索引 - 用于复合查询优化
-            "CREATE INDEX IF NOT EXISTS idx_notes_title_updated ON notes(title, updated_at DESC);",
-            
-            # 内容全文搜索索引（SQLite FTS虚拟表）
-            "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(title, content, content='notes', content_rowid='id');",
-            
-            # 触发器：当notes表插入时同步到FTS表
-            """CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
-                INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
-            END;""",
-            
-            # 触发器：当notes表更新时同步到FTS表
-            """CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE ON notes BEGIN
-                UPDATE notes_fts SET title = new.title, content = new.content WHERE rowid = new.id;
-            END;""",
-            
-            # 触发器：当notes表删除时同步到FTS表
-            """CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
-                DELETE FROM notes_fts WHERE rowid = old.id;
-            END;"""
-        ]
+        register_functions(conn)
+        compression.register_functions(conn)
         
-        print("开始创建数据库索引...")
+        print("执行数据库迁移...")
+        executed = upgrade(conn, tokenizer)
+        for version, name in executed:
+            print(f"  [{version:03d}] {name} ✓")
+        if not executed:
+            print("  已是最新版本")
         
-        for i, sql in enumerate(indexes, 1):
-            print(f"[{i}/{len(indexes)}] 执行: {sql.split()[0:5]}", end=" ")
-            cursor.execute(sql)
+        # 重建全文搜索表（分词模式变化时删除旧表重建）
+        print(f"构建全文搜索索引（分词模式: {tokenizer}）...")
+        cursor = conn.cursor()
+        for fts_name, (source, columns) in FTS_TABLES.items():
+            print(f"  {fts_name} <- {source}({', '.join(columns)})", end=" ")
+            create_fts_table(cursor, fts_name, source, columns, tokenizer, FTS_COMPRESSED_COLUMNS.get(fts_name, ()))
             print("✓")
-        
-        # 如果FTS表为空，初始化数据
-        cursor.execute("SELECT COUNT(*) FROM notes_fts")
-        fts_count = cursor.fetchone()[0]
-        
-        if fts_count == 0:
-            print("初始化全文搜索索引数据...")
-            cursor.execute("""
-                INSERT INTO notes_fts(rowid, title, content)
-                SELECT id, title, content FROM notes
-            """)
-            print("✓ 全文搜索索引数据初始化完成")
-        
         conn.commit()
         conn.close()
+        print("✓ 全文搜索索引数据初始化完成")
         
         print("\n✅ 所有索引创建完成！")
-        print("\n已创建的索引：")
-        print("- idx_notes_title: 标题索引")
-        print("- idx_notes_updated_at: 更新时间索引")
-        print("- idx_notes_created_at: 创建时间索引")
-        print("- idx_notes_title_updated: 标题+时间复合索引")
-        print("- notes_fts: 全文搜索虚拟表")
-        print("- 相关触发器: 自动同步FTS数据")
-        
         return True
         
     except sqlite3.Error as e:
@@ -93,10 +56,10 @@ def create_indexes():
         print(f"❌ 未知错误: {e}")
         return False
 
-def show_database_info():
+def show_database_info(db_path=DEFAULT_DB_PATH):
     """显示数据库信息"""
     try:
-        conn = sqlite3.connect('notes.db')
+        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         
         # 显示表信息
@@ -124,10 +87,19 @@ def show_database_info():
         print(f"❌ 获取数据库信息失败: {e}")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='创建数据库索引并（重新）构建全文搜索索引')
+    parser.add_argument(
+        '--tokenizer', choices=TOKENIZERS,
+        default=os.getenv('FTS_TOKENIZER', DEFAULT_TOKENIZER),
+        help='全文搜索分词模式；中文笔记推荐 bigram 或 trigram（默认读取 FTS_TOKENIZER 环境变量）'
+    )
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='数据库文件路径（默认读取 SQLITE_PATH 环境变量）')
+    args = parser.parse_args()
+    
     print("=== AI记事本数据库索引优化工具 ===")
     print()
     
-    if create_indexes():
-        show_database_info()
+    if create_indexes(args.db, args.tokenizer):
+        show_database_info(args.db)
     else:
         print("❌ 索引创建失败")
\ No newline at end of file
@@ -35,7 +35,7 @@ fi
 
 # 初始化数据库
 echo "🗄️  初始化数据库..."
-python create_indexes.py
+FLASK_APP=app.py flask db-upgrade
 
 echo "📋 后端部署选项："
 echo "1. Railway (推荐)"
@@ -74,7 +74,7 @@ case $choice in
         echo "2. 连接您的GitHub仓库"
         echo "3. 选择Web Service"
         echo "4. 设置构建命令: pip install -r requirements.txt"
-        echo "5. 设置启动命令: python app.py"
+        echo "5. 设置启动命令: gunicorn asgi:application"
         echo "6. 添加环境变量"
         ;;
     4)
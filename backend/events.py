@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据变更推送（Server-Sent Events）
+每个进程只有一个轮询任务读取变更日志（change_log，由数据库触发器在写入的同一事务中记录，
+因此能看到所有gunicorn worker和脚本的写入），每条变更只序列化一次，再分发给各订阅者的队列。
+订阅者只是事件循环中的一个协程和一个队列，不占用数据库连接和线程。
+
+事件的 id 就是变更的 seq：断线重连时浏览器带上 Last-Event-ID，从变更日志补发错过的事件；
+订阅者处理太慢导致队列满，或需要补发的变更太多时，发送 reset 事件并断开，
+客户端应通过 /api/sync 增量同步后重新订阅。
+"""
+
+import asyncio
+
+import json_provider
+
+POLL_INTERVAL = 0.5  # 秒
+HEARTBEAT_INTERVAL = 15  # 秒，注释行保持连接不被代理断开
+FETCH_LIMIT = 500  # 每次读取的变更数
+QUEUE_SIZE = 1000  # 每个订阅者最多缓存的事件数
+CATCHUP_LIMIT = 5000  # 重连时最多补发的变更数
+RETRY_MS = 3000  # 浏览器断线后的重连间隔
+
+RESET = object()
+
+def format_event(change):
+    """把一条变更格式化为SSE消息"""
+    data = json_provider.dumps(change)
+    return f"id: {change['seq']}\nevent: change\ndata: {data}\n\n".encode('utf-8')
+
+def format_reset(seq):
+    data = json_provider.dumps({'seq': seq, 'reason': '错过的变更过多，请通过 /api/sync 同步后重新订阅'})
+    return f"event: reset\ndata: {data}\n\n".encode('utf-8')
+
+class Subscriber:
+    """一个SSE连接：关注的实体类型和待发送的事件队列"""
+
+    def __init__(self, types, last_seq):
+        self.types = set(types)
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        # 订阅时已发布到的 seq：补发只补到这里，之后的变更由队列送达
+        self.subscribed_at = last_seq
+
+class EventHub:
+    """变更日志轮询与分发
+
+    fetch_changes(since, limit) -> (变更列表, 是否还有更多) 和 latest_seq() 为同步函数，
+    在线程中执行；每次轮询只占用一个数据库连接
+    """
+
+    def __init__(self, fetch_changes, latest_seq, poll_interval=POLL_INTERVAL):
+        self.fetch_changes = fetch_changes
+        self.latest_seq = latest_seq
+        self.poll_interval = poll_interval
+        self.subscribers = set()
+        self.last_seq = 0
+        self.published = 0
+        self._task = None
+        self._started = None
+        self._loop = None
+        self._wakeup = None
+
+    async def start(self):
+        """启动轮询任务（重复调用无副作用）"""
+        if self._started is None:
+            self._started = asyncio.get_running_loop().create_future()
+            try:
+                self._loop = asyncio.get_running_loop()
+                self._wakeup = asyncio.Event()
+                self.last_seq = await asyncio.to_thread(self.latest_seq)
+                self._task = asyncio.create_task(self.poll_loop())
+                self._started.set_result(True)
+            except Exception as e:
+                self._started.set_exception(e)
+                self._started = None
+                raise
+        await self._started
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._started = None
+
+    async def poll_loop(self):
+        while True:
+            # 读取前清除：读取期间到达的通知会触发下一次读取
+            self._wakeup.clear()
+            try:
+                changes, has_more = await asyncio.to_thread(self.fetch_changes, self.last_seq, FETCH_LIMIT)
+                self.publish(changes)
+            except Exception as e:
+                print(f"读取变更日志失败: {e}")
+                has_more = False
+            if not has_more:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def notify(self):
+        """本进程提交了写入时立即轮询（可在任意线程调用）；其他进程的写入由定时轮询发现"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def publish(self, changes):
+        """分发变更；在事件循环中执行，与 subscribe 不会交错"""
+        for change in changes:
+            message = format_event(change)
+            for subscriber in list(self.subscribers):
+                if change['entity'] not in subscriber.types:
+                    continue
+                try:
+                    subscriber.queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    self.drop(subscriber)
+            self.last_seq = change['seq']
+            self.published += 1
+
+    def drop(self, subscriber):
+        """跟不上的订阅者：清空队列，只留一个 reset 事件"""
+        self.subscribers.discard(subscriber)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(RESET)
+
+    def subscribe(self, types):
+        subscriber = Subscriber(types, self.last_seq)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def catch_up(self, subscriber, since):
+        """补发 since 之后、订阅之前的变更，返回SSE消息列表；太多时返回 None"""
+        messages = []
+        while since < subscriber.subscribed_at:
+            changes, has_more = await asyncio.to_thread(self.fetch_changes, since, FETCH_LIMIT)
+            for change in changes:
+                if change['seq'] > subscriber.subscribed_at:
+                    return messages
+                if change['entity'] in subscriber.types:
+                    messages.append(format_event(change))
+            if len(messages) > CATCHUP_LIMIT:
+                return None
+            if not has_more or not changes:
+                break
+            since = changes[-1]['seq']
+        return messages
+
+    async def stream(self, subscriber, since=None):
+        """订阅者的SSE消息流（异步生成器），出现 reset 时结束"""
+        yield f"retry: {RETRY_MS}\n\n".encode('utf-8')
+        if since is not None:
+            messages = await self.catch_up(subscriber, since)
+            if messages is None:
+                self.unsubscribe(subscriber)
+                yield format_reset(subscriber.subscribed_at)
+                return
+            for message in messages:
+                yield message
+
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            if message is RESET:
+                yield format_reset(self.last_seq)
+                return
+            yield message
+
+    def stats(self):
+        return {
+            'subscribers': len(self.subscribers),
+            'last_seq': self.last_seq,
+            'published': self.published
+        }
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟的OpenAI兼容聊天服务
+用于在不访问OpenRouter的情况下调试、压测和测试 /api/chat（包括流式模式）。
+测试中可设置 FakeLLMHandler 的类属性模拟上游故障：fail_status 让请求返回该HTTP状态码，
+disconnect_after 让流式回复发送这么多个token后直接断开连接（不发送 [DONE]）
+
+用法：
+    python fake_llm_server.py --port 8099 --first-token-delay 0.5 --token-delay 0.05
+    OPENROUTER_API_URL=http://127.0.0.1:8099/v1/chat/completions OPENROUTE_API_KEY=test python app.py
+"""
+
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """处理 POST /v1/chat/completions，回复内容为用户最后一条消息的复述"""
+
+    protocol_version = 'HTTP/1.1'
+    first_token_delay = 0.5
+    token_delay = 0.05
+    fail_status = None
+    disconnect_after = None
+
+    def log_message(self, format, *args):
+        # 压测时不输出每个请求的日志
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        messages = request.get('messages') or [{}]
+        reply = f"这是模拟回复：{messages[-1].get('content', '')}"
+        model = request.get('model', 'fake/model')
+
+        if self.fail_status:
+            self.send_error_response(self.fail_status)
+        elif request.get('stream'):
+            self.send_stream(model, reply)
+        else:
+            self.send_complete(model, reply)
+
+    def send_complete(self, model, reply):
+        """非流式：等待全部生成时间后一次性返回"""
+        time.sleep(self.first_token_delay + self.token_delay * len(reply))
+        body = json.dumps({
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': reply},
+                'finish_reason': 'stop'
+            }]
+        }, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_response(self, status):
+        body = json.dumps({'error': {'code': status, 'message': '模拟的上游错误'}}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, model, reply):
+        """流式：按OpenAI格式逐字发送SSE数据块，以 [DONE] 结束"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')  # 分块传输，连接可复用
+        self.end_headers()
+
+        # OpenRouter在生成前会发送注释行保活
+        self.write_chunk(b': OPENROUTER PROCESSING\n\n')
+        time.sleep(self.first_token_delay)
+
+        for index, char in enumerate(reply):
+            if self.disconnect_after is not None and index >= self.disconnect_after:
+                # 不写入结束分块，直接关闭连接
+                self.close_connection = True
+                return
+            chunk = {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion.chunk',
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': char}, 'finish_reason': None}]
+            }
+            self.write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            time.sleep(self.token_delay)
+
+        self.write_chunk(b'data: [DONE]\n\n')
+        self.write_chunk(b'')
+
+    def write_chunk(self, data):
+        """写入一个分块（空数据表示结束）"""
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+def create_server(port, first_token_delay, token_delay):
+    """创建模拟服务（port 为 0 时由系统分配端口，见 server.server_port），由调用方运行 serve_forever()"""
+    FakeLLMHandler.first_token_delay = first_token_delay
+    FakeLLMHandler.token_delay = token_delay
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeLLMHandler)
+    server.daemon_threads = True
+    return server
+
+def run_server(port, first_token_delay, token_delay):
+    """启动模拟服务（阻塞）"""
+    server = create_server(port, first_token_delay, token_delay)
+    print(f"模拟LLM服务已启动: http://127.0.0.1:{port}/v1/chat/completions")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地模拟的OpenAI兼容聊天服务')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--first-token-delay', type=float, default=0.5, help='首个token前的等待秒数')
+    parser.add_argument('--token-delay', type=float, default=0.05, help='每个token之间的等待秒数')
+    args = parser.parse_args()
+
+    run_server(args.port, args.first_token_delay, args.token_delay)
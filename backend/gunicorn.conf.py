@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn配置（railway.toml / Procfile 的 `gunicorn asgi:application` 会自动读取当前目录下的本文件）
+每个worker进程有独立的数据库连接池，大小由 app.py 的 DB_POOL_SIZE 按 GUNICORN_THREADS 计算
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+# uvicorn worker运行ASGI入口：SSE推送 /api/events 和异步聊天在事件循环中处理，
+# 其余Flask接口在每个进程 GUNICORN_THREADS 个线程中执行（见 asgi.py 的 WSGI_THREADS）。
+# 只运行WSGI应用（没有 /api/events）时设置 GUNICORN_WORKER_CLASS=gthread 并以 `gunicorn app:app` 启动
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+threads = int(os.getenv('GUNICORN_THREADS', 4))  # gthread worker的线程数
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库结构迁移
+db.create_all() 只创建模型中定义的表，查询需要的索引和全文搜索表由这里的版本化迁移创建。
+已执行的迁移记录在 schema_migrations 表中，每个迁移只执行一次：
+
+- 应用启动时自动执行（AUTO_MIGRATE=false 时关闭）
+- 部署时执行 `flask db-upgrade`
+- 或运行 create_indexes.py
+"""
+
+from datetime import datetime
+
+from search_tokenizer import DEFAULT_TOKENIZER, FTS_SETTINGS_TABLE, fts_table_options
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+# 全文搜索表定义：FTS表名 -> (源表, 索引列)
+# 使用外部内容表（content=源表）或无内容表，FTS只保存倒排索引，不重复存储正文
+FTS_TABLES = {
+    'notes_fts': ('notes', ['title', 'content', 'tags']),
+    'projects_fts': ('projects', ['title', 'description']),
+    'tasks_fts': ('tasks', ['title', 'description', 'assignee']),
+    'todos_fts': ('todos', ['title', 'description']),
+}
+
+# 可能以压缩形式保存的列（见 compression.py，迁移9起）：触发器写入FTS前用 note_text() 还原原文，
+# 外部内容表改为指向还原后的视图 <FTS表名>_source，highlight()/snippet() 读取的也是原文。
+# 下面的函数默认 compressed=() 生成的是迁移3发布时的SQL，已发布的迁移不能随之改变
+FTS_COMPRESSED_COLUMNS = {
+    'notes_fts': ['content'],
+}
+
+def fts_content_source(fts_name, source, compressed=()):
+    """外部内容表的来源：有压缩列时为解压视图，否则为源表"""
+    return f'{fts_name}_source' if compressed else source
+
+def fts_source_view_sql(fts_name, source, columns, compressed):
+    """生成外部内容视图的建表语句（列名与FTS表相同，压缩列经 note_text() 还原）"""
+    values = ', '.join(f'note_text({col}) AS {col}' if col in compressed else col for col in columns)
+    return f"CREATE VIEW {fts_content_source(fts_name, source, compressed)} AS SELECT id, {values} FROM {source}"
+
+def fts_table_sql(fts_name, source, columns, tokenizer=DEFAULT_TOKENIZER, compressed=()):
+    """生成FTS5虚拟表的建表语句"""
+    return (
+        f"CREATE VIRTUAL TABLE {fts_name} USING fts5("
+        f"{', '.join(columns)}, {fts_table_options(fts_content_source(fts_name, source, compressed), tokenizer)})"
+    )
+
+def fts_column_values(prefix, columns, tokenizer, compressed=()):
+    """触发器中写入FTS表的列值：压缩列先经过 note_text() 还原，bigram模式再经过 cjk_bigrams() 切分"""
+    values = [f'note_text({prefix}.{col})' if col in compressed else f'{prefix}.{col}' for col in columns]
+    if tokenizer == 'bigram':
+        return ', '.join(f'cjk_bigrams({value})' for value in values)
+    return ', '.join(values)
+
+def fts_trigger_sqls(fts_name, source, columns, tokenizer=DEFAULT_TOKENIZER, compressed=()):
+    """生成保持FTS索引与源表同步的触发器
+    
+    外部内容表/无内容表不能直接 UPDATE/DELETE，必须先用 'delete' 命令写入旧值再插入新值
+    """
+    cols = ', '.join(columns)
+    new_values = fts_column_values('new', columns, tokenizer, compressed)
+    old_values = fts_column_values('old', columns, tokenizer, compressed)
+    insert_new = f"INSERT INTO {fts_name}(rowid, {cols}) VALUES (new.id, {new_values});"
+    delete_old = f"INSERT INTO {fts_name}({fts_name}, rowid, {cols}) VALUES ('delete', old.id, {old_values});"
+    update_when = ''
+    if compressed:
+        # 只改变压缩形式（flask compress-notes）时原文不变，不重建该行的索引
+        changed = ' OR '.join(
+            f"(old.{col} IS NOT new.{col} AND note_text(old.{col}) IS NOT note_text(new.{col}))"
+            if col in compressed else f"old.{col} IS NOT new.{col}"
+            for col in ['id'] + columns
+        )
+        update_when = f" WHEN {changed}"
+    return [
+        f"CREATE TRIGGER {fts_name}_insert AFTER INSERT ON {source} BEGIN {insert_new} END;",
+        f"CREATE TRIGGER {fts_name}_update AFTER UPDATE ON {source}{update_when} BEGIN {delete_old} {insert_new} END;",
+        f"CREATE TRIGGER {fts_name}_delete AFTER DELETE ON {source} BEGIN {delete_old} END;",
+    ]
+
+def create_fts_table(cursor, fts_name, source, columns, tokenizer=DEFAULT_TOKENIZER, compressed=()):
+    """创建（或按新定义重建）FTS表及同步触发器，并重建索引数据
+    
+    bigram模式需要连接上已注册 cjk_bigrams() 函数，有压缩列（compressed）时需要已注册 note_text()
+    """
+    if compressed:
+        cursor.execute(f"DROP VIEW IF EXISTS {fts_content_source(fts_name, source, compressed)}")
+        cursor.execute(fts_source_view_sql(fts_name, source, columns, compressed))
+    
+    table_sql = fts_table_sql(fts_name, source, columns, tokenizer, compressed)
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (fts_name,))
+    row = cursor.fetchone()
+    
+    # 定义变化（列或分词器不同）时删除旧表重建
+    if row and row[0] != table_sql:
+        cursor.execute(f"DROP TABLE {fts_name}")
+        row = None
+    
+    if row is None:
+        cursor.execute(table_sql)
+    
+    # 触发器总是重建，修正旧版本中错误的同步逻辑
+    for suffix in ('insert', 'update', 'delete'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {fts_name}_{suffix}")
+    for sql in fts_trigger_sqls(fts_name, source, columns, tokenizer, compressed):
+        cursor.execute(sql)
+    
+    # 从源表重建倒排索引（无内容表不支持 'rebuild'，清空后重新写入）
+    if tokenizer == 'bigram':
+        cols = ', '.join(columns)
+        cursor.execute(f"INSERT INTO {fts_name}({fts_name}) VALUES ('delete-all')")
+        cursor.execute(
+            f"INSERT INTO {fts_name}(rowid, {cols}) "
+            f"SELECT id, {fts_column_values(source, columns, tokenizer, compressed)} FROM {source}"
+        )
+    else:
+        cursor.execute(f"INSERT INTO {fts_name}({fts_name}) VALUES ('rebuild')")
+    
+    # 记录分词模式，供查询时构造 MATCH 表达式
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {FTS_SETTINGS_TABLE} "
+        f"(table_name TEXT PRIMARY KEY, tokenizer TEXT NOT NULL)"
+    )
+    cursor.execute(
+        f"INSERT OR REPLACE INTO {FTS_SETTINGS_TABLE}(table_name, tokenizer) VALUES (?, ?)",
+        (fts_name, tokenizer)
+    )
+
+# 版本化迁移：(版本号, 名称, 执行函数)，只能追加，不能修改已发布的迁移
+def create_note_indexes(cursor, fts_tokenizer):
+    """笔记列表排序和标题查询的索引，以及项目任务统计的复合索引"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_title ON notes(title)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_updated_at ON notes(updated_at DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_created_at ON notes(created_at DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_title_updated ON notes(title, updated_at DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_status ON tasks(project_id, status)")
+
+def create_list_indexes(cursor, fts_tokenizer):
+    """各列表接口排序和过滤使用的索引
+    
+    列表按 (排序列 DESC, id DESC) 排列：升序索引隐含rowid，反向扫描即可覆盖，
+    而 idx_notes_updated_at 是降序索引，同一时间内的id仍为升序，需要额外排序
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_updated ON notes(updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_created_at ON todos(created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_updated_at ON todos(updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_created ON tasks(project_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_updated_at ON projects(updated_at)")
+
+def create_fts_tables(cursor, fts_tokenizer):
+    """创建全文搜索表；已存在的（create_indexes.py 建过的）保持原分词模式"""
+    for fts_name, (source, columns) in FTS_TABLES.items():
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (fts_name,))
+        if cursor.fetchone() is None:
+            create_fts_table(cursor, fts_name, source, columns, fts_tokenizer)
+
+# 数据版本表：每种实体一行，任何写入（ORM、批量接口、导入或直接执行SQL）都由触发器递增版本号，
+# 读接口据此生成 ETag / Last-Modified，无需查询数据行
+DATA_VERSIONS_TABLE = 'data_versions'
+VERSIONED_TABLES = ('notes', 'todos', 'projects', 'tasks')
+
+def data_version_trigger_sqls(source):
+    """生成递增 source 数据版本的触发器"""
+    bump = (
+        f"UPDATE {DATA_VERSIONS_TABLE} SET version = version + 1, "
+        f"updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE entity = '{source}';"
+    )
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {source}_version_{operation} AFTER {operation.upper()} ON {source} BEGIN {bump} END;"
+        for operation in ('insert', 'update', 'delete')
+    ]
+
+def create_data_versions(cursor, fts_tokenizer):
+    """各实体的数据版本号及其同步触发器"""
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {DATA_VERSIONS_TABLE} "
+        f"(entity TEXT PRIMARY KEY, version INTEGER NOT NULL, updated_at TEXT NOT NULL)"
+    )
+    for source in VERSIONED_TABLES:
+        cursor.execute(
+            f"INSERT OR IGNORE INTO {DATA_VERSIONS_TABLE}(entity, version, updated_at) "
+            f"VALUES (?, 1, strftime('%Y-%m-%d %H:%M:%f', 'now'))",
+            (source,)
+        )
+        for sql in data_version_trigger_sqls(source):
+            cursor.execute(sql)
+
+# 变更日志：每个对象只保留最后一次变更（创建/更新为 upsert，删除为 delete 墓碑），
+# seq 单调递增，由触发器在写入数据的同一事务中记录，供 /api/sync 增量同步
+CHANGE_LOG_TABLE = 'change_log'
+
+def change_log_replace_sql(source, op, row):
+    """INSERT OR REPLACE 删除该对象的旧记录并分配新的 seq（迁移5发布的版本）"""
+    return (
+        f"INSERT OR REPLACE INTO {CHANGE_LOG_TABLE}(entity, entity_id, op, changed_at) "
+        f"VALUES ('{source}', {row}.id, '{op}', strftime('%Y-%m-%d %H:%M:%f', 'now'));"
+    )
+
+def change_log_record_sql(source, op, row):
+    """先删除该对象的旧记录再插入，分配新的 seq
+    
+    不能用 INSERT OR REPLACE：触发器由 upsert（导入的 ON CONFLICT DO UPDATE）触发时，
+    外层语句的冲突处理会覆盖触发器内的 OR REPLACE，已有记录的对象就会违反唯一约束
+    """
+    return (
+        f"DELETE FROM {CHANGE_LOG_TABLE} WHERE entity = '{source}' AND entity_id = {row}.id; "
+        f"INSERT INTO {CHANGE_LOG_TABLE}(entity, entity_id, op, changed_at) "
+        f"VALUES ('{source}', {row}.id, '{op}', strftime('%Y-%m-%d %H:%M:%f', 'now'));"
+    )
+
+def change_log_trigger_sqls(source, record=change_log_replace_sql):
+    """生成记录 source 变更的触发器（默认为迁移5发布的版本）"""
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {source}_changes_insert AFTER INSERT ON {source} "
+        f"BEGIN {record(source, 'upsert', 'new')} END;",
+        f"CREATE TRIGGER IF NOT EXISTS {source}_changes_update AFTER UPDATE ON {source} "
+        f"BEGIN {record(source, 'upsert', 'new')} END;",
+        f"CREATE TRIGGER IF NOT EXISTS {source}_changes_delete AFTER DELETE ON {source} "
+        f"BEGIN {record(source, 'delete', 'old')} END;",
+    ]
+
+def create_change_log(cursor, fts_tokenizer):
+    """变更日志表及触发器，已有数据记为 upsert（since=0 即可取得全部数据）"""
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {CHANGE_LOG_TABLE} ("
+        f"seq INTEGER PRIMARY KEY AUTOINCREMENT, entity TEXT NOT NULL, entity_id INTEGER NOT NULL, "
+        f"op TEXT NOT NULL, changed_at TEXT NOT NULL)"
+    )
+    cursor.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS idx_change_log_entity ON {CHANGE_LOG_TABLE}(entity, entity_id)"
+    )
+    # 项目先于任务，客户端按顺序应用时任务引用的项目已存在
+    for source in ('projects', 'tasks', 'notes', 'todos'):
+        cursor.execute(
+            f"INSERT OR IGNORE INTO {CHANGE_LOG_TABLE}(entity, entity_id, op, changed_at) "
+            f"SELECT '{source}', id, 'upsert', strftime('%Y-%m-%d %H:%M:%f', 'now') FROM {source} ORDER BY id"
+        )
+        for sql in change_log_trigger_sqls(source):
+            cursor.execute(sql)
+
+def create_filter_indexes(cursor, fts_tokenizer):
+    """待办和任务列表过滤、排序及分面计数使用的复合索引
+    
+    (过滤列, 排序列) 的索引可以同时完成过滤和排序；(过滤列, 分面列) 的索引覆盖 count_only 的 GROUP BY
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_completed_created ON todos(completed, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_completed_due ON todos(completed, due_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_completed_priority ON todos(completed, priority)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_due_date ON todos(due_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_status_created ON tasks(project_id, status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_status_priority ON tasks(project_id, status, priority)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_due ON tasks(project_id, due_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_updated ON tasks(project_id, updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_assignee ON tasks(project_id, assignee, created_at)")
+
+def create_task_indexes(cursor, fts_tokenizer):
+    """跨项目任务列表（GET /api/tasks）的过滤、排序和计数使用的索引"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks(created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks(updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_due_date ON tasks(due_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_assignee_created ON tasks(assignee, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks(status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_priority ON tasks(status, priority)")
+
+# 标签倒排索引：notes.tags（JSON字符串）仍是标签的来源，与 to_dict() 的输出保持一致；
+# 触发器在写入笔记的同一事务中把其中的标签同步到 tags / note_tags，按标签查询只需查索引
+TAGS_TABLE = 'tags'
+NOTE_TAGS_TABLE = 'note_tags'
+
+def json_tags(row):
+    """row.tags 的 json_each 表值函数；不是有效JSON时视为没有标签"""
+    return f"json_each(CASE WHEN json_valid({row}.tags) THEN {row}.tags ELSE '[]' END)"
+
+def note_tag_names(row):
+    """触发器中 row（new / old）的标签名"""
+    return f"SELECT DISTINCT trim(value) FROM {json_tags(row)} WHERE type = 'text' AND trim(value) <> ''"
+
+def note_tag_sync_sql(row):
+    """把 row 的标签写入 tags 和 note_tags"""
+    return (
+        f"INSERT OR IGNORE INTO {TAGS_TABLE}(name) {note_tag_names(row)}; "
+        f"INSERT OR IGNORE INTO {NOTE_TAGS_TABLE}(tag_id, note_id) "
+        f"SELECT id, {row}.id FROM {TAGS_TABLE} WHERE name IN ({note_tag_names(row)});"
+    )
+
+def note_tag_link_sql(row):
+    """把 row 的标签写入 tags 和 note_tags，已存在的行用 NOT EXISTS 跳过
+    
+    不能用 INSERT OR IGNORE：触发器由 upsert（导入的 ON CONFLICT DO UPDATE）触发时，
+    外层语句的冲突处理会覆盖触发器内的 OR IGNORE，已存在的标签就会违反唯一约束
+    """
+    return (
+        f"INSERT INTO {TAGS_TABLE}(name) {note_tag_names(row)} "
+        f"AND NOT EXISTS (SELECT 1 FROM {TAGS_TABLE} WHERE {TAGS_TABLE}.name = trim(value)); "
+        f"INSERT INTO {NOTE_TAGS_TABLE}(tag_id, note_id) "
+        f"SELECT id, {row}.id FROM {TAGS_TABLE} WHERE name IN ({note_tag_names(row)}) "
+        f"AND NOT EXISTS (SELECT 1 FROM {NOTE_TAGS_TABLE} "
+        f"WHERE {NOTE_TAGS_TABLE}.tag_id = {TAGS_TABLE}.id AND {NOTE_TAGS_TABLE}.note_id = {row}.id);"
+    )
+
+def note_tag_trigger_sqls(sync_sql=note_tag_sync_sql):
+    """生成保持 note_tags 与 notes.tags 同步的触发器（默认为迁移8发布的版本）"""
+    unlink_old = f"DELETE FROM {NOTE_TAGS_TABLE} WHERE note_id = old.id;"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS notes_tags_insert AFTER INSERT ON notes BEGIN {sync_sql('new')} END;",
+        f"CREATE TRIGGER IF NOT EXISTS notes_tags_update AFTER UPDATE OF id, tags ON notes "
+        f"BEGIN {unlink_old} {sync_sql('new')} END;",
+        f"CREATE TRIGGER IF NOT EXISTS notes_tags_delete AFTER DELETE ON notes BEGIN {unlink_old} END;",
+    ]
+
+def create_note_tags(cursor, fts_tokenizer):
+    """标签表、笔记-标签关联表及同步触发器，并从已有笔记的 tags 回填
+    
+    note_tags 的主键 (tag_id, note_id) 即倒排索引：按标签查笔记和按标签计数都只扫描主键
+    """
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {TAGS_TABLE} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {NOTE_TAGS_TABLE} ("
+        f"tag_id INTEGER NOT NULL, note_id INTEGER NOT NULL, PRIMARY KEY (tag_id, note_id)) WITHOUT ROWID"
+    )
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_note_tags_note ON {NOTE_TAGS_TABLE}(note_id)")
+    
+    cursor.execute(
+        f"INSERT OR IGNORE INTO {TAGS_TABLE}(name) SELECT DISTINCT trim(note_tag.value) "
+        f"FROM notes, {json_tags('notes')} AS note_tag WHERE note_tag.type = 'text' AND trim(note_tag.value) <> ''"
+    )
+    cursor.execute(
+        f"INSERT OR IGNORE INTO {NOTE_TAGS_TABLE}(tag_id, note_id) SELECT {TAGS_TABLE}.id, notes.id "
+        f"FROM notes, {json_tags('notes')} AS note_tag JOIN {TAGS_TABLE} ON {TAGS_TABLE}.name = trim(note_tag.value) "
+        f"WHERE note_tag.type = 'text'"
+    )
+    for sql in note_tag_trigger_sqls():
+        cursor.execute(sql)
+
+def create_compressed_note_fts(cursor, fts_tokenizer):
+    """笔记正文可能压缩保存后，notes_fts 改为通过 note_text() 还原原文建索引（保持原有的分词模式）
+    
+    已有的正文不在迁移中改写，由 `flask compress-notes` 分批压缩
+    """
+    source, columns = FTS_TABLES['notes_fts']
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (FTS_SETTINGS_TABLE,))
+    if cursor.fetchone() is not None:
+        cursor.execute(f"SELECT tokenizer FROM {FTS_SETTINGS_TABLE} WHERE table_name = 'notes_fts'")
+        row = cursor.fetchone()
+        if row is not None:
+            fts_tokenizer = row[0]
+    create_fts_table(cursor, 'notes_fts', source, columns, fts_tokenizer, FTS_COMPRESSED_COLUMNS['notes_fts'])
+
+def create_upsert_safe_note_tags(cursor, fts_tokenizer):
+    """重建 note_tags 同步触发器，不再依赖触发器内的 INSERT OR IGNORE（导入的 upsert 会覆盖它）"""
+    for operation in ('insert', 'update', 'delete'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS notes_tags_{operation}")
+    for sql in note_tag_trigger_sqls(note_tag_link_sql):
+        cursor.execute(sql)
+
+def create_upsert_safe_change_log(cursor, fts_tokenizer):
+    """重建变更日志触发器，不再依赖触发器内的 INSERT OR REPLACE（导入的 upsert 会覆盖它）"""
+    for source in ('projects', 'tasks', 'notes', 'todos'):
+        for operation in ('insert', 'update', 'delete'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {source}_changes_{operation}")
+        for sql in change_log_trigger_sqls(source, change_log_record_sql):
+            cursor.execute(sql)
+
+MIGRATIONS = [
+    (1, 'note_indexes', create_note_indexes),
+    (2, 'list_indexes', create_list_indexes),
+    (3, 'fts_tables', create_fts_tables),
+    (4, 'data_versions', create_data_versions),
+    (5, 'change_log', create_change_log),
+    (6, 'filter_indexes', create_filter_indexes),
+    (7, 'task_indexes', create_task_indexes),
+    (8, 'note_tags', create_note_tags),
+    (9, 'compressed_note_fts', create_compressed_note_fts),
+    (10, 'upsert_safe_note_tags', create_upsert_safe_note_tags),
+    (11, 'upsert_safe_change_log', create_upsert_safe_change_log),
+]
+
+def applied_versions(connection):
+    """已执行的迁移版本"""
+    connection.execute(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} "
+        f"(version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)"
+    )
+    connection.commit()
+    return {row[0] for row in connection.execute(f"SELECT version FROM {MIGRATIONS_TABLE}")}
+
+def pending_migrations(connection):
+    """尚未执行的迁移 [(版本号, 名称)]"""
+    applied = applied_versions(connection)
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in applied]
+
+def upgrade(connection, fts_tokenizer=DEFAULT_TOKENIZER):
+    """按版本顺序执行未执行的迁移，返回本次执行的 [(版本号, 名称)]
+    
+    connection 为sqlite3连接（需要已注册 cjk_bigrams() 和 note_text()）。
+    每个迁移在单独的 BEGIN IMMEDIATE 事务中执行并记录版本，
+    多个worker进程同时启动时只有一个会执行，其余等待后跳过
+    """
+    applied_versions(connection)
+    executed = []
+    for version, name, migrate in MIGRATIONS:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"SELECT 1 FROM {MIGRATIONS_TABLE} WHERE version = ?", (version,))
+            if cursor.fetchone() is not None:
+                connection.rollback()
+                continue
+            migrate(cursor, fts_tokenizer)
+            cursor.execute(
+                f"INSERT INTO {MIGRATIONS_TABLE}(version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, datetime.utcnow().isoformat())
+            )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        executed.append((version, name))
+    return executed
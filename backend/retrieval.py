@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+知识库混合检索的排序融合
+各路召回（每类实体的FTS5 bm25排序、笔记的向量相似度排序）的分数量纲不同，
+这里用倒数排名融合（Reciprocal Rank Fusion）只按名次合并为一个排序列表：
+
+    score(d) = Σ weight_i / (k + rank_i(d))
+
+k 越大，排名靠后的结果与靠前的结果差距越小；常用取值为 60。
+"""
+
+RRF_K = 60
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K, limit=None):
+    """融合多个排序列表
+
+    ranked_lists: {召回名称: [key, ...]} 或 {召回名称: ([key, ...], 权重)}，列表按相关度从高到低排列；
+    key 可以是任意可哈希的值，如 ('notes', 12)。
+    返回 [(key, 融合分数, {召回名称: 名次})]，按融合分数从高到低排列，名次从1开始
+    """
+    scores = {}
+    ranks = {}
+    for name, ranked in ranked_lists.items():
+        weight = 1.0
+        if isinstance(ranked, tuple):
+            ranked, weight = ranked
+        for position, key in enumerate(ranked, start=1):
+            if name in ranks.setdefault(key, {}):
+                # 同一路召回中重复出现的结果只计最靠前的名次
+                continue
+            ranks[key][name] = position
+            scores[key] = scores.get(key, 0.0) + weight / (k + position)
+
+    # 分数相同时按最好名次排序，保证结果稳定
+    fused = sorted(scores, key=lambda key: (-scores[key], min(ranks[key].values())))
+    if limit is not None:
+        fused = fused[:limit]
+    return [(key, scores[key], ranks[key]) for key in fused]
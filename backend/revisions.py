@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+笔记修订历史的正文存储（内容寻址 + 增量压缩）
+每个版本的正文按SHA-256寻址保存为一个blob，相同的正文（撤销修改、只改标题或标签）只保存一次。
+blob有两种：
+
+- full：zlib压缩的完整正文
+- delta：相对于上一版本正文（base_hash）的差异，JSON编码后zlib压缩
+
+差异先按行比较，改动的行再按词（中文按字）比较，所以一整段的长行（聊天记录、粘贴的文章）
+里的小改动也只记录改动的部分。自动保存每次通常只改几处，delta只有几十到几百字节。delta链的长度（depth）达到快照间隔时
+改存完整快照，读取任一版本最多依次应用 snapshot_interval - 1 个delta。
+差异不比完整正文小时（如整篇替换）也直接存完整快照。
+"""
+
+import difflib
+import hashlib
+import json
+import re
+import zlib
+
+COMPRESSION_LEVEL = 6
+
+def content_hash(text):
+    """正文的内容地址"""
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+def compress_text(text):
+    return zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+def decompress_text(data):
+    return zlib.decompress(data).decode('utf-8')
+
+DELTA_VERSION = 2
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_]+|\s+|.', re.DOTALL)  # 英文单词、空白和其他单个字符（中文按字）
+MIN_COPY = 8  # 比这更短的相同部分直接写入新文本，比复制操作更省空间
+FINE_DIFF_TOKENS = 4000  # 超过此词数时比较启用autojunk，避免整段重写时比较耗时过长
+
+def line_offsets(lines):
+    """每行在正文中的起始字符位置，最后一项为正文长度"""
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+def add_copy(ops, base, start, end):
+    if end - start < MIN_COPY:
+        add_text(ops, base[start:end])
+    elif ops and not isinstance(ops[-1], str) and ops[-1][1] == start:
+        ops[-1][1] = end
+    else:
+        ops.append([start, end])
+
+def add_text(ops, text):
+    if not text:
+        return
+    if ops and isinstance(ops[-1], str):
+        ops[-1] += text
+    else:
+        ops.append(text)
+
+def diff_span(ops, base, start, end, text):
+    """按词比较 base[start:end] 和替换后的 text，先去掉相同的开头和结尾"""
+    old = base[start:end]
+    prefix = 0
+    limit = min(len(old), len(text))
+    while prefix < limit and old[prefix] == text[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-suffix - 1] == text[-suffix - 1]:
+        suffix += 1
+    add_copy(ops, base, start, start + prefix)
+
+    old_tokens = TOKEN_PATTERN.findall(old[prefix:len(old) - suffix])
+    tokens = TOKEN_PATTERN.findall(text[prefix:len(text) - suffix])
+    old_offsets = line_offsets(old_tokens)
+    offsets = line_offsets(tokens)
+    matcher = difflib.SequenceMatcher(
+        None, old_tokens, tokens, autojunk=len(old_tokens) + len(tokens) > FINE_DIFF_TOKENS
+    )
+    mid = start + prefix
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            add_copy(ops, base, mid + old_offsets[i1], mid + old_offsets[i2])
+        elif j2 > j1:
+            add_text(ops, ''.join(tokens[j1:j2]))
+
+    add_copy(ops, base, end - suffix, end)
+
+def make_delta(base, text):
+    """计算从 base 到 text 的差异：先按行比较，改动的行再按词比较
+
+    返回 {'v': 2, 'ops': 操作列表}：[起始, 结束] 复制 base 中该字符范围，字符串为新插入的文本
+    """
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    base_offsets = line_offsets(base_lines)
+    offsets = line_offsets(lines)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, base_lines, lines).get_opcodes():
+        if tag == 'equal':
+            add_copy(ops, base, base_offsets[i1], base_offsets[i2])
+        elif tag == 'replace':
+            diff_span(ops, base, base_offsets[i1], base_offsets[i2], text[offsets[j1]:offsets[j2]])
+        elif tag == 'insert':
+            add_text(ops, text[offsets[j1]:offsets[j2]])
+    return {'v': DELTA_VERSION, 'ops': ops}
+
+def apply_delta(base, delta):
+    """还原 make_delta 的结果；列表为早期的行级差异（[起始行, 结束行] 复制 base 的行）"""
+    if isinstance(delta, dict):
+        return ''.join(op if isinstance(op, str) else base[op[0]:op[1]] for op in delta['ops'])
+
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in delta:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[0]:op[1]])
+    return ''.join(parts)
+
+def encode_blob(text, base_text=None, base_depth=0, snapshot_interval=20):
+    """编码一个版本的正文，返回 (kind, depth, data)
+
+    base_text 为上一版本的正文（None 表示没有可用的基础版本），base_depth 为其所在delta链的长度
+    """
+    full = compress_text(text)
+    if base_text is None or base_depth + 1 >= snapshot_interval:
+        return 'full', 0, full
+
+    delta = zlib.compress(
+        json.dumps(make_delta(base_text, text), ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+        COMPRESSION_LEVEL
+    )
+    if len(delta) >= len(full):
+        return 'full', 0, full
+    return 'delta', base_depth + 1, delta
+
+def decode_chain(chain):
+    """按 [完整快照, delta, delta, ...] 的顺序还原链末尾版本的正文；chain 中每项为 (kind, data)"""
+    kind, data = chain[0]
+    if kind != 'full':
+        raise ValueError('修订链缺少完整快照')
+    text = decompress_text(data)
+    for kind, data in chain[1:]:
+        text = apply_delta(text, json.loads(zlib.decompress(data)))
+    return text
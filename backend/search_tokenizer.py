@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全文搜索分词模式
+默认的 unicode61 分词器把连续的汉字当作一个词，中文笔记几乎无法命中。
+这里提供三种在建索引时选择的模式：
+
+- unicode61：SQLite默认分词（外部内容表，支持 highlight/snippet）
+- trigram：SQLite内置三字分词，任意子串可检索，但少于3个字的词无法使用索引
+- bigram：在Python中把连续汉字切成重叠的二字词，再交给 unicode61 建索引；
+  通过注册到SQLite的 cjk_bigrams() 函数在触发器中完成切分，
+  索引表为无内容表（content=''），不重复存储正文
+
+默认使用 bigram，中文的二字及以上的词都能走索引；已有的索引保持建表时的模式。
+"""
+
+import re
+
+TOKENIZERS = ('unicode61', 'trigram', 'bigram')
+DEFAULT_TOKENIZER = 'bigram'
+# 记录分词模式之前建的索引都是 unicode61
+LEGACY_TOKENIZER = 'unicode61'
+
+# 记录每个FTS表使用的分词模式，查询时据此构造 MATCH 表达式
+FTS_SETTINGS_TABLE = 'fts_settings'
+
+# 中日韩字符（CJK统一汉字、扩展A、兼容汉字、假名、韩文音节）
+CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+')
+
+def cjk_bigrams(text):
+    """把文本中连续的CJK字符切分为重叠的二字词，其余文本保持不变
+
+    例如 "学习Python机器学习" -> " 学习 Python 机器 器学 学习 "
+    """
+    if not text:
+        return text
+
+    def expand(match):
+        run = match.group(0)
+        if len(run) == 1:
+            return f' {run} '
+        return ' ' + ' '.join(run[i:i + 2] for i in range(len(run) - 1)) + ' '
+
+    return CJK_RUN.sub(expand, text)
+
+def register_functions(connection):
+    """在sqlite3连接上注册分词函数（bigram模式的触发器需要）"""
+    connection.create_function('cjk_bigrams', 1, cjk_bigrams, deterministic=True)
+
+def fts_table_options(source, tokenizer):
+    """返回FTS5建表语句中的选项部分"""
+    if tokenizer == 'bigram':
+        return "content=''"
+    options = f"content='{source}', content_rowid='id'"
+    if tokenizer == 'trigram':
+        options += ", tokenize='trigram'"
+    return options
+
+def uses_python_tokenizer(tokenizer):
+    """索引中保存的是切分后的文本，highlight()/snippet() 不可用"""
+    return tokenizer == 'bigram'
+
+def build_match_query(query, tokenizer=DEFAULT_TOKENIZER):
+    """把用户输入转换为安全的FTS5 MATCH表达式：每个词作为一个短语，词之间为AND
+
+    当某个词无法通过该分词模式的索引检索时返回 None（调用方应回退到LIKE）：
+    unicode61 模式下含汉字的词（连续汉字整体是一个词，索引中查不到其中的子串）、
+    trigram 模式下少于3个字符的词、bigram 模式下单个汉字的词
+    """
+    phrases = []
+    for term in query.split():
+        if tokenizer == 'unicode61' and CJK_RUN.search(term):
+            return None
+        if tokenizer == 'trigram' and len(term) < 3:
+            return None
+        if tokenizer == 'bigram':
+            if CJK_RUN.fullmatch(term) and len(term) == 1:
+                return None
+            term = ' '.join(cjk_bigrams(term).split())
+        phrases.append('"' + term.replace('"', '""') + '"')
+    return ' '.join(phrases) or None
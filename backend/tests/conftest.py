@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+测试环境：临时数据库和向量索引目录、hashing嵌入模型、不启动后台索引线程，
+OpenRouter指向进程内的模拟服务（fake_llm_server.py）。
+app.py 在导入时读取这些环境变量，必须在导入 app 之前设置；所有测试共用同一个数据库。
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+import fake_llm_server
+
+WORKDIR = tempfile.mkdtemp(prefix='notes-tests-')
+
+fake_llm = fake_llm_server.create_server(0, first_token_delay=0, token_delay=0)
+threading.Thread(target=fake_llm.serve_forever, daemon=True).start()
+
+os.environ.update({
+    'SQLITE_PATH': os.path.join(WORKDIR, 'notes.db'),
+    'VECTOR_INDEX_DIR': os.path.join(WORKDIR, 'vector_index'),
+    'EMBEDDING_BACKEND': 'hashing',
+    'INDEX_WORKER_ENABLED': 'false',
+    'OPENROUTER_API_URL': f'http://127.0.0.1:{fake_llm.server_port}/v1/chat/completions',
+    'OPENROUTE_API_KEY': 'test',
+    'OPENROUTER_MAX_RETRIES': '0',
+    'CHAT_CACHE_ENABLED': 'false',
+})
+
+import app as app_module  # noqa: E402
+
+def pytest_sessionfinish(session, exitstatus):
+    fake_llm.shutdown()
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+@pytest.fixture
+def fake_llm_handler():
+    """模拟服务的处理类，测试结束后恢复正常回复"""
+    handler = fake_llm_server.FakeLLMHandler
+    yield handler
+    handler.fail_status = None
+    handler.disconnect_after = None
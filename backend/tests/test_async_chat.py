@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""async_chat.py 中的 POST /api/chat：回复和SSE事件与同步接口一致（上游为 fake_llm_server.py）"""
+
+import asyncio
+
+import httpx
+
+import async_chat
+from test_chat_stream import parse_events, stream_chat
+
+def post_chat(payload):
+    """通过ASGI调用异步聊天接口，返回 (状态码, 响应体)"""
+    async def run():
+        transport = httpx.ASGITransport(app=async_chat.chat_endpoint)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                response = await client.post('/api/chat', json=payload)
+                return response.status_code, response.content
+        finally:
+            # 共享的上游客户端绑定在当前事件循环上
+            await async_chat.close_async_client()
+    return asyncio.run(run())
+
+def without_timestamps(events):
+    return [(name, {key: value for key, value in data.items() if key != 'timestamp'}) for name, data in events]
+
+def test_async_stream_matches_sync(client, fake_llm_handler):
+    payload = {'message': '异步流式', 'stream': True, 'retrieval': 'keyword'}
+
+    status, body = post_chat(payload)
+
+    assert status == 200
+    assert without_timestamps(parse_events(body)) == without_timestamps(stream_chat(client, '异步流式'))
+
+def test_async_stream_upstream_error_matches_sync(client, fake_llm_handler):
+    fake_llm_handler.fail_status = 503
+
+    status, body = post_chat({'message': '上游错误', 'stream': True, 'retrieval': 'keyword'})
+
+    assert status == 200
+    assert parse_events(body) == stream_chat(client, '上游错误')
+
+def test_async_non_stream_reply_matches_sync(client, fake_llm_handler):
+    payload = {'message': '异步非流式', 'retrieval': 'keyword'}
+
+    status, body = post_chat(payload)
+
+    assert status == 200
+    reply = httpx.Response(status, content=body).json()
+    assert reply['response'] == client.post('/api/chat', json=payload).get_json()['response']
+
+def test_async_non_stream_upstream_error_matches_sync(client, fake_llm_handler):
+    fake_llm_handler.fail_status = 503
+    payload = {'message': '上游错误', 'retrieval': 'keyword'}
+
+    status, body = post_chat(payload)
+
+    assert status == 200
+    reply = httpx.Response(status, content=body).json()
+    assert reply['response'] == '抱歉，AI服务暂时不可用。请稍后再试。'
+    assert reply['response'] == client.post('/api/chat', json=payload).get_json()['response']
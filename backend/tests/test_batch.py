@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""批量接口的字段校验：只接受对应的JSON类型"""
+
+def test_completed_accepts_only_json_booleans(client):
+    response = client.post('/api/todos/batch', json={'items': [
+        {'title': '已完成', 'completed': True},
+        {'title': '字符串', 'completed': 'false'},
+        {'title': '数字', 'completed': 0},
+    ]})
+
+    assert response.status_code == 200
+    results = response.get_json()['data']['results']
+    assert [result['status'] for result in results] == [201, 400, 400]
+    assert 'completed' in results[1]['error']
+    todo = client.get(f"/api/todos/{results[0]['id']}").get_json()['data']
+    assert todo['completed'] is True
+
+def test_invalid_fields_fail_the_item(client):
+    project = client.post('/api/projects', json={'title': '校验'}).get_json()['data']
+    response = client.post('/api/tasks/batch', json={'items': [
+        {'project_id': project['id'], 'title': 1},
+        {'project_id': str(project['id']), 'title': '字符串id'},
+        {'project_id': project['id'], 'title': '日期', 'due_date': 'tomorrow'},
+        {'project_id': project['id'], 'title': '有效', 'due_date': '2026-01-02T00:00:00Z'},
+    ]})
+
+    results = response.get_json()['data']['results']
+    assert [result['status'] for result in results] == [400, 400, 400, 201]
+
+def test_atomic_update_rejects_wrong_types(client):
+    created = client.post('/api/notes/batch', json={'items': [{'title': '标签'}]}).get_json()['data']
+    note_id = created['results'][0]['id']
+
+    response = client.patch('/api/notes/batch', json={
+        'atomic': True,
+        'items': [{'id': note_id, 'tags': '工作'}],
+    })
+
+    assert response.status_code == 400
+    assert response.get_json()['data']['results'][0]['status'] == 400
+    assert client.get(f'/api/notes/{note_id}').get_json()['data']['tags'] == '[]'
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""POST /api/chat 的流式模式（上游为 fake_llm_server.py）"""
+
+import json
+
+def parse_events(body):
+    """把SSE响应体解析为 [(事件名, 数据)]，未指定事件名的为 'message'"""
+    events = []
+    for block in body.decode('utf-8').split('\n\n'):
+        if not block.strip():
+            continue
+        name = 'message'
+        data = None
+        for line in block.split('\n'):
+            if line.startswith('event: '):
+                name = line[len('event: '):]
+            elif line.startswith('data: '):
+                data = json.loads(line[len('data: '):])
+        events.append((name, data))
+    return events
+
+def stream_chat(client, message):
+    response = client.post('/api/chat', json={'message': message, 'stream': True, 'retrieval': 'keyword'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    return parse_events(response.get_data())
+
+def test_stream_forwards_tokens_in_order_and_ends_with_done(client, fake_llm_handler):
+    events = stream_chat(client, '流式测试 abc')
+
+    deltas = [data['delta'] for name, data in events if name == 'message']
+    # 模拟服务逐字发送，每个字是一个delta，顺序与回复一致
+    assert deltas == list('这是模拟回复：流式测试 abc')
+    # 上游的 [DONE] 标记结束流，不作为文本转发；done 是最后一个事件
+    assert all('[DONE]' not in delta for delta in deltas)
+    assert [name for name, _ in events].count('done') == 1
+    name, data = events[-1]
+    assert name == 'done'
+    assert data['done'] is True and data['cached'] is False
+
+def test_stream_upstream_error_sends_error_event(client, fake_llm_handler):
+    fake_llm_handler.fail_status = 503
+
+    events = stream_chat(client, '上游错误')
+
+    assert events == [('error', {'error': 'AI服务暂时不可用。请稍后再试。'})]
+
+def test_stream_upstream_disconnect_sends_error_event(client, fake_llm_handler):
+    fake_llm_handler.disconnect_after = 3
+
+    events = stream_chat(client, '中途断开')
+
+    names = [name for name, _ in events]
+    assert names[-1] == 'error'
+    assert 'done' not in names
+    # 断开前收到的token已经转发
+    assert ''.join(data['delta'] for name, data in events if name == 'message') == '这是模'
+
+def test_non_stream_reply(client, fake_llm_handler):
+    response = client.post('/api/chat', json={'message': '非流式', 'retrieval': 'keyword'})
+
+    assert response.status_code == 200
+    assert response.get_json()['response'] == '这是模拟回复：非流式'
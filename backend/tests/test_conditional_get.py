@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""读接口的条件请求：数据未变化时返回304，更新或删除后返回完整响应"""
+
+import time
+from datetime import datetime
+
+from werkzeug.http import http_date
+
+def revalidate(client, url, response):
+    return client.get(url, headers={'If-None-Match': response.headers['ETag']})
+
+def wait_for_next_second():
+    time.sleep(1 - datetime.utcnow().microsecond / 1e6 + 0.01)
+
+def create_note(client, title):
+    return client.post('/api/notes', json={'title': title, 'content': '条件请求'}).get_json()['data']
+
+def test_unchanged_list_and_item_return_304(client):
+    note = create_note(client, '未变化')
+    for url in ('/api/notes', f'/api/notes/{note["id"]}'):
+        response = client.get(url)
+        assert response.status_code == 200
+
+        cached = revalidate(client, url, response)
+        assert cached.status_code == 304
+        assert cached.headers['ETag'] == response.headers['ETag']
+
+def test_update_returns_200(client):
+    note = create_note(client, '更新前')
+    urls = ('/api/notes', f'/api/notes/{note["id"]}')
+    responses = [client.get(url) for url in urls]
+
+    assert client.put(f'/api/notes/{note["id"]}', json={'title': '更新后'}).status_code == 200
+
+    for url, response in zip(urls, responses):
+        fresh = revalidate(client, url, response)
+        assert fresh.status_code == 200
+        assert '更新后' in fresh.get_data(as_text=True)
+
+def test_delete_returns_200_for_list_and_404_for_item(client):
+    note = create_note(client, '将删除')
+    list_response = client.get('/api/notes')
+    item_response = client.get(f'/api/notes/{note["id"]}')
+
+    assert client.delete(f'/api/notes/{note["id"]}').status_code == 200
+
+    fresh = revalidate(client, '/api/notes', list_response)
+    assert fresh.status_code == 200
+    assert note['id'] not in [row['id'] for row in fresh.get_json()['data']]
+    assert revalidate(client, f'/api/notes/{note["id"]}', item_response).status_code == 404
+
+def test_deleted_project_tasks_return_404(client):
+    project = client.post('/api/projects', json={'name': '空项目'}).get_json()['data']
+    url = f'/api/projects/{project["id"]}/tasks'
+    response = client.get(url)
+    assert response.status_code == 200 and response.get_json()['data'] == []
+
+    assert client.delete(f'/api/projects/{project["id"]}').status_code == 200
+
+    assert revalidate(client, url, response).status_code == 404
+
+def test_if_modified_since_sees_writes_in_the_same_second(client):
+    wait_for_next_second()
+    note = create_note(client, '同一秒')
+    url = f'/api/notes/{note["id"]}'
+    # 最后修改所在的这一秒还没过去，不返回 Last-Modified
+    assert 'Last-Modified' not in client.get(url).headers
+    since = http_date(datetime.fromisoformat(note['updated_at']).replace(microsecond=0))
+
+    assert client.put(url, json={'title': '同一秒内再次修改'}).status_code == 200
+
+    response = client.get(url, headers={'If-Modified-Since': since})
+    assert response.status_code == 200
+    assert response.get_json()['data']['title'] == '同一秒内再次修改'
+
+def test_if_modified_since_returns_304_once_the_second_has_passed(client):
+    note = create_note(client, '已过去')
+    url = f'/api/notes/{note["id"]}'
+    wait_for_next_second()
+
+    response = client.get(url)
+    assert 'Last-Modified' in response.headers
+
+    assert client.get(url, headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code == 304
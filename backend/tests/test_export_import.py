@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""/api/export 导出（一致的快照）及导出数据重新导入（按id覆盖已有数据）"""
+
+import json
+
+import app as app_module
+
+def export_records(client):
+    response = client.get('/api/export')
+    assert response.status_code == 200
+    body = response.get_data()
+    records = [json.loads(line) for line in body.decode('utf-8').splitlines() if line.strip()]
+    return body, [record for record in records if record['type'] != 'meta']
+
+def test_reimport_export_into_same_database(client):
+    project = client.post('/api/projects', json={'title': '导入项目'}).get_json()['data']
+    for url, payload in (
+        ('/api/tasks', {'project_id': project['id'], 'title': '导入任务'}),
+        ('/api/notes', {'title': '导入笔记', 'content': '正文', 'tags': ['导入', '标签']}),
+        ('/api/todos', {'title': '导入待办'}),
+    ):
+        assert client.post(url, json=payload).status_code == 201
+    body, records = export_records(client)
+    since = client.get('/api/sync').get_json()['data']['next_since']
+
+    response = client.post('/api/import', data=body)
+
+    assert response.status_code == 200, response.get_json()
+    data = response.get_json()['data']
+    assert data['failed'] == 0
+    assert sum(data['imported'].values()) == len(records)
+    # 数据不变，变更日志中每个对象仍只有一条记录（seq 更新为本次导入）
+    assert export_records(client)[1] == records
+    changes = client.get(f'/api/sync?since={since}').get_json()['data']['changes']
+    assert sorted((c['entity'], c['id']) for c in changes) == sorted(
+        (record['type'], record['data']['id']) for record in records
+    )
+
+def test_export_reads_one_snapshot(client):
+    """导出开始读取后提交的写入不出现在导出中"""
+    client.post('/api/projects', json={'title': '快照'})
+    response = client.get('/api/export', buffered=False)
+    chunks = response.iter_encoded()
+    # meta 之后的第一段是项目，此时读事务已经开始
+    next(chunks)
+    assert b'"type":"projects"' in next(chunks)
+
+    connection = app_module.db.engine.raw_connection()
+    try:
+        connection.execute("INSERT INTO notes (title, content, tags) VALUES ('导出期间写入', '', '[]')")
+        connection.commit()
+    finally:
+        connection.close()
+    body = b''.join(chunks)
+    response.close()
+
+    assert '导出期间写入'.encode('utf-8') not in body
+    assert '导出期间写入'.encode('utf-8') in client.get('/api/export').get_data()
+
+def ndjson(records):
+    lines = [{'type': 'meta', 'version': app_module.EXPORT_FORMAT_VERSION}] + records
+    return ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in lines).encode('utf-8')
+
+def task_record(task_id, project_id):
+    return {'type': 'tasks', 'data': {'id': task_id, 'title': f'任务{task_id}', 'project_id': project_id}}
+
+def project_record(project_id):
+    return {'type': 'projects', 'data': {'id': project_id, 'title': f'项目{project_id}'}}
+
+def stored_tasks(ids):
+    with app_module.app.app_context():
+        return dict(app_module.db.session.execute(
+            app_module.db.select(app_module.Task.id, app_module.Task.project_id).where(app_module.Task.id.in_(ids))
+        ).all())
+
+def test_import_tasks_before_their_projects(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'IMPORT_BATCH_SIZE', 2)
+    task_ids = list(range(910001, 910006))
+    records = [task_record(task_id, 900001 + task_id % 2) for task_id in task_ids]
+    records += [task_record(910010, 900009)]  # 项目不存在
+    records += [project_record(900001), project_record(900002)]
+
+    response = client.post('/api/import', data=ndjson(records))
+
+    assert response.status_code == 200, response.get_json()
+    data = response.get_json()['data']
+    assert data['imported']['tasks'] == len(task_ids) and data['imported']['projects'] == 2
+    assert data['failed'] == 1 and data['errors'] == [{'line': len(task_ids) + 2, 'error': '引用的数据不存在'}]
+    assert stored_tasks(task_ids + [910010]) == {task_id: 900001 + task_id % 2 for task_id in task_ids}
+    assert client.get('/api/projects/900002/tasks').get_json()['data'][0]['id'] in task_ids
+
+def test_import_failure_leaves_no_orphan_tasks(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'IMPORT_BATCH_SIZE', 2)
+    task_ids = list(range(920001, 920006))
+    records = [task_record(task_id, 900101) for task_id in task_ids]
+    # 父项目出现之前导入中止：任务的批次已满但不能先于项目写入
+    records += [{'type': 'meta', 'version': -1}, project_record(900101)]
+
+    response = client.post('/api/import', data=ndjson(records))
+
+    assert response.status_code == 400
+    assert stored_tasks(task_ids) == {}
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""导出/导入的峰值内存（check_export_memory.py 的缩小版）
+
+生成约32MB正文的数据库，导出再导入到空数据库，各步在独立进程中记录峰值RSS。
+页缓存、内存映射、每批行数按数据量缩小。流式处理时RSS只有约20MB与数据量无关的增长
+（输出缓冲、当前一批行和分配器保留的内存），限制为导出文件大小的3/4；
+把整个导出读入内存时（字符串和行列表各一份）增长超过导出文件大小的2倍
+"""
+
+import os
+
+import check_export_memory
+
+SIZE_MB = 32
+NOTE_KB = 64
+ITEM_ROWS = 200
+MAX_GROWTH_RATIO = 0.75  # RSS增长与导出文件大小之比
+
+def test_export_import_memory_is_bounded(tmp_path, monkeypatch):
+    # 子进程继承这些环境变量
+    monkeypatch.setenv('SQLITE_MMAP_SIZE', '0')
+    monkeypatch.setenv('SQLITE_CACHE_SIZE', '-2048')
+    monkeypatch.setenv('EXPORT_CHUNK_SIZE', '20')
+    monkeypatch.setenv('IMPORT_BATCH_SIZE', '50')
+    source_db = str(tmp_path / 'source.db')
+    target_db = str(tmp_path / 'target.db')
+    export_path = str(tmp_path / 'export.ndjson')
+    workdir = str(tmp_path)
+
+    check_export_memory.run_step(check_export_memory.generate, source_db, workdir, SIZE_MB, NOTE_KB, ITEM_ROWS)
+    exported = check_export_memory.run_step(check_export_memory.export, source_db, workdir, export_path)
+    imported = check_export_memory.run_step(check_export_memory.import_file, target_db, workdir, export_path)
+
+    export_mb = os.path.getsize(export_path) / 1024 / 1024
+    assert export_mb > SIZE_MB
+    for result in (exported, imported):
+        assert result['peak_mb'] - result['baseline_mb'] < export_mb * MAX_GROWTH_RATIO
+    assert imported['response']['data']['failed'] == 0
+    assert check_export_memory.table_counts(target_db) == check_export_memory.table_counts(source_db)
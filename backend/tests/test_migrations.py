@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""版本化迁移：已发布迁移生成的SQL保持不变，迁移按顺序执行到最新版本"""
+
+import sqlite3
+
+import compression
+import migrations
+import search_tokenizer
+
+def upgraded_connection():
+    """执行全部迁移的内存数据库（只建迁移涉及的表）"""
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    search_tokenizer.register_functions(conn)
+    compression.register_functions(conn)
+    conn.executescript(
+        "CREATE TABLE notes (id INTEGER PRIMARY KEY, title TEXT, content TEXT, tags TEXT, "
+        "created_at TEXT, updated_at TEXT);"
+        "CREATE TABLE projects (id INTEGER PRIMARY KEY, title TEXT, description TEXT, updated_at TEXT);"
+        "CREATE TABLE tasks (id INTEGER PRIMARY KEY, project_id INTEGER, title TEXT, description TEXT, "
+        "assignee TEXT, status TEXT, priority TEXT, due_date TEXT, created_at TEXT, updated_at TEXT);"
+        "CREATE TABLE todos (id INTEGER PRIMARY KEY, title TEXT, description TEXT, completed BOOLEAN, "
+        "priority TEXT, due_date TEXT, created_at TEXT, updated_at TEXT);"
+    )
+    migrations.upgrade(conn, 'unicode61')
+    return conn
+
+def test_published_fts_sql_is_frozen():
+    """迁移3（fts_tables）发布时的建表和触发器语句"""
+    source, columns = migrations.FTS_TABLES['notes_fts']
+    assert migrations.fts_table_sql('notes_fts', source, columns, 'unicode61') == (
+        "CREATE VIRTUAL TABLE notes_fts USING fts5(title, content, tags, content='notes', content_rowid='id')"
+    )
+    assert migrations.fts_trigger_sqls('notes_fts', source, columns, 'unicode61')[1] == (
+        "CREATE TRIGGER notes_fts_update AFTER UPDATE ON notes BEGIN "
+        "INSERT INTO notes_fts(notes_fts, rowid, title, content, tags) "
+        "VALUES ('delete', old.id, old.title, old.content, old.tags); "
+        "INSERT INTO notes_fts(rowid, title, content, tags) VALUES (new.id, new.title, new.content, new.tags); END;"
+    )
+
+def test_compressed_notes_are_indexed_after_upgrade():
+    conn = upgraded_connection()
+    body = compression.encode_content('压缩保存的正文 searchable ' * 2000, threshold=1)
+    conn.execute("INSERT INTO notes(id, title, content, tags) VALUES (1, 't', ?, '[]')", (body,))
+
+    assert conn.execute(
+        "SELECT rowid FROM notes_fts WHERE notes_fts MATCH 'searchable'"
+    ).fetchall() == [(1,)]
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'notes_fts'").fetchone()[0]
+    assert "content='notes_fts_source'" in sql
+
+def test_note_tags_sync_under_upsert():
+    """导入用 ON CONFLICT DO UPDATE 覆盖已有笔记时，已存在的标签和关联不违反唯一约束"""
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, title TEXT, content TEXT, tags TEXT)")
+    cursor = conn.cursor()
+    migrations.create_note_tags(cursor, 'unicode61')
+    migrations.create_upsert_safe_note_tags(cursor, 'unicode61')
+    conn.execute("INSERT INTO notes(id, title, tags) VALUES (1, 'a', '[\"工作\", \"读书\"]')")
+
+    upsert = (
+        "INSERT INTO notes(id, title, tags) VALUES (?, 'b', ?) "
+        "ON CONFLICT(id) DO UPDATE SET title = excluded.title, tags = excluded.tags"
+    )
+    conn.execute(upsert, (1, '["工作", "旅行"]'))
+    conn.execute(upsert, (2, '["读书", "工作"]'))
+
+    linked = conn.execute(
+        "SELECT note_id, name FROM note_tags JOIN tags ON tags.id = tag_id ORDER BY note_id, name"
+    ).fetchall()
+    assert linked == [(1, '工作'), (1, '旅行'), (2, '工作'), (2, '读书')]
+    assert conn.execute("SELECT COUNT(*) FROM tags").fetchone()[0] == 3
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""各接口实际执行的SQL都使用索引
+
+通过测试客户端发出请求，记录请求中执行的每条 SELECT，用同样的参数执行 EXPLAIN QUERY PLAN，
+检查没有全表扫描和临时排序（与 `flask check-query-plans` 使用同样的判断）
+"""
+
+import pytest
+from sqlalchemy import event
+
+import app as app_module
+
+# {project} {note} {task} 替换为 seeded 中的id，{notes_cursor} 等替换为第一页返回的游标
+ROUTES = [
+    'GET /api/notes',
+    'GET /api/notes?limit=1&cursor={notes_cursor}',
+    'GET /api/notes?fields=id,title,snippet',
+    'GET /api/notes?tag=查询计划',
+    'GET /api/notes?tag=查询计划,索引&tag_match=any',
+    'GET /api/notes/{note}',
+    'GET /api/notes/{note}/revisions',
+    'GET /api/notes/{note}?at=2100-01-01T00:00:00',
+    'GET /api/tags',
+    'GET /api/todos',
+    'GET /api/todos?limit=1&cursor={todos_cursor}',
+    'GET /api/todos?completed=false&sort=due_date',
+    'GET /api/todos?due_before=2100-01-01T00:00:00&sort=due_date',
+    'GET /api/todos?completed=true',
+    'GET /api/todos?count_only=true',
+    'GET /api/projects',
+    'GET /api/projects/{project}',
+    'GET /api/projects/{project}/tasks',
+    'GET /api/projects/{project}/tasks?status=todo',
+    'GET /api/projects/{project}/tasks?assignee=张三',
+    'GET /api/projects/{project}/tasks?sort=due_date',
+    'GET /api/projects/{project}/tasks?count_only=true',
+    'GET /api/tasks',
+    'GET /api/tasks?include=project',
+    'GET /api/tasks?assignee=张三',
+    'GET /api/tasks?status=todo,in_progress',
+    'GET /api/tasks?due_before=2100-01-01T00:00:00&sort=due_date',
+    'GET /api/tasks?sort=updated_at',
+    'GET /api/tasks?count_only=true',
+    'GET /api/tasks/{task}',
+    'GET /api/sync?since=1',
+    'GET /api/sync?since=1&types=notes,todos',
+]
+
+@pytest.fixture(scope='module')
+def seeded():
+    client = app_module.app.test_client()
+    project = client.post('/api/projects', json={'title': '查询计划'}).get_json()['data']
+    task = client.post('/api/tasks', json={'project_id': project['id'], 'title': '任务', 'assignee': '张三'})
+    note = client.post('/api/notes', json={'title': '查询计划', 'content': '正文', 'tags': ['查询计划', '索引']})
+    client.post('/api/todos', json={'title': '待办'})
+    client.post('/api/todos', json={'title': '待办'})
+    note = note.get_json()['data']
+    client.put(f"/api/notes/{note['id']}", json={'content': '修改后的正文'})
+    cursors = {}
+    for name in ('notes', 'todos'):
+        cursors[f'{name}_cursor'] = client.get(f'/api/{name}?limit=1').get_json()['pagination']['next_cursor']
+    return {'project': project['id'], 'task': task.get_json()['data']['id'], 'note': note['id'], **cursors}
+
+def captured_selects(client, method, url):
+    """请求执行的 SELECT 语句 [(sql, 参数)]（不含读取表结构的查询）"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sql = statement.lstrip().upper()
+        if sql.startswith('SELECT') and 'SQLITE_MASTER' not in sql and not executemany:
+            statements.append((statement, parameters))
+
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.open(url, method=method)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, response.get_json()
+    return statements
+
+@pytest.mark.parametrize('route', ROUTES)
+def test_route_queries_use_indexes(client, seeded, route):
+    method, url = route.split(' ', 1)
+    statements = captured_selects(client, method, url.format(**seeded))
+    assert statements
+
+    with app_module.app.app_context():
+        connection = app_module.db.engine.raw_connection()
+        try:
+            for sql, parameters in statements:
+                plan = [row[-1] for row in connection.execute(f'EXPLAIN QUERY PLAN {sql}', parameters)]
+                assert app_module.unindexed_steps(plan) == [], f'{sql}\n{plan}'
+        finally:
+            connection.close()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""笔记修订历史：每个版本都能还原、?at= 读取历史版本、小改动存为delta"""
+
+import pytest
+
+import revisions
+from conftest import app_module
+
+PARAGRAPH = '本段记录项目的进展和待解决的问题，包括接口设计、数据迁移和性能测试的结论。 Notes on API design, migrations and benchmarks. '
+MULTI_LINE = ''.join(f'{PARAGRAPH}({i})\n' for i in range(40))
+SINGLE_LINE = PARAGRAPH * 40  # 约5000字，只有一行
+
+def edits(content, count):
+    """在正文不同位置依次插入几个字，返回每次保存后的正文"""
+    versions = []
+    for step in range(count):
+        position = len(content) * (step + 1) // (count + 1)
+        content = content[:position] + f'补充{step}' + content[position:]
+        versions.append(content)
+    return versions
+
+def create_note(client, content):
+    response = client.post('/api/notes', json={'title': '修订测试', 'content': content})
+    assert response.status_code == 201
+    return response.get_json()['data']['id']
+
+def save(client, note_id, content):
+    assert client.put(f'/api/notes/{note_id}', json={'content': content}).status_code == 200
+
+def note_revisions(client, note_id):
+    response = client.get(f'/api/notes/{note_id}/revisions?limit=100')
+    assert response.status_code == 200
+    return sorted(response.get_json()['data'], key=lambda revision: revision['rev'])
+
+def test_every_revision_is_reconstructed(client):
+    versions = [MULTI_LINE] + edits(MULTI_LINE, 8)
+    note_id = create_note(client, versions[0])
+    for content in versions[1:]:
+        save(client, note_id, content)
+
+    history = note_revisions(client, note_id)
+    assert [revision['rev'] for revision in history] == list(range(1, len(versions) + 1))
+    with app_module.app.app_context():
+        for revision, content in zip(history, versions):
+            assert app_module.read_revision_content(revision['content_hash']) == content
+    for revision, content in zip(history, versions):
+        assert client.get(f'/api/notes/{note_id}/revisions/{revision["rev"]}').get_json()['data']['content'] == content
+
+def test_at_returns_historical_content_after_delete(client):
+    versions = [SINGLE_LINE] + edits(SINGLE_LINE, 3)
+    note_id = create_note(client, versions[0])
+    for content in versions[1:]:
+        save(client, note_id, content)
+    history = note_revisions(client, note_id)
+    assert client.delete(f'/api/notes/{note_id}').status_code == 200
+
+    for revision, content in zip(history, versions):
+        response = client.get(f'/api/notes/{note_id}', query_string={'at': revision['created_at']})
+        assert response.status_code == 200
+        assert response.get_json()['data']['content'] == content
+    assert client.get(f'/api/notes/{note_id}', query_string={'at': '2000-01-01T00:00:00'}).status_code == 404
+
+@pytest.mark.parametrize('content', [MULTI_LINE, SINGLE_LINE], ids=['multi_line', 'single_line'])
+def test_small_edits_are_stored_as_deltas(client, content):
+    versions = [content] + edits(content, 10)
+    note_id = create_note(client, versions[0])
+    for text in versions[1:]:
+        save(client, note_id, text)
+
+    hashes = [revisions.content_hash(text) for text in versions]
+    with app_module.app.app_context():
+        blobs = {
+            blob.hash: blob for blob in app_module.RevisionBlob.query.filter(app_module.RevisionBlob.hash.in_(hashes))
+        }
+    assert [blobs[text_hash].kind for text_hash in hashes] == ['full'] + ['delta'] * 10
+    full_size = len(blobs[hashes[0]].data)
+    assert all(len(blobs[text_hash].data) < full_size / 4 for text_hash in hashes[1:])
+
+def test_line_deltas_from_earlier_versions_still_apply():
+    # 早期版本存储的行级差异：[起始行, 结束行] 复制 base 的行
+    base = 'a\nb\nc\n'
+    assert revisions.apply_delta(base, [[0, 1], 'x\n', [2, 3]]) == 'a\nx\nc\n'
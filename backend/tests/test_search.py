@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""笔记搜索：FTS索引无法处理的查询词回退到LIKE，结果不少于LIKE搜索"""
+
+import pytest
+
+import search_tokenizer
+
+CJK_NOTE = '我在学习机器学习的方法，今天讨论了项目进度。'
+
+@pytest.mark.parametrize('query', ['学习', '机器学习', '项目进度', '机器学习 项目'])
+def test_unicode61_cannot_serve_cjk_terms(query):
+    assert search_tokenizer.build_match_query(query, 'unicode61') is None
+
+def test_unicode61_serves_latin_terms():
+    assert search_tokenizer.build_match_query('SQLite index', 'unicode61') == '"SQLite" "index"'
+
+@pytest.mark.parametrize('query', ['学习', '机器学习', '项目进度'])
+def test_cjk_substring_search_finds_note(client, query):
+    note_id = client.post('/api/notes', json={'title': '周记', 'content': CJK_NOTE}).get_json()['data']['id']
+
+    response = client.post('/api/search', json={'query': query})
+
+    assert response.status_code == 200
+    assert note_id in [note['id'] for note in response.get_json()['data']]
+
+@pytest.mark.parametrize('query', ['学习', '机器学习', '项目进度'])
+def test_default_index_serves_cjk_terms(client, query):
+    note_id = client.post('/api/notes', json={'title': '周记', 'content': CJK_NOTE}).get_json()['data']['id']
+
+    result = client.post('/api/search', json={'query': query}).get_json()
+
+    assert result['search_type'] == 'fts'
+    assert note_id in [note['id'] for note in result['data']]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""向量索引：模型不可用或与索引不一致时报错，不清空共享的索引"""
+
+import numpy as np
+import pytest
+
+import vector_index
+
+def test_unloadable_model_raises_instead_of_falling_back(monkeypatch):
+    def broken(self, model_name, batch_size=32):
+        raise ImportError('No module named sentence_transformers')
+
+    monkeypatch.setattr(vector_index.SentenceTransformerEmbedder, '__init__', broken)
+
+    with pytest.raises(vector_index.EmbeddingModelError):
+        vector_index.create_embedder('sentence-transformers', 'some-model')
+
+def test_index_built_by_other_model_is_kept(tmp_path):
+    embedder = vector_index.HashingEmbedder()
+    index = vector_index.VectorIndex(str(tmp_path), embedder.dim, embedder.name)
+    index.upsert([1, 2], embedder.encode(['第一条笔记', '第二条笔记']))
+
+    with pytest.raises(vector_index.IndexModelMismatch):
+        vector_index.VectorIndex(str(tmp_path), embedder.dim, 'other-model')
+
+    reopened = vector_index.VectorIndex(str(tmp_path), embedder.dim, embedder.name)
+    assert len(reopened) == 2
+    assert reopened.search(embedder.encode(['第一条笔记'])[0], 1)[0][0] == 1
+
+def test_explicit_rebuild_switches_model(tmp_path):
+    embedder = vector_index.HashingEmbedder()
+    index = vector_index.VectorIndex(str(tmp_path), embedder.dim, embedder.name)
+    index.upsert([1], embedder.encode(['笔记']))
+
+    rebuilt = vector_index.VectorIndex(str(tmp_path), 8, 'other-model', rebuild=True)
+    assert len(rebuilt) == 0
+    rebuilt.upsert([5], np.ones((1, 8), dtype=np.float32))
+
+    # 其他进程中按旧模型打开的索引在刷新时发现模型变化
+    with pytest.raises(vector_index.IndexModelMismatch):
+        index.search(embedder.encode(['笔记'])[0])
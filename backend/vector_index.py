@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+笔记语义向量索引
+向量以连续的 float32 矩阵保存在磁盘上并通过内存映射读取，
+top-k 余弦相似度检索只需一次向量化的矩阵乘法。
+
+嵌入模型可插拔：
+- sentence-transformers：本地缓存的模型（EMBEDDING_MODEL 可以是模型名或本地路径）
+- hashing：基于字符n-gram哈希的桩实现，无需下载模型，用于离线环境和测试
+
+配置的模型加载失败时报错，不会悄悄换用其他模型；磁盘上的索引由其他模型建立时同样报错，
+只有 `flask rebuild-vector-index` 会清空并按当前模型重建（多个worker共享同一个索引目录）。
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+DEFAULT_EMBEDDING_MODEL = 'paraphrase-multilingual-MiniLM-L12-v2'
+HASHING_DIM = 384
+INITIAL_CAPACITY = 1024
+
+class EmbeddingModelError(RuntimeError):
+    """配置的嵌入模型无法加载"""
+
+class IndexModelMismatch(RuntimeError):
+    """磁盘上的索引由其他模型（或维度）建立，需要显式重建"""
+
+def normalize(matrix):
+    """按行做L2归一化，归一化后的点积即余弦相似度"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+class HashingEmbedder:
+    """把字符1~3-gram哈希到固定维度的向量（桩实现，可离线使用）"""
+
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def encode(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = (text or '').lower()
+            for n in (1, 2, 3):
+                for i in range(len(text) - n + 1):
+                    digest = hashlib.blake2b(text[i:i + n].encode('utf-8'), digest_size=8).digest()
+                    value = int.from_bytes(digest, 'little')
+                    matrix[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        return normalize(matrix)
+
+class SentenceTransformerEmbedder:
+    """sentence-transformers 模型，首次使用时加载"""
+
+    def __init__(self, model_name=DEFAULT_EMBEDDING_MODEL, batch_size=32):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+        self.batch_size = batch_size
+
+    def encode(self, texts):
+        vectors = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+def create_embedder(backend='sentence-transformers', model_name=DEFAULT_EMBEDDING_MODEL):
+    """按配置创建嵌入模型，加载失败时抛出 EmbeddingModelError
+
+    不回退到 hashing：换用其他模型得到的向量与已有索引不兼容
+    """
+    if backend == 'hashing':
+        return HashingEmbedder()
+    try:
+        return SentenceTransformerEmbedder(model_name)
+    except Exception as e:
+        print(f"加载嵌入模型 {model_name} 失败: {e}")
+        raise EmbeddingModelError(
+            f"加载嵌入模型 {model_name} 失败（离线环境可设置 EMBEDDING_BACKEND=hashing）: {e}"
+        ) from e
+
+class VectorIndex:
+    """磁盘上的向量索引
+
+    目录中包含：
+    - vectors.f32：capacity x dim 的 float32 矩阵（内存映射）
+    - ids.i64：每行对应的笔记id，-1 表示已删除的空行
+    - meta.json：维度、模型名、已使用行数、容量
+    多个worker进程共享同一目录：写入时持有排他文件锁，检索时持有共享文件锁，
+    并根据 meta.json 的修改时间重新映射。
+    索引由其他模型建立时抛出 IndexModelMismatch；rebuild=True 时清空并按当前模型重建。
+    """
+
+    def __init__(self, directory, dim, model_name, rebuild=False):
+        self.directory = directory
+        self.dim = dim
+        self.model_name = model_name
+        self.vectors_path = os.path.join(directory, 'vectors.f32')
+        self.ids_path = os.path.join(directory, 'ids.i64')
+        self.meta_path = os.path.join(directory, 'meta.json')
+        self.lock_path = os.path.join(directory, 'index.lock')
+        self._lock = threading.Lock()
+        self._meta_version = None
+        os.makedirs(directory, exist_ok=True)
+
+        with self._lock, self._file_lock():
+            self._load(rebuild)
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        """跨进程锁：写入为排他锁，检索为共享锁"""
+        with open(self.lock_path, 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self):
+        meta = {
+            'dim': self.dim,
+            'model': self.model_name,
+            'count': self.count,
+            'capacity': self.capacity
+        }
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+        self._meta_version = self._stat_meta()
+
+    def _load(self, rebuild=False):
+        """映射磁盘文件；维度或模型不一致时抛出 IndexModelMismatch，rebuild=True 时清空索引"""
+        meta = self._read_meta()
+        if meta is not None and not rebuild and (meta.get('dim') != self.dim or meta.get('model') != self.model_name):
+            raise IndexModelMismatch(
+                f"向量索引由模型 {meta.get('model')}（{meta.get('dim')}维）建立，当前模型为 {self.model_name}"
+                f"（{self.dim}维），请运行 `flask rebuild-vector-index` 重建"
+            )
+        if meta is None or rebuild:
+            self.count = 0
+            self.capacity = INITIAL_CAPACITY
+            self._resize_files(self.capacity)
+            self._map()
+            self._write_meta()
+        else:
+            self.count = meta['count']
+            self.capacity = meta['capacity']
+            self._map()
+            self._meta_version = self._stat_meta()
+
+        ids = np.asarray(self._ids[:self.count])
+        self._rows = {int(note_id): row for row, note_id in enumerate(ids) if note_id >= 0}
+        self._free_rows = [row for row, note_id in enumerate(ids) if note_id < 0]
+
+    def _resize_files(self, capacity):
+        for path, itemsize in ((self.vectors_path, 4 * self.dim), (self.ids_path, 8)):
+            with open(path, 'ab') as f:
+                f.truncate(capacity * itemsize)
+
+    def _map(self):
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(self.capacity, self.dim))
+        self._ids = np.memmap(self.ids_path, dtype=np.int64, mode='r+', shape=(self.capacity,))
+
+    def _stat_meta(self):
+        """meta.json 每次写入都会替换为新文件，用 (inode, 修改时间) 判断是否变化"""
+        try:
+            stat = os.stat(self.meta_path)
+            return (stat.st_ino, stat.st_mtime_ns)
+        except OSError:
+            return None
+
+    def _refresh(self):
+        """其他进程写入后重新映射"""
+        if self._stat_meta() != self._meta_version:
+            self._load()
+
+    def _grow(self, needed):
+        self._vectors.flush()
+        self._ids.flush()
+        self.capacity = max(self.capacity * 2, needed)
+        self._resize_files(self.capacity)
+        self._map()
+
+    def upsert(self, ids, vectors):
+        """写入或覆盖笔记的向量"""
+        vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim))
+        with self._lock, self._file_lock():
+            self._refresh()
+            for note_id, vector in zip(ids, vectors):
+                note_id = int(note_id)
+                row = self._rows.get(note_id)
+                if row is None:
+                    if self._free_rows:
+                        row = self._free_rows.pop()
+                    else:
+                        if self.count >= self.capacity:
+                            self._grow(self.count + 1)
+                        row = self.count
+                        self.count += 1
+                    self._ids[row] = note_id
+                    self._rows[note_id] = row
+                self._vectors[row] = vector
+            self._vectors.flush()
+            self._ids.flush()
+            self._write_meta()
+
+    def remove(self, ids):
+        """删除笔记的向量（行标记为空，之后复用）"""
+        with self._lock, self._file_lock():
+            self._refresh()
+            for note_id in ids:
+                row = self._rows.pop(int(note_id), None)
+                if row is not None:
+                    self._ids[row] = -1
+                    self._vectors[row] = 0
+                    self._free_rows.append(row)
+            self._ids.flush()
+            self._write_meta()
+
+    def clear(self):
+        """清空索引"""
+        with self._lock, self._file_lock():
+            self.count = 0
+            self._rows = {}
+            self._free_rows = []
+            self._write_meta()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def search(self, vector, k=10):
+        """返回与查询向量最相似的 k 个 (笔记id, 余弦相似度)"""
+        with self._lock, self._file_lock(shared=True):
+            self._refresh()
+            if not self._rows:
+                return []
+
+            query = normalize(np.asarray(vector, dtype=np.float32).reshape(1, self.dim))[0]
+            ids = np.asarray(self._ids[:self.count])
+            scores = self._vectors[:self.count] @ query
+            scores[ids < 0] = -np.inf
+
+            k = min(k, len(self._rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(ids[row]), float(scores[row])) for row in top]
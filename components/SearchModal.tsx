@@ -12,9 +12,15 @@ interface Note {
   updated_at: string;
 }
 
+// 搜索结果默认不返回正文，只返回摘要片段
+interface SearchResultNote extends Omit<Note, 'content'> {
+  content?: string;
+  snippet?: string;
+}
+
 interface SearchResult {
   success: boolean;
-  data: Note[];
+  data: SearchResultNote[];
   total: number;
   search_type: string;
 }
@@ -27,7 +33,7 @@ interface SearchModalProps {
 
 const SearchModal: React.FC<SearchModalProps> = ({ isOpen, onClose, onSelectNote }) => {
   const [query, setQuery] = useState('');
-  const [results, setResults] = useState<Note[]>([]);
+  const [results, setResults] = useState<SearchResultNote[]>([]);
   const [loading, setLoading] = useState(false);
   const [hasSearched, setHasSearched] = useState(false);
 
@@ -42,7 +48,8 @@ const SearchModal: React.FC<SearchModalProps> = ({ isOpen, onClose, onSelectNote
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ query: query.trim() }),
+        // 高亮由前端处理，不需要后端插入标记
+        body: JSON.stringify({ query: query.trim(), highlight_tags: ['', ''] }),
       });
 
       if (response.ok) {
@@ -120,9 +127,21 @@ const SearchModal: React.FC<SearchModalProps> = ({ isOpen, onClose, onSelectNote
     onClose();
   };
 
-  // 选择笔记
-  const handleSelectNote = (note: Note) => {
-    onSelectNote(note);
+  // 选择笔记（搜索结果不含正文，选中时再加载完整笔记）
+  const handleSelectNote = async (note: SearchResultNote) => {
+    let fullNote = { ...note, content: note.content ?? '' } as Note;
+    if (note.content === undefined) {
+      try {
+        const response = await fetch(`http://localhost:5001/api/notes/${note.id}`);
+        const data = await response.json();
+        if (data.success) {
+          fullNote = data.data;
+        }
+      } catch (error) {
+        console.error('加载笔记失败:', error);
+      }
+    }
+    onSelectNote(fullNote);
     handleClose();
   };
 
@@ -204,7 +223,7 @@ const SearchModal: React.FC<SearchModalProps> = ({ isOpen, onClose, onSelectNote
                     </div>
                     
                     <p className="text-white/70 text-sm mb-3 line-clamp-3">
-                      {highlightText(getContentPreview(note.content), query)}
+                      {highlightText(note.snippet ?? getContentPreview(note.content ?? ''), query)}
                     </p>
                     
                     <div className="flex items-center justify-between text-xs text-white/50">